@@ -1,13 +1,19 @@
 import streamlit as st
+import collections
 import json
 import time
 import os
-import base64
 import socket
-import io
+import threading
+import queue
 from cryptography.fernet import Fernet
-from PIL import Image
 from streamlit_js_eval import get_geolocation
+import protocol
+from media_store import seal_blob
+from chunk_store import transfer_id_of
+from discovery import MuleDirectory
+from priority import LEVELS, classify_text
+from payload_codec import PROFILES, DEFAULT_PROFILE, encode_image, encode_voice, pack_envelope
 
 # --- SETUP CRYPTO ---
 if not os.path.exists("secret.key"):
@@ -20,27 +26,149 @@ with open("secret.key", "rb") as key_file:
 
 # --- CONFIG ---
 UDP_PORT = 5005
+PIPELINE_WINDOW = 32 # Packets in flight before waiting for ACKs
+CHUNK_THRESHOLD = 64 * 1024 # Larger packets go in resumable chunks
+CHUNK_SIZE = 16 * 1024
+REJECTED_FILE = "rejected_packets.json" # Packets the Mule refused, kept (not deleted) for the survivor to see
+RETRY_REASONS = {b"bad chunk"} # NACKs that only refuse one chunk: the packet stays queued and resumes
+MAIL_FILE = "local_mail.json" # Orders already fetched and the mail cursor, per receiver ID
 
 # --- HELPER: FIND MULE ---
-def find_mule(role_needed):
-    """Scans for a Mule broadcasting the specific role"""
-    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.settimeout(3)
+@st.cache_resource
+def mule_directory():
+    """One background beacon listener per app process (see discovery.py)."""
+    return MuleDirectory(UDP_PORT).start()
+
+def find_mule(role_needed, wait=3):
+    """Best nearby Mule for the role from the beacon table. Only waits if no
+    Mule has been heard yet (e.g. right after start)."""
+    return mule_directory().best(role_needed, wait=wait)
+
+# --- HELPER: CHUNKED (RESUMABLE) PACKET ---
+def send_chunked(s, seq, body, replies, stats, chunk_size=CHUNK_SIZE):
+    """Sends a large packet in checksummed chunks, skipping the ones the Mule
+    kept from an earlier, interrupted contact."""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    protocol.send_frame(s, protocol.CHUNK_BEGIN, seq, protocol.dumps(
+        {"transfer_id": transfer_id_of(body), "size": len(body), "chunks": len(chunks)}))
+    try:
+        have = replies.get(timeout=15)
+    except queue.Empty:
+        raise protocol.ProtocolError("no resume reply from mule")
+    if have is None: return # Rejected (NACK) or the session broke
+    have = set(have)
+    for i, data in enumerate(chunks):
+        if i in have:
+            stats["resumed"] += len(data)
+            continue
+        protocol.send_frame(s, protocol.CHUNK, seq, protocol.pack_chunk(i, data))
+        stats["bytes"] += len(data)
+
+# --- HELPER: PIPELINED UPLOAD SESSION ---
+def upload_session(ip, port, lines, acked, rejected, stats, window=PIPELINE_WINDOW):
+    """Streams every pending packet over one TCP session while a reader thread
+    collects ACKs, keeping up to `window` packets in flight (1 = stop-and-wait).
+    Updates `acked` / `rejected` ({index: NACK reason}) / `stats` in place, so a
+    reconnect resumes from the first unacknowledged packet."""
+    pending = [i for i in range(len(lines)) if i not in acked and i not in rejected]
+    if not pending: return
+    credits = threading.Semaphore(window)
+    failure = []
+    replies = {idx: queue.Queue() for idx in pending} # CHUNK_HAVE replies per chunked packet
+    s = socket.create_connection((ip, port), timeout=15)
+
+    def collect_acks():
         try:
-            s.bind(('', UDP_PORT))
-        except: return None, None # Port busy
+            answered = set()
+            while len(answered) < len(pending):
+                reply = protocol.recv_frame(s)
+                if reply is None: raise protocol.ProtocolError("mule closed the session")
+                ftype, seq, body = reply
+                if ftype == protocol.CHUNK_HAVE:
+                    replies[seq].put(protocol.loads(body)["have"])
+                    continue
+                if ftype == protocol.ACK: acked.add(seq)
+                elif ftype == protocol.NACK:
+                    rejected[seq] = body
+                    if seq in replies: replies[seq].put(None)
+                if seq in answered: continue
+                answered.add(seq)
+                credits.release()
+        except Exception as e:
+            failure.append(e)
+            credits.release() # Wake the sender so it can stop
+            for q in replies.values(): q.put(None)
+            try: s.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
 
-        start_t = time.time()
-        while time.time() - start_t < 3:
-            try:
-                msg, addr = s.recvfrom(1024)
-                data = json.loads(msg.decode())
-                # Match the specific role (uplink or reply)
-                if data.get('role') == role_needed:
-                    return data.get('ip'), data.get('port')
-            except: pass
-    return None, None
+    reader = threading.Thread(target=collect_acks, daemon=True)
+    reader.start()
+    try:
+        for idx in pending:
+            credits.acquire()
+            if failure: break
+            body = lines[idx].strip().encode('utf-8')
+            if len(body) > CHUNK_THRESHOLD:
+                send_chunked(s, idx, body, replies[idx], stats)
+                continue
+            protocol.send_frame(s, protocol.PACKET, idx, body)
+            stats["bytes"] += len(body)
+        reader.join()
+        if not failure: protocol.send_frame(s, protocol.BYE)
+    finally:
+        s.close()
+    if failure: raise failure[0]
+
+# --- HELPER: MAILBOX (INCREMENTAL FETCH + RECEIPTS) ---
+def load_mailbox(receiver):
+    try:
+        with open(MAIL_FILE) as f: return json.load(f).get(receiver, {"orders": [], "cursor": None})
+    except (OSError, ValueError): return {"orders": [], "cursor": None}
+
+def save_mailbox(receiver, box):
+    try:
+        with open(MAIL_FILE) as f: boxes = json.load(f)
+    except (OSError, ValueError): boxes = {}
+    boxes[receiver] = box
+    with open(MAIL_FILE + ".tmp", "w") as f: json.dump(boxes, f)
+    os.replace(MAIL_FILE + ".tmp", MAIL_FILE)
+
+def open_order(o):
+    """The order's content, or None if this phone's key cannot open it."""
+    try: return json.loads(cipher_suite.decrypt(o['secure_content'].encode()).decode())
+    except Exception: return None
+
+def check_mail(ip, port, receiver):
+    """Fetches the orders that reached the Mule since the last check, saves the
+    ones this phone can decrypt, then confirms those with a RECEIPT so the Mule
+    (and the cloud) can drop them. Orders that do not open (corrupted, or for
+    another phone using the same Receiver ID) stay in the bag.
+    Returns (new orders, unreadable count, mailbox)."""
+    box = load_mailbox(receiver)
+    known = {o.get(k) for o in box["orders"] for k in ('order_id', 'secure_content')} - {None}
+    with socket.create_connection((ip, port), timeout=15) as s:
+        protocol.send_frame(s, protocol.MAIL_REQ, 0, protocol.dumps({"target_id": receiver, "since": box["cursor"]}))
+        reply = protocol.recv_frame(s)
+        if not reply or reply[0] != protocol.MAIL:
+            raise protocol.ProtocolError("no mail frame")
+        mail = protocol.loads(reply[2])
+        if isinstance(mail, list): mail = {"orders": mail, "cursor": None} # Older Mule: full list, no receipts
+        opened = [o for o in mail["orders"] if open_order(o) is not None]
+        new = [o for o in opened if not {o.get('order_id'), o.get('secure_content')} & known]
+        box = {"orders": box["orders"] + new, "cursor": mail["cursor"] or box["cursor"]}
+        save_mailbox(receiver, box) # Stored before confirming: a lost receipt only means a re-send
+        # Confirm what opened, repeats too (this Mule may still hold a copy)
+        delivered = [o['order_id'] for o in opened if o.get('order_id')]
+        if mail["cursor"] and delivered:
+            protocol.send_frame(s, protocol.RECEIPT, 1, protocol.dumps({"target_id": receiver, "order_ids": delivered}))
+            protocol.recv_frame(s) # ACK
+        protocol.send_frame(s, protocol.BYE)
+    return new, len(mail["orders"]) - len(opened), box
+
+def show_order(o):
+    content = open_order(o)
+    if content is None: st.error("⚠️ Decryption Failed")
+    else: st.info(f"**HQ:** {content.get('msg')}")
 
 # --- UI SETUP ---
 st.set_page_config(page_title="ResilientRoute", page_icon="📡", layout="centered", initial_sidebar_state="collapsed")
@@ -62,6 +190,11 @@ c1, c2 = st.columns([1, 2])
 with c1:
     st.caption("SYSTEM STATUS")
     st.markdown('<span class="status-badge badge-ok">🛡️ SECURE</span>', unsafe_allow_html=True)
+    nearby = mule_directory().mules("mule_uplink")
+    if mule_directory().error:
+        st.markdown('<span class="status-badge badge-warn">⚠️ BEACON PORT BUSY</span>', unsafe_allow_html=True)
+    else:
+        st.caption(f"🛰️ {len(nearby)} Mule(s) in range")
 with c2:
     st.caption("GEOLOCATION")
     loc = get_geolocation()
@@ -84,32 +217,39 @@ with tab1:
         c1, c2 = st.columns(2)
         audio_val = c1.audio_input("🎙️ Record Voice")
         img_val = c2.file_uploader("📷 Attach Photo", type=['png', 'jpg'])
+        profile = st.selectbox("📶 Link Profile", list(PROFILES), index=list(PROFILES).index(DEFAULT_PROFILE),
+                               help="Smaller media for slower links: wifi > bluetooth > lora")
+        severity_choice = st.selectbox("🚨 Severity", ["auto"] + list(LEVELS),
+                                       help="Sent unencrypted so Mules can upload urgent reports first. 'auto' reads your report text on this device.")
         
         if st.form_submit_button("💾 SAVE ENCRYPTED PACKET"):
-            # Prepare Media
-            audio_str = base64.b64encode(audio_val.read()).decode() if audio_val else None
-            img_str = None
+            severity = classify_text(msg_text) if severity_choice == "auto" else severity_choice
+            # Prepare Media: compact per link profile, then one encrypted, content-addressed blob each
+            blobs = []
+            if audio_val:
+                voice = encode_voice(audio_val.read(), profile)
+                blobs.append(seal_blob(cipher_suite, pack_envelope("audio", voice), "audio"))
             if img_val:
-                img = Image.open(img_val).convert("RGB")
-                img.thumbnail((800, 800))
-                buf = io.BytesIO()
-                img.save(buf, format='JPEG')
-                img_str = base64.b64encode(buf.getvalue()).decode()
+                photo = encode_image(img_val, profile)
+                blobs.append(seal_blob(cipher_suite, pack_envelope("image", photo), "image"))
 
-            # Encrypt
-            payload = json.dumps({"text": msg_text, "audio": audio_str, "image": img_str})
-            secure_payload = cipher_suite.encrypt(payload.encode()).decode()
+            # Encrypt (compressed binary envelope; the report only references its media by hash)
+            payload = json.dumps({"text": msg_text, "media": {b["kind"]: b["blob_id"] for b in blobs}})
+            secure_payload = cipher_suite.encrypt(pack_envelope("report", payload.encode())).decode()
 
-            # Save
+            # Save (blobs first, so HQ never sees a report before its media can exist)
             packet = {
                 "id": name, "type": "sos", "location": [lat, lon],
                 "timestamp": time.time(), "secure_content": secure_payload
             }
+            for p in blobs + [packet]: p["severity"] = severity # Media travels as urgently as its report
+            lines = [json.dumps(b) + "\n" for b in blobs] + [json.dumps(packet) + "\n"]
             with open("local_storage.json", "a") as f:
-                f.write(json.dumps(packet) + "\n")
-            st.toast("Packet Encrypted & Saved!", icon="🔒")
+                f.writelines(lines)
+            st.toast(f"Packet Encrypted & Saved! ({sum(len(l) for l in lines) / 1024:.1f} KB · {severity})", icon="🔒")
 
     st.write("#### 📡 Uplink Control")
+    pipelined = st.toggle("⚡ Pipelined upload", value=True, help="Stream all packets over one connection. Turn off for stop-and-wait on very lossy links.")
     if st.button("🚀 BROADCAST SIGNAL (UPLOAD)", type="primary"):
         if not os.path.exists("local_storage.json"):
             st.warning("⚠️ No reports to send.")
@@ -122,40 +262,56 @@ with tab1:
                     st.write(f"✅ Found Mule at {ip}:{port}")
                     
                     try:
-                        with open("local_storage.json", "r") as f:
-                            lines = f.readlines()
+                        stats = {"bytes": 0, "resumed": 0}
+                        delivered, failed, total = 0, 0, None
+                        reasons = collections.Counter()
+                        attempts = 0
+                        t0 = time.time()
                         
-                        success_count = 0
-                        total = len(lines)
-                        
-                        # --- RETRY LOGIC WITH EXTENDED TIMEOUT ---
-                        for idx, line in enumerate(lines):
-                            sent = False
-                            attempts = 0
-                            while not sent and attempts < 3:
-                                try:
-                                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                                    s.settimeout(15) # <--- INCREASED TO 15 SECONDS
-                                    s.connect((ip, port))
-                                    s.sendall(line.encode('utf-8'))
-                                    
-                                    # Wait for ACK
-                                    resp = s.recv(1024)
-                                    if b"ACK" in resp:
-                                        sent = True
-                                        success_count += 1
-                                    s.close()
-                                except:
-                                    attempts += 1
-                                    time.sleep(2) # <--- Wait longer between retries
+                        # --- RESUMABLE SESSIONS: each reconnect starts at the first un-ACKed packet ---
+                        while attempts < 3:
+                            if not os.path.exists("local_storage.json"): break
+                            with open("local_storage.json", "r") as f:
+                                lines = [l for l in f.readlines() if l.strip()]
+                            if total is None: total = len(lines)
+                            if not lines: break
                             
-                            if not sent:
-                                st.write(f"⚠️ Packet {idx+1} failed after 3 retries.")
+                            acked, rejected = set(), {}
+                            try:
+                                upload_session(ip, port, lines, acked, rejected, stats,
+                                               window=PIPELINE_WINDOW if pipelined else 1)
+                            except (OSError, protocol.ProtocolError):
+                                attempts += 1
+                                time.sleep(0.5)
+                            finally:
+                                # Checkpoint progress so nothing ACKed is ever re-sent
+                                refused = {i: r for i, r in rejected.items() if i not in acked and r not in RETRY_REASONS}
+                                if len(refused) < len(rejected): attempts += 1 # Bad chunk: resend, but not forever
+                                remaining = [l for i, l in enumerate(lines) if i not in acked and i not in refused]
+                                if remaining:
+                                    with open("local_storage.json", "w") as f: f.writelines(remaining)
+                                else:
+                                    os.remove("local_storage.json")
+                                if refused: # Never silently lose an SOS: set aside, with the Mule's reason
+                                    with open(REJECTED_FILE, "a") as f: f.writelines(lines[i] for i in refused)
+                                delivered += len(acked)
+                                failed += len(refused)
+                                reasons.update(r.decode(errors="replace") for r in refused.values())
+                        
+                        elapsed = max(time.time() - t0, 1e-6)
+                        st.write(f"📶 Throughput: {delivered / elapsed:.1f} packets/s · {stats['bytes'] / 1024 / elapsed:.1f} KB/s ({elapsed:.1f}s)")
+                        if stats["resumed"]:
+                            st.write(f"♻️ Resumed {stats['resumed'] / 1024:.1f} KB already held by the Mule.")
+                        if failed:
+                            st.write(f"⚠️ {failed} packet(s) rejected by Mule ("
+                                     + ", ".join(f"{n} {r}" for r, n in reasons.most_common())
+                                     + f"). Kept in `{REJECTED_FILE}`" + (": try a smaller link profile." if "packet too large" in reasons else "."))
+                        if delivered < (total or 0) - failed:
+                            st.write(f"⚠️ {(total or 0) - failed - delivered} packet(s) still queued, will resume next time.")
 
-                        if success_count > 0:
-                            status.update(label=f"✅ Upload Complete ({success_count}/{total})!", state="complete")
+                        if delivered:
+                            status.update(label=f"✅ Upload Complete ({delivered}/{total})!", state="complete")
                             st.balloons()
-                            os.remove("local_storage.json")
                         else:
                             status.update(label="❌ Transfer Failed (Mule busy)", state="error")
                     except Exception as e:
@@ -177,39 +333,28 @@ with tab2:
         if ip:
             try:
                 # --- RETRY LOGIC FOR MAIL ---
-                data = b""
+                orders = None
                 attempts = 0
-                connected = False
                 
-                while not connected and attempts < 3:
+                while orders is None and attempts < 3:
                     try:
-                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        s.settimeout(15) # <--- INCREASED TO 15 SECONDS
-                        s.connect((ip, port))
-                        s.sendall(f"GET_MAIL:{mail_id}".encode())
-                        
-                        while True:
-                            chunk = s.recv(4096)
-                            if not chunk: break
-                            data += chunk
-                        s.close()
-                        connected = True
-                    except:
+                        orders, unreadable, box = check_mail(ip, port, mail_id)
+                    except (OSError, protocol.ProtocolError):
                         attempts += 1
                         time.sleep(2)
 
-                if data:
-                    orders = json.loads(data.decode())
+                if orders is not None:
                     if orders:
                         st.success(f"📨 {len(orders)} New Orders!")
-                        for o in orders:
-                            try:
-                                decrypted = cipher_suite.decrypt(o['secure_content'].encode()).decode()
-                                content = json.loads(decrypted)
-                                st.info(f"**HQ:** {content.get('msg')}")
-                            except: st.error("⚠️ Decryption Failed")
+                        for o in orders: show_order(o)
                     else:
-                        st.info("📭 No mail found.")
+                        st.info("📭 No new mail.")
+                    if unreadable:
+                        st.warning(f"⚠️ {unreadable} order(s) for '{mail_id}' could not be decrypted on this phone. Left with the Mule.")
+                    earlier = box["orders"][:len(box["orders"]) - len(orders)]
+                    if earlier:
+                        with st.expander(f"🗂️ Earlier orders ({len(earlier)})"):
+                            for o in reversed(earlier): show_order(o)
                 else:
                     st.error("❌ Failed to connect to Mule.")
             except Exception as e:
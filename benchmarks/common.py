@@ -0,0 +1,35 @@
+"""Small helpers shared by the benchmark scripts."""
+import json
+import math
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values` (p in 0..100)."""
+    if not values: return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(latencies):
+    """p50 / p99 / max in milliseconds."""
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def print_table(rows, columns):
+    """Prints a list of dicts as a fixed-width table."""
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    print("  ".join("-" * widths[c] for c in columns))
+    for r in rows:
+        print("  ".join(str(r.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def write_json(path, results):
+    if not path: return
+    with open(path, "w") as f: json.dump(results, f, indent=2)
+    print(f"📝 Results written to {path}")
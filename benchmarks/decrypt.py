@@ -0,0 +1,98 @@
+"""HQ report decryption: the old per-report loop vs the DecryptStage pool.
+
+    python -m benchmarks.decrypt --reports 2000 --legacy 0.3 --corrupt 0.01
+
+Builds a mix of current reports (binary envelope, media as blob refs) and
+legacy ones (base64 photo + voice note inside the Fernet JSON), with a share of
+tampered tokens, then decrypts them the way dashboard.process_points used to
+(one at a time, failures dropped with `continue`) and with DecryptStage at
+several worker counts. Prints reports/s, the bytes of decoded reports handed
+back to the dashboard and the failures each path accounted for.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import time
+
+from cryptography.fernet import Fernet
+
+from decrypt_stage import DecryptStage
+from payload_codec import open_envelope, pack_envelope
+from benchmarks.common import print_table, write_json
+
+
+def make_reports(cipher, n, legacy_share, corrupt_share, seed=0):
+    rng = random.Random(seed)
+    photo, voice = base64.b64encode(os.urandom(60_000)).decode(), base64.b64encode(os.urandom(90_000)).decode()
+    tokens = []
+    for i in range(n):
+        text = f"Survivor {i}: trapped on roof, water rising, two injured."
+        if rng.random() < legacy_share:
+            token = cipher.encrypt(json.dumps({"text": text, "image": photo, "audio": voice}).encode()).decode()
+        else:
+            doc = {"text": text, "media": {"image": f"{i:064x}"}}
+            token = cipher.encrypt(pack_envelope("report", json.dumps(doc).encode())).decode()
+        if rng.random() < corrupt_share: # Flip a character in the ciphertext: HMAC check fails
+            j = len(token) // 2
+            token = token[:j] + ("A" if token[j] != "A" else "B") + token[j + 1:]
+        tokens.append(token)
+    return tokens
+
+
+def result_bytes(docs):
+    return sum(len(json.dumps(d)) for d in docs if d is not None)
+
+
+def sequential(cipher, tokens):
+    """The loop dashboard.process_points ran before DecryptStage."""
+    docs = []
+    t0 = time.perf_counter()
+    for enc in tokens:
+        try:
+            dec = json.loads(open_envelope(cipher.decrypt(enc.encode())).decode())
+        except Exception as e_crypto:
+            continue
+        docs.append(dec)
+    elapsed = time.perf_counter() - t0
+    return {"path": "sequential loop", "workers": 1, "seconds": round(elapsed, 3),
+            "reports_per_s": round(len(tokens) / elapsed), "result_mb": round(result_bytes(docs) / 2**20, 2),
+            "decoded": len(docs), "failures_reported": 0}
+
+
+def staged(key, tokens, workers, batch_size):
+    stage = DecryptStage(key, workers=workers, batch_size=batch_size)
+    stage.run(tokens[:batch_size * max(2, workers)]) # Start the pool outside the timing
+    stage.stats["failed"].clear()
+    t0 = time.perf_counter()
+    docs = stage.run(tokens)
+    elapsed = time.perf_counter() - t0
+    stage.close()
+    return {"path": "DecryptStage", "workers": workers, "seconds": round(elapsed, 3),
+            "reports_per_s": round(len(tokens) / elapsed), "result_mb": round(result_bytes(docs) / 2**20, 2),
+            "decoded": sum(d is not None for d in docs), "failures_reported": sum(stage.stats["failed"].values())}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--reports", type=int, default=2000)
+    ap.add_argument("--legacy", type=float, default=0.3, help="Share of legacy reports with inline media")
+    ap.add_argument("--corrupt", type=float, default=0.01, help="Share of tampered tokens")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--batch", type=int, default=16)
+    ap.add_argument("--json", help="Write results to this file")
+    args = ap.parse_args()
+
+    key = Fernet.generate_key()
+    cipher = Fernet(key)
+    tokens = make_reports(cipher, args.reports, args.legacy, args.corrupt)
+    rows = [sequential(cipher, tokens)] + [staged(key, tokens, w, args.batch) for w in args.workers]
+
+    print(f"🔓 {args.reports} reports ({args.legacy:.0%} legacy, {args.corrupt:.0%} tampered) on {os.cpu_count()} CPUs")
+    print_table(rows, ["path", "workers", "seconds", "reports_per_s", "result_mb", "decoded", "failures_reported"])
+    write_json(args.json, {"benchmark": "decrypt", "config": vars(args), "cpus": os.cpu_count(), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""End-to-end loop benchmark: survivor -> mule -> cloud -> HQ -> mule -> survivor.
+
+    python -m benchmarks.e2e --survivors 2000 --concurrency 64 --json e2e.json
+
+Runs the real mule (uplink + reply servers and cloud_sync) in this process
+against a local Qdrant stand-in (QDRANT_LOCATION: ":memory:", or a directory
+with --qdrant-path), so no network or server is needed. An HQ stand-in polls
+the uploaded reports by synced_at, like the dashboard, and answers the first
+report of every survivor with an encrypted order in the courier bag.
+
+Simulated survivors (--concurrency threads) upload Fernet-encrypted SOS packets
+over the framed protocol, as app.py does, then poll the reply port for mail
+(framed MAIL_REQ with a since-cursor, confirming what arrived with a RECEIPT,
+or the legacy "GET_MAIL:" line with --legacy-mail) until their order arrives
+or --timeout runs out.
+
+Reported (and written with --json, for tracking regressions):
+    packets_per_s   ACKed packets per second over the upload phase
+    ack_ms          packet sent -> ACK received
+    mail_ms         one mail request -> its answer
+    loop_s          ACK of a survivor's first packet -> its order delivered
+    sync_lag_s      ACK -> packet stored in Qdrant (its synced_at)
+    storage         mule bytes on disk (log, dedup index, inbox, state)
+    orders_left_*   delivered orders still in the mule's bag / the cloud's
+                    courier bag once the receipts have synced (0 unless legacy)
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet
+
+import protocol
+from payload_codec import pack_envelope
+from priority import LEVELS
+from benchmarks.common import latency_summary, percentile, print_table, write_json
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(root, name))
+            except OSError: pass
+    return total
+
+
+def seconds_summary(values):
+    return {"p50_s": round(percentile(values, 50), 3), "p99_s": round(percentile(values, 99), 3),
+            "max_s": round(max(values), 3) if values else 0.0}
+
+
+class Survivor:
+    def __init__(self, idx, cipher, packets, rng):
+        self.id = f"E2E-{idx:05d}"
+        self.location = [28.61 + rng.uniform(-0.2, 0.2), 77.20 + rng.uniform(-0.2, 0.2)]
+        self.packets = []
+        for n in range(packets):
+            report = json.dumps({"text": f"{self.id} report {n}: trapped, water rising", "media": {}})
+            self.packets.append({"id": self.id, "type": "sos", "location": self.location,
+                                 "timestamp": time.time() + idx * 1e-6 + n * 1e-3,
+                                 "secure_content": cipher.encrypt(pack_envelope("report", report.encode())).decode(),
+                                 "severity": rng.choice(list(LEVELS))})
+        self.acked = {}      # packet timestamp -> ACK time
+        self.first_ack = None
+        self.delivered = None
+        self.cursor = None   # From the last MAIL reply
+
+    def upload(self, port, ack_latencies):
+        """One framed session, stop-and-wait: every packet waits for its ACK."""
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=30) as s:
+                for seq, packet in enumerate(self.packets):
+                    t0 = time.perf_counter()
+                    protocol.send_frame(s, protocol.PACKET, seq, json.dumps(packet).encode())
+                    reply = protocol.recv_frame(s)
+                    if not reply or reply[0] != protocol.ACK: return
+                    ack_latencies.append(time.perf_counter() - t0)
+                    self.acked[packet["timestamp"]] = time.time()
+                    if self.first_ack is None: self.first_ack = time.time()
+                protocol.send_frame(s, protocol.BYE)
+        except (OSError, protocol.ProtocolError):
+            pass
+
+    def check_mail(self, port, legacy, mail_latencies):
+        t0 = time.perf_counter()
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=30) as s:
+                if legacy:
+                    s.sendall(f"GET_MAIL:{self.id}".encode())
+                    s.shutdown(socket.SHUT_WR)
+                    data = b""
+                    while True:
+                        chunk = s.recv(65536)
+                        if not chunk: break
+                        data += chunk
+                    mail = json.loads(data or b"[]")
+                else:
+                    protocol.send_frame(s, protocol.MAIL_REQ, 0, protocol.dumps({"target_id": self.id, "since": self.cursor}))
+                    reply = protocol.recv_frame(s)
+                    if not reply or reply[0] != protocol.MAIL: return
+                    answer = protocol.loads(reply[2])
+                    mail, self.cursor = answer["orders"], answer["cursor"]
+                    if mail:
+                        protocol.send_frame(s, protocol.RECEIPT, 1, protocol.dumps(
+                            {"target_id": self.id, "order_ids": [o["order_id"] for o in mail]}))
+                        protocol.recv_frame(s)
+                    protocol.send_frame(s, protocol.BYE)
+        except (OSError, ValueError, protocol.ProtocolError):
+            return
+        mail_latencies.append(time.perf_counter() - t0)
+        if mail and self.delivered is None: self.delivered = time.time()
+
+
+class HQ(threading.Thread):
+    """Dashboard stand-in: ingests new reports by synced_at and replies once per survivor."""
+    def __init__(self, mule, cipher, interval):
+        super().__init__(daemon=True)
+        self.mule, self.cipher, self.interval = mule, cipher, interval
+        self.synced = {}   # (survivor id, timestamp) -> synced_at
+        self.answered = set()
+        self.left = None   # Orders still in the courier bag at the end
+        self.order_ids = itertools.count(1)
+        self.stop = threading.Event()
+
+    def setup(self, client):
+        from qdrant_client.http import models
+        self.models = models
+        client.create_collection(self.mule.DOWNLINK_COLLECTION,
+                                 vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE))
+        client.create_payload_index(self.mule.DOWNLINK_COLLECTION, field_name="timestamp",
+                                    field_schema=models.PayloadSchemaType.FLOAT)
+
+    def run(self):
+        client, models, cursor = self.mule.get_client(), self.models, 0.0
+        while not self.stop.wait(self.interval):
+            if not client.collection_exists(self.mule.UPLINK_COLLECTION): continue
+            # Overlap: batches upload in parallel, so synced_at is not strictly in arrival order
+            flt = models.Filter(must=[models.FieldCondition(key="synced_at", range=models.Range(gte=cursor - 5))]) if cursor else None
+            orders, offset = [], None
+            while True:
+                page, offset = client.scroll(self.mule.UPLINK_COLLECTION, scroll_filter=flt, limit=512, offset=offset,
+                                             with_payload=True, with_vectors=False)
+                for p in page:
+                    key = (p.payload.get("id"), p.payload.get("timestamp"))
+                    if key in self.synced: continue
+                    self.synced[key] = p.payload["synced_at"]
+                    cursor = max(cursor, p.payload["synced_at"])
+                    if key[0] in self.answered: continue
+                    self.answered.add(key[0])
+                    order = json.dumps({"target_id": key[0], "msg": "Team en route", "timestamp": time.time()})
+                    orders.append(models.PointStruct(id=next(self.order_ids), vector=[0.0] * 384, payload={
+                        "secure_content": self.cipher.encrypt(order.encode()).decode(), "target_id": key[0],
+                        "timestamp": time.time()}))
+                if offset is None: break
+            if orders: client.upsert(self.mule.DOWNLINK_COLLECTION, points=orders)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--survivors", type=int, default=2000)
+    ap.add_argument("--packets", type=int, default=1, help="Packets per survivor")
+    ap.add_argument("--concurrency", type=int, default=64, help="Survivor sessions at once")
+    ap.add_argument("--sync-interval", type=float, default=0.5, help="Mule sync cycle (MULE_SYNC_INTERVAL_S)")
+    ap.add_argument("--hq-interval", type=float, default=1.0, help="HQ ingest poll period")
+    ap.add_argument("--poll-interval", type=float, default=1.0, help="Survivor mail poll period")
+    ap.add_argument("--timeout", type=float, default=120, help="Give up on undelivered mail after this")
+    ap.add_argument("--legacy-mail", action="store_true", help='Ask for mail with the legacy "GET_MAIL:" line')
+    ap.add_argument("--qdrant-path", help="Local Qdrant directory instead of :memory:")
+    ap.add_argument("--fsync", action="store_true", help="fsync every packet (mule default)")
+    ap.add_argument("--verbose", action="store_true", help="Show the mule's own log lines")
+    ap.add_argument("--json", help="Write results to this file")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mule-e2e-")
+    os.environ.update({
+        "QDRANT_LOCATION": args.qdrant_path or ":memory:",
+        "MULE_SYNC_INTERVAL_S": str(args.sync_interval),
+        "MULE_DOWNLINK_INTERVAL_S": str(args.sync_interval),
+        "MULE_MAX_CONNECTIONS": str(max(64, args.concurrency)),
+        "MULE_LOG_FSYNC": "1" if args.fsync else "0",
+        "MULE_GOSSIP": "0",
+    })
+    warnings.filterwarnings("ignore", message="Payload indexes have no effect") # Local mode scans instead
+    console = sys.stdout
+    quiet = contextlib.redirect_stdout(console if args.verbose else open(os.devnull, "w"))
+    with quiet:
+        import mule # Reads its config from the environment at import time
+        from chunk_store import PartialStore
+        from dedup import DigestIndex
+        mule.LOG = mule.open_log(os.path.join(workdir, "mule_log"))
+        mule.PARTIALS = PartialStore(os.path.join(workdir, "mule_partials"))
+        mule.DEDUP = DigestIndex(os.path.join(workdir, "mule_dedup"))
+        mule.RECEIPTS = mule.ReceiptBook(os.path.join(workdir, "mule_receipts.json"))
+        mule.INBOX = mule.InboxIndex(os.path.join(workdir, "mule_inbox.json"), delivered=mule.RECEIPTS)
+        mule.STATE_FILE = os.path.join(workdir, "mule_state.json")
+
+        cipher = Fernet(Fernet.generate_key())
+        hq = HQ(mule, cipher, args.hq_interval)
+        hq.setup(mule.get_client())
+        up_port, reply_port = free_port(), free_port()
+        for port, handler in ((up_port, mule.handle_uplink), (reply_port, mule.handle_reply)):
+            ready = threading.Event()
+            threading.Thread(target=lambda p=port, h=handler, r=ready: mule.asyncio.run(mule.serve(p, h, '127.0.0.1', r)),
+                             daemon=True).start()
+            ready.wait()
+        threading.Thread(target=mule.cloud_sync, daemon=True).start()
+        hq.start()
+
+        rng = random.Random(0)
+        survivors = [Survivor(i, cipher, args.packets, rng) for i in range(args.survivors)]
+        storage_start = dir_bytes(workdir)
+
+        # 1. Uplink: every survivor uploads its packets
+        ack_latencies = []
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda s: s.upload(up_port, ack_latencies), survivors))
+        upload_s = time.perf_counter() - t0
+        acked = sum(len(s.acked) for s in survivors)
+        storage_acked = dir_bytes(workdir)
+
+        # 2. Downlink: poll until every survivor that got through has its order
+        mail_latencies = []
+        deadline = time.time() + args.timeout
+        pending = [s for s in survivors if s.first_ack]
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            while pending and time.time() < deadline:
+                list(pool.map(lambda s: s.check_mail(reply_port, args.legacy_mail, mail_latencies), pending))
+                pending = [s for s in pending if s.delivered is None]
+                if pending: time.sleep(args.poll_interval)
+        hq.stop.set()
+        # 3. Receipts: wait for the mule to carry them to the cloud
+        deadline = time.time() + max(10, 10 * args.sync_interval)
+        while mule.RECEIPTS.unsynced() and time.time() < deadline: time.sleep(0.1)
+        hq.left = mule.get_client().count(mule.DOWNLINK_COLLECTION).count
+        storage_end = dir_bytes(workdir)
+        report(args, survivors, hq, pending, acked, upload_s, ack_latencies, mail_latencies,
+               (storage_start, storage_acked, storage_end), workdir, mule, console)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def report(args, survivors, hq, pending, acked, upload_s, ack_latencies, mail_latencies, storage, workdir, mule, console):
+    storage_start, storage_acked, storage_end = storage
+    sync_lags = [hq.synced[(s.id, ts)] - ack for s in survivors for ts, ack in s.acked.items() if (s.id, ts) in hq.synced]
+    loops = [s.delivered - s.first_ack for s in survivors if s.delivered]
+    results = {
+        "survivors": args.survivors, "packets_sent": args.survivors * args.packets, "packets_acked": acked,
+        "packets_synced": len(hq.synced), "mail_delivered": len(loops), "mail_undelivered": len(pending),
+        "orders_left_mule": len(mule.INBOX), "orders_left_cloud": hq.left,
+        "packets_per_s": round(acked / upload_s, 1) if upload_s else 0.0, "upload_s": round(upload_s, 2),
+        "ack_ms": latency_summary(ack_latencies), "mail_ms": latency_summary(mail_latencies),
+        "mail_requests": len(mail_latencies), "loop_s": seconds_summary(loops), "sync_lag_s": seconds_summary(sync_lags),
+        "storage": {"start_bytes": storage_start, "after_upload_bytes": storage_acked, "end_bytes": storage_end,
+                    "bytes_per_packet": round((storage_acked - storage_start) / acked, 1) if acked else 0.0,
+                    "log_bytes": dir_bytes(mule.LOG.path), "dedup_bytes": dir_bytes(os.path.join(workdir, "mule_dedup")),
+                    "qdrant_bytes": dir_bytes(args.qdrant_path) if args.qdrant_path else None},
+    }
+
+    with contextlib.redirect_stdout(console): # The mule's threads keep printing to the quiet stream
+        print_results(args, results)
+
+
+def print_results(args, results):
+    print(f"🔄 {args.survivors} survivors x {args.packets} packets, {args.concurrency} at once, "
+          f"{'legacy' if args.legacy_mail else 'framed'} mail, Qdrant {os.environ['QDRANT_LOCATION']}")
+    print_table([{"metric": k, "value": v} for k, v in results.items() if not isinstance(v, dict)], ["metric", "value"])
+    print_table([dict(metric=k, **v) for k, v in results.items() if isinstance(v, dict) and k != "storage"],
+                ["metric", "p50_ms", "p99_ms", "max_ms", "p50_s", "p99_s", "max_s"])
+    print_table([{"storage": k, "bytes": v} for k, v in results["storage"].items()], ["storage", "bytes"])
+    write_json(args.json, {"benchmark": "e2e", "config": vars(args), "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""HQ map render cost: one marker per report vs grid aggregation (geo_grid.py).
+
+    python -m benchmarks.map_render --sizes 1000 10000 100000
+
+For each report count, builds the Live Operations map the old way (HeatMap of
+every report + MarkerCluster with one Marker each) and the aggregated way, and
+renders both to HTML. Reports the build / render time and the HTML size the
+browser has to load. The legacy path is skipped above --legacy-max.
+"""
+import argparse
+import time
+
+import folium
+import numpy as np
+from folium.plugins import HeatMap, MarkerCluster
+
+from geo_grid import GridPyramid, add_cluster_layers, zoom_for_extent
+from benchmarks.common import print_table, write_json
+
+
+def synthetic_reports(n, seed=0):
+    """Reports clustered around a few towns, like a flood across a district."""
+    rng = np.random.default_rng(seed)
+    towns = rng.uniform([28.3, 76.9], [28.9, 77.5], size=(12, 2))
+    which = rng.integers(0, len(towns), n)
+    pts = towns[which] + rng.normal(0, 0.02, (n, 2))
+    scores = rng.beta(2, 5, n)
+    return [{"id": f"Survivor-{i}", "lat": float(la), "lon": float(lo), "score": float(s), "point_id": str(i)}
+            for i, ((la, lo), s) in enumerate(zip(pts, scores))]
+
+
+def legacy_map(data):
+    m = folium.Map([np.mean([d['lat'] for d in data]), np.mean([d['lon'] for d in data])], zoom_start=15,
+                   tiles="CartoDB dark_matter")
+    HeatMap([[d['lat'], d['lon'], d['score']*15] for d in data], radius=18, blur=12).add_to(m)
+    mc = MarkerCluster().add_to(m)
+    for d in data:
+        color = "red" if d['score'] > 0.6 else "orange" if d['score'] > 0.3 else "green"
+        folium.Marker([d['lat'], d['lon']], popup=f"ID: {d['id']}<br>Score: {int(d['score']*100)}%",
+                      icon=folium.Icon(color=color, icon="info-sign")).add_to(mc)
+    return m, len(data)
+
+
+def grid_map(data, max_features, zoom=None):
+    grid = GridPyramid([d['lat'] for d in data], [d['lon'] for d in data], [d['score'] for d in data],
+                       max_features=max_features)
+    zoom = zoom or zoom_for_extent(grid.lat, grid.lon)
+    m = folium.Map([float(grid.lat.mean()), float(grid.lon.mean())], zoom_start=zoom, tiles="CartoDB dark_matter")
+    _, cells = grid.clusters(zoom)
+    add_cluster_layers(m, cells, data)
+    return m, len(cells["count"])
+
+
+def measure(name, build, data):
+    t0 = time.perf_counter()
+    m, features = build(data)
+    t1 = time.perf_counter()
+    html = m.get_root().render()
+    t2 = time.perf_counter()
+    return {"map": name, "reports": len(data), "features": features, "build_ms": round((t1 - t0) * 1000, 1),
+            "render_ms": round((t2 - t1) * 1000, 1), "total_ms": round((t2 - t0) * 1000, 1),
+            "html_kb": round(len(html.encode()) / 1024, 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--max-features", type=int, default=500)
+    ap.add_argument("--legacy-max", type=int, default=10000, help="Skip the per-report map above this size")
+    ap.add_argument("--json", help="Write results to this file")
+    args = ap.parse_args()
+
+    rows = []
+    for n in args.sizes:
+        data = synthetic_reports(n)
+        if n <= args.legacy_max: rows.append(measure("legacy", legacy_map, data))
+        rows.append(measure("grid", lambda d: grid_map(d, args.max_features), data))
+        rows.append(measure("grid z16", lambda d: grid_map(d, args.max_features, zoom=16), data))
+
+    print_table(rows, ["map", "reports", "features", "build_ms", "render_ms", "total_ms", "html_kb"])
+    write_json(args.json, {"benchmark": "map_render", "config": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
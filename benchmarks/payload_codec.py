@@ -0,0 +1,109 @@
+"""Survivor payload size / latency per link profile.
+
+    python -m benchmarks.payload_codec --seconds 15
+
+Builds one SOS with a synthetic 12 MP-style photo and a 48 kHz voice note,
+encodes it the legacy way (base64 media inside the Fernet JSON) and with every
+payload_codec profile, and prints wire bytes plus encode / HQ decode latency.
+"""
+import argparse
+import base64
+import io
+import json
+import time
+import wave
+
+import numpy as np
+from cryptography.fernet import Fernet
+from PIL import Image
+
+from media_store import seal_blob
+from payload_codec import PROFILES, decode_voice, encode_image, encode_voice, open_envelope, pack_envelope
+from benchmarks.common import print_table, write_json
+
+
+def synthetic_photo(w, h):
+    """Smooth gradients + sensor noise: compresses like a real photo, not like noise."""
+    y, x = np.mgrid[0:h, 0:w]
+    rgb = np.stack([(x / w) * 255, (y / h) * 255, ((x + y) % 256)], axis=-1)
+    rgb += np.random.default_rng(0).normal(0, 12, rgb.shape)
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def synthetic_voice(seconds, rate=48000):
+    t = np.arange(int(seconds * rate)) / rate
+    speech = np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    speech += 0.3 * np.sin(2 * np.pi * 900 * t) + np.random.default_rng(1).normal(0, 0.02, t.shape)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((np.clip(speech * 0.6, -1, 1) * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
+
+
+def wire_size(lines):
+    return sum(len(json.dumps(l)) + 1 for l in lines)
+
+
+def legacy(cipher, photo, voice):
+    t0 = time.perf_counter()
+    img = Image.open(io.BytesIO(photo)).convert("RGB")
+    img.thumbnail((800, 800))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG")
+    payload = json.dumps({"text": "Trapped on roof, water rising.", "audio": base64.b64encode(voice).decode(),
+                          "image": base64.b64encode(buf.getvalue()).decode()})
+    packet = {"id": "Survivor-01", "secure_content": cipher.encrypt(payload.encode()).decode()}
+    encode_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    dec = json.loads(cipher.decrypt(packet["secure_content"].encode()))
+    base64.b64decode(dec["image"]), base64.b64decode(dec["audio"])
+    decode_s = time.perf_counter() - t0
+    return {"profile": "legacy", "image_kb": round(len(buf.getvalue()) / 1024, 1),
+            "voice_kb": round(len(voice) / 1024, 1), "wire_kb": round(wire_size([packet]) / 1024, 1),
+            "encode_ms": round(encode_s * 1000, 1), "decode_ms": round(decode_s * 1000, 1)}
+
+
+def profiled(cipher, photo, voice, profile):
+    t0 = time.perf_counter()
+    img = encode_image(io.BytesIO(photo), profile)
+    vox = encode_voice(voice, profile)
+    blobs = [seal_blob(cipher, pack_envelope("image", img), "image"),
+             seal_blob(cipher, pack_envelope("audio", vox), "audio")]
+    payload = json.dumps({"text": "Trapped on roof, water rising.", "media": {b["kind"]: b["blob_id"] for b in blobs}})
+    packet = {"id": "Survivor-01", "secure_content": cipher.encrypt(pack_envelope("report", payload.encode())).decode()}
+    encode_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    json.loads(open_envelope(cipher.decrypt(packet["secure_content"].encode())))
+    open_envelope(cipher.decrypt(blobs[0]["secure_blob"].encode()))
+    decode_voice(open_envelope(cipher.decrypt(blobs[1]["secure_blob"].encode())))
+    decode_s = time.perf_counter() - t0
+    return {"profile": profile, "image_kb": round(len(img) / 1024, 1), "voice_kb": round(len(vox) / 1024, 1),
+            "wire_kb": round(wire_size(blobs + [packet]) / 1024, 1),
+            "encode_ms": round(encode_s * 1000, 1), "decode_ms": round(decode_s * 1000, 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=15, help="Voice note length")
+    ap.add_argument("--width", type=int, default=3000)
+    ap.add_argument("--height", type=int, default=2000)
+    ap.add_argument("--json", help="Write results to this file")
+    args = ap.parse_args()
+
+    cipher = Fernet(Fernet.generate_key())
+    photo, voice = synthetic_photo(args.width, args.height), synthetic_voice(args.seconds)
+    rows = [legacy(cipher, photo, voice)] + [profiled(cipher, photo, voice, p) for p in PROFILES]
+    base = rows[0]["wire_kb"]
+    for r in rows: r["vs_legacy"] = f"{r['wire_kb'] / base:.1%}"
+
+    print_table(rows, ["profile", "image_kb", "voice_kb", "wire_kb", "vs_legacy", "encode_ms", "decode_ms"])
+    write_json(args.json, {"benchmark": "payload_codec", "config": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
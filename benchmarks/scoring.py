@@ -0,0 +1,111 @@
+"""Urgency scoring backends: cold start, throughput and score agreement.
+
+    python -m benchmarks.scoring --reports 2000 --backends torch fastembed fastembed-q8
+
+Cold start (imports + model load + concept vectors, plus peak RSS) is timed in
+a fresh interpreter per backend, as the HQ node sees it. Throughput embeds and
+scores synthetic reports at each batch size. Every backend's urgency scores are
+compared with the reference backend's (torch, the original path); the run fails
+(exit 1) if any differs by more than --tolerance. Needs the models in the local
+cache or network access to download them.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from priority import KEYWORDS
+from scoring import DEFAULT_TOLERANCE, ScoringEngine
+from benchmarks.common import print_table, write_json
+
+COLD_START = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+from scoring import ScoringEngine
+engine = ScoringEngine(sys.argv[1])
+imported = time.perf_counter() - t0
+ok = engine.wait()
+print(json.dumps({"ok": ok, "error": str(engine.error or ""), "import_s": imported,
+                  "ready_s": time.perf_counter() - t0,
+                  "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+TEMPLATES = ["Help, {w} at the school near the river", "{w}, two people here, please send a team",
+             "Family of four, {w}, water at the first floor", "Status: {w}. We have food for two days",
+             "My neighbour is {w} and we cannot reach the road"]
+
+
+def corpus(n, seed=0):
+    rng = np.random.default_rng(seed)
+    words = [w for ws in KEYWORDS.values() for w in ws]
+    return [TEMPLATES[rng.integers(len(TEMPLATES))].format(w=words[rng.integers(len(words))]) for _ in range(n)]
+
+
+def cold_start(backend):
+    out = subprocess.run([sys.executable, "-c", COLD_START, backend], capture_output=True, text=True)
+    try:
+        return json.loads(out.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {"ok": False, "error": (out.stderr.strip().splitlines() or ["no output"])[-1]}
+
+
+def throughput(engine, texts, batch_sizes):
+    rates = {}
+    for bs in batch_sizes:
+        engine.batch_size = bs
+        t0 = time.perf_counter()
+        engine.score(texts)
+        rates[bs] = round(len(texts) / (time.perf_counter() - t0))
+    return rates
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--reports", type=int, default=2000)
+    ap.add_argument("--backends", nargs="+", default=["torch", "fastembed", "fastembed-q8"])
+    ap.add_argument("--reference", default="torch", help="Backend the others must agree with")
+    ap.add_argument("--batch", type=int, nargs="+", default=[16, 64, 256])
+    ap.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    ap.add_argument("--json", help="Write results to this file")
+    args = ap.parse_args()
+
+    texts = corpus(args.reports)
+    rows, scores = [], {}
+    for backend in dict.fromkeys([args.reference] + args.backends):
+        row = {"backend": backend}
+        cold = cold_start(backend)
+        if not cold["ok"]:
+            print(f"⚠️ {backend}: {cold['error']}")
+            rows.append(dict(row, error=cold["error"]))
+            continue
+        row.update(import_s=round(cold["import_s"], 2), ready_s=round(cold["ready_s"], 2), rss_mb=round(cold["rss_mb"]))
+        engine = ScoringEngine(backend)
+        engine.wait()
+        for bs, rate in throughput(engine, texts, args.batch).items(): row[f"per_s@{bs}"] = rate
+        scores[backend] = engine.score(texts)[1]
+        rows.append(row)
+
+    ref = scores.get(args.reference)
+    failed = False
+    for row in rows:
+        if ref is None or row["backend"] not in scores: continue
+        diff = np.abs(scores[row["backend"]] - ref)
+        row["max_diff"], row["mean_diff"] = round(float(diff.max()), 4), round(float(diff.mean()), 4)
+        row["within_tol"] = bool(diff.max() <= args.tolerance)
+        failed |= not row["within_tol"]
+
+    columns = ["backend", "import_s", "ready_s", "rss_mb"] + [f"per_s@{bs}" for bs in args.batch] + ["max_diff", "mean_diff", "within_tol"]
+    print(f"🧠 {args.reports} reports, reference {args.reference}, tolerance {args.tolerance}")
+    print_table(rows, columns)
+    if ref is None: print(f"⚠️ Reference backend {args.reference} unavailable: scores not compared")
+    write_json(args.json, {"benchmark": "scoring", "config": vars(args), "results": rows})
+    if failed:
+        print("❌ Scores outside tolerance")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
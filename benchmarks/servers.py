@@ -0,0 +1,146 @@
+"""Uplink server benchmark: legacy blocking accept() loop vs the asyncio server.
+
+    python -m benchmarks.servers --connections 500 --concurrency 50 --slow-clients 2
+
+Every simulated survivor connects, sends one SOS line and waits for "ACK".
+Slow clients connect and then stall, which is what used to freeze the old loop.
+By default clients half-close after sending (best case for the legacy loop);
+--app-style keeps the socket open like the old app.py did, so the legacy loop
+pays its full read timeout on every packet. The "asyncio+framed" row uses the
+length-prefixed protocol (protocol.py) the survivor app speaks today.
+"""
+import argparse
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import mule
+import protocol
+from packet_log import PacketLog
+from benchmarks.common import latency_summary, print_table, write_json
+
+
+def legacy_uplink_server(port, storage_file, read_timeout, ready):
+    """The pre-asyncio uplink loop, kept verbatim as the baseline."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(('127.0.0.1', port))
+        s.listen()
+        ready.set()
+        while True:
+            try:
+                conn, addr = s.accept()
+                conn.settimeout(read_timeout)
+                data = b""
+                while True:
+                    try:
+                        chunk = conn.recv(4096)
+                        if not chunk: break
+                        data += chunk
+                    except socket.timeout: break
+                if data:
+                    decoded = data.decode('utf-8', errors='ignore')
+                    start, end = decoded.find('{'), decoded.rfind('}')
+                    if start != -1 and end != -1:
+                        parsed = json.loads(decoded[start:end+1])
+                        with open(storage_file, "a") as f: f.write(json.dumps(parsed) + "\n")
+                        conn.sendall(b"ACK")
+                conn.close()
+            except Exception: pass
+
+
+def asyncio_uplink_server(port, ready):
+    asyncio.run(mule.serve(port, mule.handle_uplink, host='127.0.0.1', ready=ready))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def survivor(port, idx, half_close, framed=False):
+    line = json.dumps({"id": f"bench-{idx}", "type": "sos", "location": [28.61, 77.20],
+                       "timestamp": time.time(), "secure_content": "x" * 512}) + "\n"
+    t0 = time.perf_counter()
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=120) as s:
+            if framed:
+                protocol.send_frame(s, protocol.PACKET, idx, line.strip().encode())
+                reply = protocol.recv_frame(s)
+                ok = bool(reply) and reply[0] == protocol.ACK
+                protocol.send_frame(s, protocol.BYE)
+            else:
+                s.sendall(line.encode())
+                if half_close: s.shutdown(socket.SHUT_WR)
+                ok = b"ACK" in s.recv(1024)
+    except (OSError, protocol.ProtocolError):
+        ok = False
+    return ok, time.perf_counter() - t0
+
+
+def stalled_survivor(port, hold):
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=hold + 5) as s:
+            time.sleep(hold)
+    except OSError: pass
+
+
+def run(name, port, args, framed=False):
+    stallers = [threading.Thread(target=stalled_survivor, args=(port, args.stall_seconds), daemon=True)
+                for _ in range(args.slow_clients)]
+    for t in stallers: t.start()
+    time.sleep(0.2) # Let the slow clients grab the server first
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda i: survivor(port, i, not args.app_style, framed), range(args.connections)))
+    elapsed = time.perf_counter() - t0
+
+    latencies = [lat for ok, lat in results if ok]
+    row = {"server": name, "ok": len(latencies), "failed": len(results) - len(latencies),
+           "conn_per_s": round(len(latencies) / elapsed, 1), "elapsed_s": round(elapsed, 2)}
+    row.update(latency_summary(latencies))
+    return row
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--connections", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--slow-clients", type=int, default=2)
+    ap.add_argument("--stall-seconds", type=float, default=5.0)
+    ap.add_argument("--legacy-timeout", type=float, default=10.0)
+    ap.add_argument("--app-style", action="store_true", help="Do not half-close after sending (like app.py)")
+    ap.add_argument("--skip-legacy", action="store_true")
+    ap.add_argument("--json", help="Write results to this file")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mule-bench-")
+    mule.LOG = PacketLog(os.path.join(workdir, "asyncio_log"), fsync=False)
+    rows = []
+
+    if not args.skip_legacy:
+        ready, port = threading.Event(), free_port()
+        threading.Thread(target=legacy_uplink_server, daemon=True,
+                         args=(port, os.path.join(workdir, "legacy_storage.json"), args.legacy_timeout, ready)).start()
+        ready.wait()
+        rows.append(run("legacy", port, args))
+
+    ready, port = threading.Event(), free_port()
+    threading.Thread(target=asyncio_uplink_server, args=(port, ready), daemon=True).start()
+    ready.wait()
+    rows.append(run("asyncio", port, args))
+    rows.append(run("asyncio+framed", port, args, framed=True))
+
+    print_table(rows, ["server", "ok", "failed", "conn_per_s", "p50_ms", "p99_ms", "max_ms", "elapsed_s"])
+    write_json(args.json, {"benchmark": "servers", "config": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Bloom filters over packet digests: the summary vectors mules swap when they meet.
+
+A filter answers "have you got this packet?" with no false negatives and a
+tunable false-positive rate, in about 1.2 bytes per item at 1 %. Items are the
+32-byte SHA-256 digests from packet_log.packet_digest(), so the k bit positions
+come straight from the digest (double hashing) and nothing is hashed twice.
+
+A false positive only means one packet is not handed over in that encounter;
+the mule that has it still uploads it, or passes it on at the next meeting.
+"""
+import math
+import struct
+
+HEADER = struct.Struct("!IB")  # bits, hashes
+
+
+class BloomFilter:
+    def __init__(self, bits, hashes):
+        self.bits = max(8, bits)
+        self.hashes = max(1, hashes)
+        self.array = bytearray((self.bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        n = max(1, capacity)
+        bits = int(math.ceil(-n * math.log(error_rate) / math.log(2) ** 2))
+        return cls(bits, int(round(bits / n * math.log(2))))
+
+    def _positions(self, digest):
+        # Enhanced double hashing: plain h1 + i*h2 clusters badly at high k
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big")
+        return ((h1 + i * h2 + (i * i * i - i) // 6) % self.bits for i in range(self.hashes))
+
+    def add(self, digest):
+        for p in self._positions(digest):
+            self.array[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, digest):
+        return all(self.array[p >> 3] & (1 << (p & 7)) for p in self._positions(digest))
+
+    def to_bytes(self):
+        return HEADER.pack(self.bits, self.hashes) + bytes(self.array)
+
+    @classmethod
+    def from_bytes(cls, data):
+        bits, hashes = HEADER.unpack(data[:HEADER.size])
+        bf = cls(bits, hashes)
+        if len(data) - HEADER.size != len(bf.array): raise ValueError("truncated bloom filter")
+        bf.array[:] = data[HEADER.size:]
+        return bf
+
+
+def pack_filters(filters):
+    """{name: BloomFilter} -> bytes (length-prefixed, for one protocol frame)."""
+    out = bytearray()
+    for name, bf in filters.items():
+        blob, key = bf.to_bytes(), name.encode()
+        out += struct.pack("!BI", len(key), len(blob)) + key + blob
+    return bytes(out)
+
+
+def unpack_filters(data):
+    filters, pos = {}, 0
+    while pos < len(data):
+        klen, blen = struct.unpack_from("!BI", data, pos)
+        pos += 5
+        name = data[pos:pos + klen].decode()
+        pos += klen
+        filters[name] = BloomFilter.from_bytes(data[pos:pos + blen])
+        pos += blen
+    return filters
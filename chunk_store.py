@@ -0,0 +1,116 @@
+"""Partially received chunked packets, kept on the mule between contacts.
+
+    mule_partials/
+        <transfer_id>/
+            meta.json        {"size": n, "chunks": k, "started": <unix time>}
+            000000.chunk     crc32 (uint32) | data
+            000001.chunk     ...
+
+The transfer ID is the SHA-256 of the complete packet body, so the same packet
+resumes into the same directory whichever session (or retry) delivers it, and
+the reassembled body is checked against it before it reaches the packet log.
+Chunk files are written with an atomic rename and re-checked on read; a
+transfer untouched for `ttl` seconds is deleted by prune().
+"""
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+
+CHUNK_FILE = struct.Struct("!I")
+META_FILE = "meta.json"
+
+
+def transfer_id_of(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+class PartialStore:
+    def __init__(self, path, ttl=6 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _dir(self, transfer_id):
+        if len(transfer_id) != 64 or not all(c in "0123456789abcdef" for c in transfer_id):
+            raise ValueError("bad transfer id")
+        return os.path.join(self.path, transfer_id)
+
+    def _chunk(self, transfer_id, index):
+        return os.path.join(self._dir(transfer_id), f"{index:06d}.chunk")
+
+    def _meta(self, transfer_id):
+        with open(os.path.join(self._dir(transfer_id), META_FILE)) as f: return json.load(f)
+
+    def _read_chunk(self, transfer_id, index):
+        try:
+            with open(self._chunk(transfer_id, index), "rb") as f: raw = f.read()
+        except OSError:
+            return None
+        data = raw[CHUNK_FILE.size:]
+        if len(raw) < CHUNK_FILE.size or zlib.crc32(data) != CHUNK_FILE.unpack(raw[:CHUNK_FILE.size])[0]:
+            return None
+        return data
+
+    def begin(self, transfer_id, size, chunks):
+        """Starts or resumes a transfer and returns the chunk indexes already stored."""
+        d = self._dir(transfer_id)
+        with self._lock:
+            try:
+                meta = self._meta(transfer_id)
+                if meta["size"] != size or meta["chunks"] != chunks: raise ValueError("layout changed")
+            except (OSError, ValueError, KeyError):
+                shutil.rmtree(d, ignore_errors=True)
+                os.makedirs(d)
+                self._write(os.path.join(d, META_FILE), json.dumps(
+                    {"size": size, "chunks": chunks, "started": time.time()}).encode())
+            os.utime(d) # Keeps the transfer alive for another TTL
+            return [i for i in range(chunks) if self._read_chunk(transfer_id, i) is not None]
+
+    def put(self, transfer_id, index, data):
+        if not 0 <= index < self._meta(transfer_id)["chunks"]: raise ValueError(f"chunk {index} out of range")
+        self._write(self._chunk(transfer_id, index), CHUNK_FILE.pack(zlib.crc32(data)) + data)
+
+    def assemble(self, transfer_id):
+        """Returns the packet body once every chunk is stored and it matches its
+        transfer ID; None while chunks are missing. Raises ValueError (and drops
+        the transfer) if the reassembled body does not match."""
+        meta = self._meta(transfer_id)
+        stored = sum(n.endswith(".chunk") for n in os.listdir(self._dir(transfer_id)))
+        if stored < meta["chunks"]: return None # Cheap check before reading anything
+        parts = []
+        for i in range(meta["chunks"]):
+            data = self._read_chunk(transfer_id, i)
+            if data is None: return None
+            parts.append(data)
+        body = b"".join(parts)
+        if len(body) != meta["size"] or transfer_id_of(body) != transfer_id:
+            self.discard(transfer_id)
+            raise ValueError("reassembled packet does not match its transfer id")
+        return body
+
+    def discard(self, transfer_id):
+        shutil.rmtree(self._dir(transfer_id), ignore_errors=True)
+
+    def prune(self):
+        """Deletes transfers idle for longer than the TTL. Returns how many."""
+        cutoff, removed = time.time() - self.ttl, 0
+        for name in os.listdir(self.path):
+            d = os.path.join(self.path, name)
+            try:
+                if os.path.getmtime(d) < cutoff:
+                    shutil.rmtree(d, ignore_errors=True)
+                    removed += 1
+            except OSError: pass
+        return removed
+
+    @staticmethod
+    def _write(path, data):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f: f.write(data)
+        os.replace(tmp, path)
@@ -9,9 +9,15 @@ import pandas as pd
 from cryptography.fernet import Fernet
 import base64
 import folium
-from folium.plugins import HeatMap, MarkerCluster
 from streamlit_folium import st_folium
 import numpy as np
+from intel_cache import IntelCache, content_key
+from geo_grid import GridPyramid, add_cluster_layers, zoom_for_extent
+from report_store import ReportStore
+from media_store import MEDIA_COLLECTION, BlobCache, blob_point_id
+from payload_codec import open_envelope, decode_voice
+from decrypt_stage import DecryptStage, open_report
+from scoring import CRITICAL_CONCEPTS, EMBED_MODEL, ScoringEngine
 
 # --- 1. CONFIGURATION & STYLE ---
 ST_CONFIG = {
@@ -53,12 +59,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 2. LIBRARY CHECKS & KEYS ---
-try:
-    from sentence_transformers import SentenceTransformer, util
-except ImportError:
-    st.error("❌ Critical Error: AI Model Missing. Run: pip install sentence-transformers pandas")
-    st.stop()
-
 # 🛑 CLOUD KEYS (Robust Loading)
 try:
     QDRANT_URL = st.secrets["QDRANT_URL"]
@@ -69,28 +69,65 @@ except:
 
 COLLECTION_NAME = "disaster_reports"
 DOWNLINK_COLLECTION = "courier_bag"
+INTEL_CACHE_SIZE = 5000                 # Reports kept in the in-memory LRU tier
+INTEL_CACHE_DB = "hq_intel_cache.db"    # Encrypted on-disk tier (None to disable)
+MEDIA_CACHE_DIR = "hq_media_cache"     # Encrypted blobs, evicted least-recently-used first
+MEDIA_CACHE_BYTES = 256 * 1024 * 1024
+REPORT_STORE_DIR = "hq_reports"        # Parquet record of every report seen (analytics / export)
+EXPORT_DIR = "hq_exports"
+EXPORT_DOWNLOAD_MAX = 64 * 1024 * 1024  # Larger exports stay on disk instead of going through the browser
+MAP_MAX_FEATURES = 500                  # Map cells / markers sent to the browser, whatever the report volume
+RECORD_PAGES = 4                        # Sector View: pages per refresh fed to the report store from outside the sector
+INGEST_OVERLAP_S = 600                  # Re-check window behind the ingest cursor (mules running behind HQ's clock)
+DECRYPT_WORKERS = None                  # Decrypt processes (None: up to 4, one per CPU; 1 decrypts inline)
+DECRYPT_BATCH = 16                      # Reports per worker task
+SCORING_BACKEND = "fastembed-q8"        # fastembed-q8 (int8 ONNX), fastembed (fp32 ONNX) or torch (sentence-transformers)
 
 # --- 3. CRYPTO SETUP ---
 if not os.path.exists("secret.key"):
     key = Fernet.generate_key()
     with open("secret.key", "wb") as key_file: key_file.write(key)
-with open("secret.key", "rb") as k: cipher = Fernet(k.read())
+with open("secret.key", "rb") as k: HQ_KEY = k.read()
+cipher = Fernet(HQ_KEY)
 
 # --- 4. CACHED RESOURCES ---
 @st.cache_resource
-def load_ai_brain(): 
-    # Load model once and keep in memory
-    return SentenceTransformer('all-MiniLM-L6-v2')
+def load_ai_brain():
+    # Loads in the background: the UI renders while the model warms up (scoring.py)
+    return ScoringEngine(SCORING_BACKEND).start()
 
 ai_model = load_ai_brain()
 
-# Pre-calculate Critical Concepts (Optimization)
+# Cached scores are only valid for this exact model + concept set (all backends share the embedding space)
+SCORER_TAG = EMBED_MODEL + "|" + "|".join(CRITICAL_CONCEPTS)
+
+# Decrypted text / embedding / urgency per report, so reruns skip model work
+@st.cache_resource
+def get_intel_cache():
+    return IntelCache(capacity=INTEL_CACHE_SIZE, disk_path=INTEL_CACHE_DB, cipher=cipher)
+
+intel_cache = get_intel_cache()
+
+# Bounded local cache of encrypted media blobs
+@st.cache_resource
+def get_blob_cache():
+    return BlobCache(MEDIA_CACHE_DIR, max_bytes=MEDIA_CACHE_BYTES)
+
+blob_cache = get_blob_cache()
+
+# Columnar mission record, appended as reports arrive
+@st.cache_resource
+def get_report_store():
+    return ReportStore(REPORT_STORE_DIR, cipher)
+
+report_store = get_report_store()
+
+# Worker pool that opens report payloads in batches
 @st.cache_resource
-def get_critical_vectors():
-    concepts = ["Medical Emergency", "Trapped Person", "Fire Hazard", "Severe Bleeding", "Building Collapse"]
-    return ai_model.encode(concepts, convert_to_tensor=True)
+def get_decrypt_stage():
+    return DecryptStage(HQ_KEY, workers=DECRYPT_WORKERS, batch_size=DECRYPT_BATCH)
 
-crit_embeds = get_critical_vectors()
+decrypt_stage = get_decrypt_stage()
 
 # --- 🛡️ ROBUST CLIENT SETUP ---
 @st.cache_resource
@@ -104,74 +141,346 @@ except Exception as e:
     st.error(f"❌ Database Initialization Failed: {e}")
     st.stop()
 
+def create_downlink_collection():
+    client.create_collection(DOWNLINK_COLLECTION, vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE))
+    # Indexes behind the mules' incremental (timestamp) and coverage-area (geo) downloads
+    client.create_payload_index(DOWNLINK_COLLECTION, field_name="timestamp", field_schema=models.PayloadSchemaType.FLOAT)
+    client.create_payload_index(DOWNLINK_COLLECTION, field_name="target_location", field_schema=models.PayloadSchemaType.GEO)
+
 # --- 🧠 BATCH INTELLIGENCE FETCH (The Optimization) ---
-def fetch_intelligence_batch(limit=50):
-    # 1. Fetch Raw Data
-    if not client.collection_exists(COLLECTION_NAME): 
-        return []
+def lat_lon(payload):
+    """Report location: geo object {"lat", "lon"} or the legacy [lat, lon] list."""
+    loc = payload.get("location") or [28.61, 77.20]
+    if isinstance(loc, dict): return loc.get("lat", 28.61), loc.get("lon", 77.20)
+    return loc[0], loc[1]
+
+def process_points(raw):
+    """Decrypts and scores a page of scrolled points; returns the valid reports."""
+    # 2. Pre-process List (Decryption Phase) - cache hits skip it, the rest go through the worker pool
+    points = [p for p in raw if p.payload.get("secure_content")]
+    keys = [content_key(p.payload["secure_content"], SCORER_TAG) for p in points]
+    cached = {k: e for k, e in intel_cache.get_many(list(set(keys))).items()
+              if "inline_media" in e} # Older entries lack the media refs: decrypt once more
+    misses = [(p, k) for p, k in zip(points, keys) if k not in cached]
+    opened = decrypt_stage.run([p.payload["secure_content"] for p, _ in misses], ids=[p.id for p, _ in misses])
+    decrypted = {p.id: dec for (p, _), dec in zip(misses, opened)}
+    valid_packets = []
+    fresh = [] # (cache key, packet) pairs that still need model work
+
+    for p, key in zip(points, keys):
+        hit = cached.get(key)
+        dec = hit or decrypted.get(p.id)
+        if dec is None: continue # Failed to open: counted in decrypt_stage.stats
+
+        # Store for batch processing
+        lat, lon = lat_lon(p.payload)
+        item = {
+            "id": p.payload.get("id"),
+            "text": dec.get("text", "Info"),
+            "inline_media": dec.get("inline_media") or [], # Legacy inline image / audio, decrypted on demand
+            "media": dec.get("media") or {}, # {kind: blob_id}, fetched lazily
+            "lat": lat, "lon": lon,
+            "time": p.payload.get("timestamp", time.time()),
+            "point_id": p.id,
+            "raw_payload": p.payload # Keep raw payload for reference
+        }
+        if hit: item["score"], item["embedding"] = hit["score"], hit["embedding"]
+        else: fresh.append((key, item))
+        valid_packets.append(item)
+
+    if not valid_packets: return []
 
+    # 3. Cached reports whose point lost its vector (mule re-upload): store it again
     try:
-        raw_result = client.scroll(collection_name=COLLECTION_NAME, limit=limit, with_payload=True)
-        raw = raw_result[0]
-        if not raw: return []
+        write_back_vectors([p for p in valid_packets
+                            if "embedding" in p and p["raw_payload"].get("embedded") != EMBED_MODEL])
     except Exception as e:
-        return []
+        pass # Retried on the next full resync
 
-    # 2. Pre-process List (Decryption Phase)
-    valid_packets = []
-    texts_to_vectorize = []
-    
-    for p in raw:
+    # 4. 🚀 BATCH AI EXECUTION (only reports the cache has never seen)
+    if fresh: score_fresh(fresh)
+    return valid_packets
+
+def score_fresh(fresh):
+    """Embeds and scores (cache key, report) pairs in one batch. While the model
+    is loading (or if it fails) they stay pending at urgency 0 and are scored
+    on a later refresh, see rescore_pending()."""
+    pending = st.session_state.setdefault("intel_pending", {})
+    try:
+        if not ai_model.ready: raise RuntimeError(ai_model.status())
+        # A. Vectorize all new texts at once
+        message_embeddings = ai_model.embed([item["text"] for _, item in fresh])
+        for (_, packet), emb in zip(fresh, message_embeddings): packet["embedding"] = emb
+    except Exception as e:
+        for key, p in fresh:
+            p["score"], p["pending"] = 0.0, True
+            pending[p["point_id"]] = key
+        return
+    # B. Store real vectors on the points, so Qdrant can score and search them
+    try:
+        write_back_vectors(p for _, p in fresh if p["raw_payload"].get("embedded") != EMBED_MODEL)
+    except Exception as e:
+        pass # Retried on the next full resync; local scoring below still works
+
+    # C. Urgency: best match against the critical concepts, scored by Qdrant
+    try:
+        server_scores = score_on_server([p["point_id"] for _, p in fresh])
+    except Exception as e:
+        server_scores = {}
+    local = ai_model.urgency([p["embedding"] for _, p in fresh]) # Server unavailable: same cosine similarity, locally
+    entries = {}
+    for (key, packet), fallback in zip(fresh, local):
+        score = server_scores.get(packet["point_id"])
+        packet["score"] = float(fallback) if score is None else score
+        packet.pop("pending", None)
+        pending.pop(packet["point_id"], None)
+        entries[key] = {"text": packet["text"], "embedding": packet["embedding"], "score": packet["score"],
+                        "media": packet["media"], "inline_media": packet["inline_media"]}
+    intel_cache.put_many(entries)
+
+def rescore_pending(view):
+    """Scores reports that arrived before the model was ready."""
+    pending = st.session_state.get("intel_pending")
+    if not pending or not ai_model.ready: return
+    items = [(key, view[pid]) for pid, key in list(pending.items()) if pid in view]
+    for pid in [pid for pid in pending if pid not in view]: pending.pop(pid) # Left the view (sector change)
+    for i in range(0, len(items), ai_model.batch_size * 4):
+        batch = items[i:i + ai_model.batch_size * 4]
+        score_fresh(batch)
+        report_store.append([item for _, item in batch if not item.get("pending")])
+
+# --- 🧭 SERVER-SIDE VECTOR WORK ---
+def write_back_vectors(items):
+    """Replaces the mules' placeholder vectors with the HQ embedding."""
+    items = list(items)
+    if not items: return
+    client.update_vectors(collection_name=COLLECTION_NAME, points=[
+        models.PointVectors(id=i["point_id"], vector=np.asarray(i["embedding"]).tolist()) for i in items])
+    client.set_payload(collection_name=COLLECTION_NAME, payload={"embedded": EMBED_MODEL},
+                       points=[i["point_id"] for i in items])
+
+def embedded_filter(extra=None):
+    return models.Filter(must=[models.FieldCondition(key="embedded", match=models.MatchValue(value=EMBED_MODEL))]
+                         + (extra or []))
+
+def score_on_server(ids):
+    """{point_id: urgency} where urgency is the best cosine score of the report
+    against any critical concept, computed by one batched Qdrant query."""
+    requests = [models.QueryRequest(query=vec.tolist(), limit=len(ids),
+                                    filter=embedded_filter([models.HasIdCondition(has_id=ids)]))
+                for vec in ai_model.concept_vectors]
+    scores = {}
+    for res in client.query_batch_points(collection_name=COLLECTION_NAME, requests=requests):
+        for pt in res.points: scores[pt.id] = max(scores.get(pt.id, -1.0), pt.score)
+    return scores
+
+def semantic_search(query, limit=10):
+    """Free-text 'find reports like this' as a Qdrant vector query."""
+    vec = ai_model.embed([query])[0]
+    hits = client.query_points(collection_name=COLLECTION_NAME, query=vec.tolist(), query_filter=embedded_filter(),
+                               limit=limit, with_payload=True).points
+    view = st.session_state.get("intel_view", {})
+    found = {h.id: view[h.id] for h in hits if h.id in view}
+    for item in process_points([h for h in hits if h.id not in view]): found[item["point_id"]] = item
+    return [(found[h.id], h.score) for h in hits if h.id in found]
+
+# --- 📎 LAZY MEDIA ---
+def load_blob(blob_id):
+    """Decrypted media bytes: from the local blob cache, else from Qdrant."""
+    token = blob_cache.get(blob_id)
+    if token is None:
+        recs = client.retrieve(collection_name=MEDIA_COLLECTION, ids=[blob_point_id(blob_id)], with_payload=True)
+        if not recs: return None
+        token = (recs[0].payload.get("secure_blob") or "").encode()
+        blob_cache.put(blob_id, token) # Raises if the blob does not match its hash
+    return open_envelope(cipher.decrypt(token))
+
+def show_media(refs):
+    for kind, blob_id in refs.items():
         try:
-            # Decrypt Content
-            enc = p.payload.get("secure_content")
-            if not enc: continue
-            
-            try:
-                dec = json.loads(cipher.decrypt(enc.encode()).decode())
-            except Exception as e_crypto:
-                continue
-
-            # Store for batch processing
-            item = {
-                "id": p.payload.get("id"),
-                "text": dec.get("text", "Info"),
-                "img": dec.get("image"),
-                "audio": dec.get("audio"),
-                "lat": p.payload.get("location", [28.61, 77.20])[0],
-                "lon": p.payload.get("location", [28.61, 77.20])[1],
-                "time": p.payload.get("timestamp", time.time()),
-                "raw_payload": p.payload # Keep raw payload for reference
-            }
-            valid_packets.append(item)
-            texts_to_vectorize.append(item["text"])
+            data = load_blob(blob_id)
         except Exception as e:
+            st.error(f"{kind.title()} Corrupted")
             continue
+        if data is None:
+            st.caption(f"⏳ {kind.title()} still in transit")
+        elif kind == "audio":
+            st.caption("🎙️ Voice Transmission")
+            st.audio(decode_voice(data), format='audio/wav')
+        elif kind == "image":
+            st.caption("📷 Visual Assessment")
+            st.image(data, use_container_width=True)
+
+def show_inline_media(payload):
+    """Legacy reports: re-opens the payload with its base64 image / audio."""
+    dec, reason = open_report(cipher, payload.get("secure_content") or "", keep_media=True)
+    if dec is None:
+        st.error(f"Attachments unreadable ({reason})")
+        return
+    if dec.get("audio"):
+        st.caption("🎙️ Voice Transmission")
+        try: st.audio(base64.b64decode(dec["audio"]), format='audio/wav')
+        except: st.error("Audio Corrupted")
+    if dec.get("image"):
+        st.caption("📷 Visual Assessment")
+        try: st.image(base64.b64decode(dec["image"]), use_container_width=True)
+        except: st.error("Image Corrupted")
+
+# --- 🔄 INCREMENTAL INGEST ---
+# The session keeps a materialized view {point_id: report} plus a cursor on the
+# mule-side `synced_at` stamp, so each refresh only pulls points synced since
+# the previous one. (Survivor `timestamp` is not usable as a cursor: a mule can
+# carry a report for hours before it reaches the cloud.)
+# synced_at comes from each mule's own clock. The stored cursor never runs past
+# HQ's clock, so one mule that is ahead cannot push the others out of the
+# window, and each refresh re-reads INGEST_OVERLAP_S behind it for mules that
+# are behind.
+def ingest_cursor(newest):
+    return min(newest, time.time())
 
-    if not valid_packets: return []
-
-    # 3. 🚀 BATCH AI EXECUTION
+@st.cache_resource
+def ensure_report_indexes():
+    for field, schema in (("timestamp", models.PayloadSchemaType.FLOAT), ("synced_at", models.PayloadSchemaType.FLOAT),
+                          ("embedded", models.PayloadSchemaType.KEYWORD), ("location", models.PayloadSchemaType.GEO)):
+        try: client.create_payload_index(COLLECTION_NAME, field_name=field, field_schema=schema)
+        except Exception: pass # Already indexed
+    try: migrate_locations()
+    except Exception as e: print(f"⚠️ Location migration skipped: {e}")
+    return True
+
+def migrate_locations(batch=256):
+    """Rewrites legacy [lat, lon] locations (uploaded by older mules) as geo
+    objects so the geo index covers them. Runs once per dashboard process."""
+    legacy = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="location.lat"))],
+                           must_not=[models.IsEmptyCondition(is_empty=models.PayloadField(key="location"))])
+    offset = None
+    while True:
+        page, offset = client.scroll(collection_name=COLLECTION_NAME, scroll_filter=legacy, limit=batch,
+                                     offset=offset, with_payload=["location"], with_vectors=False)
+        ops = []
+        for p in page:
+            loc = p.payload.get("location")
+            if isinstance(loc, list) and len(loc) == 2:
+                ops.append(models.SetPayloadOperation(set_payload=models.SetPayload(
+                    payload={"location": {"lat": loc[0], "lon": loc[1]}}, points=[p.id])))
+        if ops: client.batch_update_points(collection_name=COLLECTION_NAME, update_operations=ops)
+        if offset is None: break
+
+def sector_bbox(bounds, pad=0.0):
+    """(south, west, north, east) of st_folium map bounds, grown by `pad` of its size per side."""
+    sw, ne = bounds["_southWest"], bounds["_northEast"]
+    dlat, dlon = (ne["lat"] - sw["lat"]) * pad, (ne["lng"] - sw["lng"]) * pad
+    return (max(-90.0, sw["lat"] - dlat), max(-180.0, sw["lng"] - dlon),
+            min(90.0, ne["lat"] + dlat), min(180.0, ne["lng"] + dlon))
+
+def bbox_contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+def current_sector():
+    """Sector to load in viewport mode: the last map view plus a margin, kept
+    until the operator pans or zooms out of it, so small moves refetch nothing."""
+    bounds = st.session_state.get("map_bounds")
+    if not bounds or not bounds.get("_southWest"): return None
+    sector = st.session_state.get("sector")
+    if not sector or not bbox_contains(sector, sector_bbox(bounds)):
+        sector = st.session_state["sector"] = sector_bbox(bounds, pad=0.5)
+    return sector
+
+def fetch_intelligence_batch(limit=50, sector=None):
+    """Merges every report synced since the last refresh into the session view.
+    `limit` is the scroll page size; all pages of new points are read. With a
+    `sector` (south, west, north, east) only reports located inside it are
+    fetched and decrypted, via the geo index on `location`."""
+    # 1. Fetch Raw Data (delta only)
+    if not client.collection_exists(COLLECTION_NAME): 
+        return []
+    ensure_report_indexes()
+
+    if st.session_state.get("intel_sector") != sector: # New sector: start a fresh view (the intel cache keeps decrypts cheap)
+        st.session_state.pop("intel_view", None)
+        st.session_state.pop("intel_cursor", None)
+        st.session_state["intel_sector"] = sector
+    view = st.session_state.setdefault("intel_view", {})
+    rescore_pending(view)
+    cursor = st.session_state.get("intel_cursor", 0)
+    must = []
+    if cursor:
+        must.append(models.FieldCondition(key="synced_at", range=models.Range(gte=cursor - INGEST_OVERLAP_S)))
+    if sector:
+        south, west, north, east = sector
+        must.append(models.FieldCondition(key="location", geo_bounding_box=models.GeoBoundingBox(
+            top_left=models.GeoPoint(lat=north, lon=west), bottom_right=models.GeoPoint(lat=south, lon=east))))
+    scroll_filter = models.Filter(must=must) if must else None
+
+    newest, offset = cursor, None
     try:
-        if texts_to_vectorize:
-            # A. Vectorize all texts at once
-            message_embeddings = ai_model.encode(texts_to_vectorize, convert_to_tensor=True)
-            
-            # B. Calculate Similarity Matrix (Messages x Concepts)
-            cosine_scores = util.cos_sim(message_embeddings, crit_embeds)
-            
-            # C. Extract max urgency for each message
-            max_scores = [float(score.max()) for score in cosine_scores]
-            
-            # D. Assign scores back to packet list
-            for i, packet in enumerate(valid_packets):
-                packet["score"] = max_scores[i]
-                
+        while True:
+            page, offset = client.scroll(collection_name=COLLECTION_NAME, scroll_filter=scroll_filter, limit=limit,
+                                         offset=offset, with_payload=True, with_vectors=False)
+            new = [p for p in page if p.id not in view]
+            # Already in view but re-uploaded since (another mule's copy, a resend after
+            # a crash): the upsert reset the vector to the placeholder, store ours again
+            wiped = [view[p.id] for p in page if p.id in view and "embedding" in view[p.id]
+                     and p.payload.get("embedded") != EMBED_MODEL]
+            if wiped:
+                try: write_back_vectors(wiped)
+                except Exception as e: pass # Still in the overlap window on the next refresh
+            items = process_points(new)
+            for item in items: view[item["point_id"]] = item
+            report_store.append([i for i in items if not i.get("pending")]) # Pending ones once they are scored
+            newest = max([newest] + [p.payload.get("synced_at") or 0 for p in page])
+            if offset is None: break
+        # Only move the cursor after a complete pass: pages are not in time order
+        st.session_state["intel_cursor"] = ingest_cursor(newest)
     except Exception as e:
-        # Fallback: assign 0 score if AI fails
-        for p in valid_packets: p["score"] = 0.0
+        pass # Keep the current view; the next refresh retries from the same cursor
 
     # Sort by urgency (High to Low) AND Time to keep list stable
-    return sorted(valid_packets, key=lambda x: (x['score'], x['time']), reverse=True)
+    return sorted(view.values(), key=lambda x: (x['score'], x['time']), reverse=True)
+
+def record_all_sectors(limit=50, pages=RECORD_PAGES):
+    """Sector View only loads the reports on screen; this pass feeds report_store
+    from the whole collection, a few pages per refresh, so analytics and export
+    still cover every sector. It has its own cursor and resumes mid-pass."""
+    if not ai_model.ready or not client.collection_exists(COLLECTION_NAME): return # Records need their score
+    state = st.session_state.setdefault("record_pass", {"cursor": 0, "offset": None, "newest": 0})
+    cursor = state["cursor"]
+    scroll_filter = models.Filter(must=[models.FieldCondition(
+        key="synced_at", range=models.Range(gte=cursor - INGEST_OVERLAP_S))]) if cursor else None
+    try:
+        for _ in range(pages):
+            page, offset = client.scroll(collection_name=COLLECTION_NAME, scroll_filter=scroll_filter, limit=limit,
+                                         offset=state["offset"], with_payload=True, with_vectors=False)
+            items = process_points([p for p in page if p.id not in report_store])
+            report_store.append([i for i in items if not i.get("pending")])
+            if any(i.get("pending") for i in items): return # Scoring failed: this page again next time
+            state["newest"] = max([state["newest"]] + [p.payload.get("synced_at") or 0 for p in page])
+            state["offset"] = offset
+            if offset is None: # Pass complete: the next one starts at the cursor
+                state["cursor"] = ingest_cursor(state["newest"])
+                return
+    except Exception as e:
+        pass # Resumes from the same page on the next refresh
+
+def build_map(data):
+    """Folium map with at most MAP_MAX_FEATURES aggregated cells (geo_grid.py).
+    The grid pyramid is rebuilt only when the reports or their scores change
+    (pending reports get their real urgency later)."""
+    version = hash(tuple((d['point_id'], d['score']) for d in data))
+    cached = st.session_state.get("map_grid")
+    if not cached or cached[0] != version:
+        cached = (version, GridPyramid([d['lat'] for d in data], [d['lon'] for d in data],
+                                       [d['score'] for d in data], max_features=MAP_MAX_FEATURES))
+        st.session_state["map_grid"] = cached
+    grid = cached[1]
+
+    zoom = st.session_state.get("map_zoom") or zoom_for_extent(grid.lat, grid.lon)
+    center = st.session_state.get("map_center") or [float(grid.lat.mean()), float(grid.lon.mean())]
+    used_zoom, cells = grid.clusters(zoom)
+    m = folium.Map(center, zoom_start=zoom, tiles="CartoDB dark_matter")
+
+    add_cluster_layers(m, cells, data)
+    return m, used_zoom, len(cells["count"])
 
 # --- 5. SIDEBAR CONTROLS ---
 with st.sidebar:
@@ -182,9 +491,22 @@ with st.sidebar:
     
     st.caption("SYSTEM CONTROL")
     auto_refresh = st.toggle("Live Data Stream", value=True)
+    viewport_mode = st.toggle("🗺️ Sector View", value=False, help="Only load reports inside the map area being worked (plus a margin). Pan or zoom out to load more.")
+    if st.button("🔄 Full Resync"):
+        st.session_state.pop("intel_view", None)
+        st.session_state.pop("intel_cursor", None)
     
     st.markdown("---")
     st.info(f"**Status:** Online\n\n**Node:** HQ-Alpha\n\n**Lat:** 28.61 | **Lon:** 77.20")
+    cache_stats = intel_cache.stats()
+    st.caption(f"🧠 Intel cache: {cache_stats['entries']} reports · {cache_stats['hits'] + cache_stats['disk_hits']} hits / {cache_stats['misses']} misses")
+    st.caption(f"🧠 Urgency model ({ai_model.backend_name}): {ai_model.status()}")
+    failed = decrypt_stage.stats["failed"]
+    st.caption(f"🔓 Decrypted: {decrypt_stage.stats['ok']} reports · {sum(failed.values())} failed"
+               + (" (" + ", ".join(f"{n} {reason}" for reason, n in failed.most_common()) + ")" if failed else ""))
+    if failed:
+        with st.expander("⚠️ Unreadable reports"):
+            for point_id, reason in reversed(decrypt_stage.recent_failures): st.caption(f"{point_id} · {reason}")
 
 # --- 6. MAIN DASHBOARD UI ---
 
@@ -199,7 +521,8 @@ with c_head_2:
 st.markdown('</div>', unsafe_allow_html=True)
 
 # Fetch Data
-data_raw = fetch_intelligence_batch(limit=50)
+data_raw = fetch_intelligence_batch(limit=50, sector=current_sector() if viewport_mode else None)
+if viewport_mode: record_all_sectors(limit=50)
 # Apply Slider Filter
 data = [d for d in data_raw if d['score'] >= min_urgency]
 
@@ -222,31 +545,32 @@ with tab_ops:
     with col_map:
         st.subheader("📍 Geospatial Grid")
         if data:
-            avg_lat = np.mean([d['lat'] for d in data])
-            avg_lon = np.mean([d['lon'] for d in data])
-            m = folium.Map([avg_lat, avg_lon], zoom_start=15, tiles="CartoDB dark_matter")
-            
-            # Heatmap
-            HeatMap([[d['lat'], d['lon'], d['score']*15] for d in data], radius=18, blur=12).add_to(m)
-            
-            # Cluster Markers
-            mc = MarkerCluster().add_to(m)
-            for d in data:
-                color = "red" if d['score'] > 0.6 else "orange" if d['score'] > 0.3 else "green"
-                folium.Marker(
-                    [d['lat'], d['lon']],
-                    popup=f"ID: {d['id']}<br>Score: {int(d['score']*100)}%",
-                    icon=folium.Icon(color=color, icon="info-sign")
-                ).add_to(mc)
-            
-            st_folium(m, height=650, use_container_width=True)
+            m, used_zoom, n_cells = build_map(data)
+            st.caption(f"🗺️ {len(data)} reports in {n_cells} map cells (zoom {used_zoom})")
         else:
-            m = folium.Map([28.61, 77.20], zoom_start=4, tiles="CartoDB dark_matter")
-            st_folium(m, height=650, use_container_width=True)
+            # Empty sector: keep the operator's view so they can pan to where reports are
+            m = folium.Map(st.session_state.get("map_center") or [28.61, 77.20], zoom_start=st.session_state.get("map_zoom") or 4,
+                           tiles="CartoDB dark_matter")
+        view_state = st_folium(m, height=650, use_container_width=True, returned_objects=["zoom", "center", "bounds"])
+        if view_state and view_state.get("zoom"): # Re-bin (and in sector view, re-query) for the operator's view on the next run
+            st.session_state["map_zoom"] = view_state["zoom"]
+            if view_state.get("center"): st.session_state["map_center"] = [view_state["center"]["lat"], view_state["center"]["lng"]]
+            if view_state.get("bounds"): st.session_state["map_bounds"] = view_state["bounds"]
 
     with col_feed:
         st.subheader(f"📨 Incoming Feeds ({len(data)})")
         
+        with st.expander("🔎 Find reports like this"):
+            query = st.text_input("Describe the situation", placeholder="e.g. family trapped on a roof, water rising", key="semantic_query")
+            if query and not ai_model.ready:
+                st.info(f"🧠 Language model {ai_model.status()}, search opens when it is ready.")
+            elif query:
+                try:
+                    for match, similarity in semantic_search(query):
+                        st.markdown(f"**{match['id']}** · {int(similarity*100)}% match · Urgency {int(match['score']*100)}%  \n{match['text']}")
+                except Exception as e:
+                    st.error(f"Search failed: {e}")
+
         if not data:
             st.info("No active distress signals detected in sector.")
             
@@ -261,7 +585,7 @@ with tab_ops:
                 <div style="display:flex; justify-content:space-between; align-items:center;">
                     <span style="font-weight:bold; color:white; font-family:monospace;">{icon} {report['id']}</span>
                     <span style="background:#21262d; padding:2px 8px; border-radius:12px; font-size:0.8em; border:1px solid #30363d;">
-                        Urgency: {score_pct}%
+                        Urgency: {"⏳ scoring" if report.get('pending') else f"{score_pct}%"}
                     </span>
                 </div>
                 <div class="body-text">{report['text']}</div>
@@ -273,15 +597,16 @@ with tab_ops:
             
             # Action Panel
             with st.expander(f"🛠️ Deploy Response #{i+1}"):
-                if report.get('audio'):
-                    st.caption("🎙️ Voice Transmission")
-                    try: st.audio(base64.b64decode(report['audio']), format='audio/wav')
-                    except: st.error("Audio Corrupted")
-                
-                if report.get('img'):
-                    st.caption("📷 Visual Assessment")
-                    try: st.image(base64.b64decode(report['img']), use_container_width=True)
-                    except: st.error("Image Corrupted")
+                # Media (content-addressed blobs or legacy inline fields) is only decrypted once the operator asks for it
+                kinds = list(report.get('media') or {}) + report.get('inline_media', [])
+                if kinds:
+                    opened = st.session_state.setdefault("media_open", set())
+                    if report['point_id'] not in opened:
+                        if st.button(f"📎 Load attachments ({', '.join(kinds)})", key=f"media_{report['point_id']}_{i}"):
+                            opened.add(report['point_id'])
+                    if report['point_id'] in opened:
+                        if report.get('inline_media'): show_inline_media(report['raw_payload'])
+                        if report.get('media'): show_media(report['media'])
 
                 # --- REPLY MULE (STABLE) ---
                 # ✅ KEY FIX: Added '_{i}' to ensure absolute uniqueness even with duplicate data
@@ -298,15 +623,17 @@ with tab_ops:
                         payload = json.dumps({"target_id": report['id'], "msg": msg, "timestamp": time.time()})
                         enc = cipher.encrypt(payload.encode()).decode()
                         
+                        # Plain timestamp / location let mules fetch only new orders for their area
                         point = models.PointStruct(
                             id=int(time.time()*1000),
                             vector=[0.0] * 384,
-                            payload={"secure_content": enc, "target_id": report['id']}
+                            payload={"secure_content": enc, "target_id": report['id'], "timestamp": time.time(),
+                                     "target_location": {"lat": report['lat'], "lon": report['lon']}}
                         )
 
                         try:
                             if not client.collection_exists(DOWNLINK_COLLECTION):
-                                client.create_collection(DOWNLINK_COLLECTION, vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE))
+                                create_downlink_collection()
                             
                             client.upsert(collection_name=DOWNLINK_COLLECTION, points=[point])
                             st.toast(f"✅ Orders dispatched to {report['id']}!", icon="🐎")
@@ -315,30 +642,41 @@ with tab_ops:
                             # Auto-Fix Schema
                             if "Wrong input" in str(e) or "Not existing vector" in str(e):
                                 client.delete_collection(DOWNLINK_COLLECTION)
-                                client.create_collection(DOWNLINK_COLLECTION, vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE))
+                                create_downlink_collection()
                                 client.upsert(collection_name=DOWNLINK_COLLECTION, points=[point])
                                 st.toast(f"✅ System Self-Repaired & Sent!", icon="🔧")
                             else:
                                 st.error(f"Failed: {e}")
 
 # === TAB 2: ANALYTICS ===
+# Read from the columnar report store: the whole mission, not just the reports in view
+# (in Sector View, record_all_sectors() fills in the other sectors page by page)
 with tab_analytics:
     st.header("📊 Threat Analytics")
-    if data:
-        df = pd.DataFrame(data)
-        df['datetime'] = pd.to_datetime(df['time'], unit='s')
-        
+    if len(report_store):
+        WINDOWS = {"15 min": 900, "1 hour": 3600, "6 hours": 21600, "1 day": 86400}
+        LOOKBACK = {"Last 24 hours": 86400, "Last 7 days": 7 * 86400, "Whole mission": None}
+        fc1, fc2 = st.columns(2)
+        window = fc1.selectbox("Time window", list(WINDOWS), index=1)
+        lookback = fc2.selectbox("Period", list(LOOKBACK), index=2)
+        since = time.time() - LOOKBACK[lookback] if LOOKBACK[lookback] else None
+        timeline = report_store.timeline(WINDOWS[window], since=since)
+
         ac1, ac2 = st.columns(2)
         with ac1:
             st.subheader("Urgency Over Time")
-            st.area_chart(df.set_index('datetime')[['score']], color="#ff4b4b")
+            if timeline is not None and len(timeline):
+                st.area_chart(timeline[['mean_urgency', 'max_urgency']], color=["#ffa421", "#ff4b4b"])
+                st.bar_chart(timeline[['reports', 'critical']])
         with ac2:
             st.subheader("Threat Level Distribution")
-            df['Level'] = pd.cut(df['score'], bins=[0, 0.3, 0.6, 1.0], labels=["Low", "Medium", "Critical"])
-            st.bar_chart(df['Level'].value_counts())
+            st.bar_chart(pd.Series(report_store.level_counts(since=since), name="count"))
             
         st.subheader("Detailed Metrics")
-        st.dataframe(df[['id', 'score', 'lat', 'lon', 'datetime']], use_container_width=True)
+        st.caption(f"{len(report_store)} reports on record · latest 500 shown")
+        if viewport_mode and not st.session_state.get("record_pass", {}).get("cursor"):
+            st.caption("⏳ Sector View: reports outside the sector are still being recorded")
+        st.dataframe(report_store.latest(500), use_container_width=True)
     else:
         st.info("Insufficient data for analytics generation.")
 
@@ -346,17 +684,27 @@ with tab_analytics:
 with tab_export:
     st.header("💾 Blackbox Data Retrieval")
     st.write("Download encrypted packet logs for offline analysis or government reporting.")
-    if data:
-        df_export = pd.DataFrame(data)
-        df_clean = df_export.drop(columns=['img', 'audio', 'raw_payload'], errors='ignore')
-        csv = df_clean.to_csv(index=False).encode('utf-8')
-        
-        st.download_button(
-            label="📥 Download Mission Log (CSV)",
-            data=csv,
-            file_name=f"mission_log_{int(time.time())}.csv",
-            mime="text/csv",
-        )
+    if len(report_store):
+        if st.button(f"📦 Build Mission Log ({len(report_store)} reports, CSV)"):
+            st.session_state['paused'] = True
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            out = os.path.join(EXPORT_DIR, f"mission_log_{int(time.time())}.csv")
+            with st.spinner("Writing mission log..."):
+                rows = report_store.export_csv(out) # Streamed batch by batch, never all in memory
+            st.session_state["last_export"] = out
+            st.success(f"✅ {rows} reports written to `{out}`")
+        out = st.session_state.get("last_export")
+        if out and os.path.exists(out):
+            if os.path.getsize(out) <= EXPORT_DOWNLOAD_MAX:
+                with open(out, "rb") as f:
+                    st.download_button(
+                        label="📥 Download Mission Log (CSV)",
+                        data=f,
+                        file_name=os.path.basename(out),
+                        mime="text/csv",
+                    )
+            else:
+                st.info(f"📁 Export is {os.path.getsize(out) / 1024 / 1024:.0f} MB: collect it from `{out}` on the HQ node.")
     else:
         st.warning("No data available to export.")
 
@@ -0,0 +1,121 @@
+"""Batch decryption of report payloads for the HQ dashboard.
+
+A page of scrolled points is split into batches that a pool of worker
+processes decrypts in parallel (Fernet HMAC + AES and the JSON parse are CPU
+work that threads would serialise on the GIL). Each worker gets the HQ key once,
+when it starts, so only ciphertext goes out and decoded reports come back.
+
+Workers drop the inline "image" / "audio" fields of legacy reports and only
+note that they were there ("inline_media"): the feed never shows them until an
+operator opens a report, so they are decrypted again on demand instead of being
+copied back and kept in the session for every report.
+
+Nothing is dropped silently: every payload that fails to open is counted by
+reason (bad_token, bad_envelope, bad_json) in DecryptStage.stats, with the most
+recent ones kept for the dashboard.
+"""
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from payload_codec import open_envelope
+
+INLINE_MEDIA = ("image", "audio")
+_cipher = None # Per worker process
+
+
+def open_report(cipher, token, keep_media=False):
+    """Decrypts one report. Returns (report dict, None) or (None, failure reason)."""
+    try:
+        raw = cipher.decrypt(token.encode())
+    except (InvalidToken, TypeError, AttributeError):
+        return None, "bad_token" # Tampered, truncated or sealed with another key
+    try:
+        raw = open_envelope(raw)
+    except (ValueError, zlib.error):
+        return None, "bad_envelope"
+    try:
+        doc = json.loads(raw)
+    except ValueError:
+        return None, "bad_json"
+    if not isinstance(doc, dict): return None, "bad_json"
+    if not keep_media:
+        inline = [k for k in INLINE_MEDIA if doc.pop(k, None)]
+        if inline: doc["inline_media"] = inline
+    return doc, None
+
+
+def _init_worker(key):
+    global _cipher
+    _cipher = Fernet(key)
+
+
+def _open_batch(tokens):
+    return [open_report(_cipher, t) for t in tokens]
+
+
+class DecryptStage:
+    def __init__(self, key, workers=None, batch_size=16, recent_failures=50):
+        self.cipher = Fernet(key)
+        self.key = key
+        self.workers = workers if workers is not None else min(4, os.cpu_count() or 1)
+        self.batch_size = batch_size
+        self.stats = {"ok": 0, "failed": Counter(), "batches": 0, "seconds": 0.0, "pool_errors": 0}
+        self.recent_failures = deque(maxlen=recent_failures) # (point id, reason)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking the threaded dashboard process is not safe
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker, initargs=(self.key,))
+            return self._pool
+
+    def run(self, tokens, ids=None):
+        """Decrypts `tokens` (secure_content strings). Returns a list aligned
+        with them: the report dict, or None where it failed (counted in stats
+        under its reason, with the matching entry of `ids`)."""
+        t0 = time.perf_counter()
+        batches = [tokens[i:i + self.batch_size] for i in range(0, len(tokens), self.batch_size)]
+        if self.workers > 1 and len(batches) > 1:
+            try:
+                opened = [r for batch in self._executor().map(_open_batch, batches) for r in batch]
+            except Exception: # Broken pool (worker killed, or workers cannot start): decrypt here
+                self.close()
+                self.stats["pool_errors"] += 1
+                if self.stats["pool_errors"] >= 3: self.workers = 1 # Keeps failing: stay inline
+                opened = [open_report(self.cipher, t) for t in tokens]
+        else:
+            opened = [open_report(self.cipher, t) for t in tokens]
+
+        out = []
+        with self._lock:
+            for i, (doc, reason) in enumerate(opened):
+                if reason:
+                    self.stats["failed"][reason] += 1
+                    self.recent_failures.append((ids[i] if ids else None, reason))
+                else:
+                    self.stats["ok"] += 1
+                out.append(doc)
+            self.stats["batches"] += len(batches)
+            self.stats["seconds"] += time.perf_counter() - t0
+        return out
+
+    def failures(self):
+        with self._lock:
+            return sum(self.stats["failed"].values())
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
@@ -0,0 +1,141 @@
+"""Ingest-time duplicate detection for the mule: a bounded digest index.
+
+    mule_dedup/
+        recent.bin     16-byte digest prefixes, append-only (trimmed on open)
+        bloom.bin      the two rolling Bloom generations + suppressed counter
+
+Lookups check an exact set of the `recent` newest digests first (lost ACKs
+and re-broadcasts to several mules arrive within minutes), then two rolling
+Bloom generations that remember roughly the last 2 x `bloom_capacity` packets
+in a few MB. When the current generation is full it becomes the previous one
+and the oldest is dropped, so memory stays flat however long the mule runs.
+
+A Bloom false positive would drop a packet that is not really a duplicate, so
+the generations run at a 1e-6 error rate. recent.bin is replayed into the
+current generation on open, which covers anything added since the last
+bloom.bin snapshot.
+"""
+import os
+import struct
+import threading
+from collections import deque
+
+from bloom import BloomFilter
+
+DIGEST_BYTES = 16
+STATE = struct.Struct("!QII") # suppressed, added to current generation, previous generation length
+
+
+class DigestIndex:
+    def __init__(self, path, recent=100_000, bloom_capacity=1_000_000, error_rate=1e-6):
+        self.path = path
+        self.recent = recent
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.snapshot_every = max(1, recent // 2) # recent.bin must cover every add since the snapshot
+        self.suppressed = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self._current = BloomFilter.for_capacity(bloom_capacity, error_rate)
+        self._previous = None
+        self._in_current = 0
+        self._since_snapshot = 0
+        self._load_blooms()
+
+        self._set, self._fifo = set(), deque()
+        for d in self._load_recent():
+            self._remember(d)
+            self._current.add(d) # Replays adds newer than the snapshot (idempotent for older ones)
+        self._recent_file = open(self._file("recent.bin"), "ab")
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # --- persistence ---
+    def _load_recent(self):
+        try:
+            with open(self._file("recent.bin"), "rb") as f: raw = f.read()
+        except OSError:
+            return []
+        raw = raw[:len(raw) - len(raw) % DIGEST_BYTES] # Torn tail
+        digests = [raw[i:i + DIGEST_BYTES] for i in range(0, len(raw), DIGEST_BYTES)][-self.recent:]
+        if len(raw) // DIGEST_BYTES > self.recent: # Trim, keep the newest
+            self._write_atomic("recent.bin", b"".join(digests))
+        return digests
+
+    def _load_blooms(self):
+        try:
+            with open(self._file("bloom.bin"), "rb") as f: raw = f.read()
+            self.suppressed, self._in_current, prev_len = STATE.unpack(raw[:STATE.size])
+            pos = STATE.size
+            if prev_len:
+                self._previous = BloomFilter.from_bytes(raw[pos:pos + prev_len])
+                pos += prev_len
+            current = BloomFilter.from_bytes(raw[pos:])
+            if (current.bits, current.hashes) == (self._current.bits, self._current.hashes):
+                self._current = current
+            else: # Sized differently (config change): start a fresh generation
+                self._previous, self._in_current = current, 0
+        except (OSError, ValueError, struct.error):
+            self.suppressed, self._in_current, self._previous = 0, 0, None
+
+    def _snapshot(self):
+        prev = self._previous.to_bytes() if self._previous else b""
+        self._write_atomic("bloom.bin", STATE.pack(self.suppressed, self._in_current, len(prev))
+                           + prev + self._current.to_bytes())
+        self._since_snapshot = 0
+
+    def _write_atomic(self, name, data):
+        tmp = self._file(name) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._file(name))
+
+    # --- index ---
+    def _remember(self, d):
+        self._set.add(d)
+        self._fifo.append(d)
+        if len(self._fifo) > self.recent:
+            self._set.discard(self._fifo.popleft())
+
+    def seen(self, digest):
+        """True if a packet with this digest was added before."""
+        d = digest[:DIGEST_BYTES]
+        with self._lock:
+            return d in self._set or d in self._current or (self._previous is not None and d in self._previous)
+
+    def add(self, digest):
+        """Records a stored packet. Call after it is safely in the packet log."""
+        d = digest[:DIGEST_BYTES]
+        with self._lock:
+            if d in self._set: return
+            self._remember(d)
+            self._recent_file.write(d)
+            self._recent_file.flush()
+            self._current.add(d)
+            self._in_current += 1
+            if self._in_current >= self.bloom_capacity: # Roll the generations
+                self._previous = self._current
+                self._current = BloomFilter.for_capacity(self.bloom_capacity, self.error_rate)
+                self._in_current = 0
+                self._snapshot()
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.snapshot_every: self._snapshot()
+            if self._recent_file.tell() > 2 * self.recent * DIGEST_BYTES: # Keep recent.bin bounded
+                self._recent_file.close()
+                self._write_atomic("recent.bin", b"".join(self._fifo))
+                self._recent_file = open(self._file("recent.bin"), "ab")
+
+    def count_duplicate(self):
+        with self._lock:
+            self.suppressed += 1
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.snapshot_every: self._snapshot()
+
+    def close(self):
+        with self._lock:
+            self._snapshot()
+            self._recent_file.close()
@@ -0,0 +1,105 @@
+"""Background Mule discovery for the survivor app.
+
+A daemon thread listens for Mule beacons on UDP 5005 and keeps a table of the
+Mules heard recently. A Mule that stays silent for `ttl` seconds (a few missed
+beacons) drops out. Picking a Mule is then a table lookup, not a 3 s scan.
+
+Beacons look like
+
+    {"role": "mule_uplink", "ip": ..., "port": 6008,
+     "id": <mule id>, "load": 0.25, "free_mb": 5120, "queue": 42}
+
+`load` is the share of session slots in use, `free_mb` the free disk space for
+the packet log and `queue` the packets still waiting for cloud sync. Beacons
+from older Mules carry only role / ip / port and rank after the ones that
+report their state.
+"""
+import json
+import socket
+import threading
+import time
+
+BEACON_PORT = 5005
+BEACON_TTL_S = 6.0  # Mules beacon every 2 s
+MIN_FREE_MB = 64    # Below this a Mule is treated as full
+
+
+def rank(beacon):
+    """Sort key, best Mule first: has room, least loaded, shortest queue, most space."""
+    load = beacon.get("load")
+    free = beacon.get("free_mb")
+    return (free is not None and free < MIN_FREE_MB,
+            load is None,
+            round(load or 0.0, 1), # Treat near-equal loads as equal...
+            beacon.get("queue") or 0, # ...and prefer the Mule with less to sync
+            -(free or 0))
+
+
+class MuleDirectory:
+    def __init__(self, port=BEACON_PORT, ttl=BEACON_TTL_S):
+        self.port = port
+        self.ttl = ttl
+        self.error = None # Last socket error, e.g. port busy
+        self._mules = {} # (role, ip, port) -> (last heard, beacon)
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen, daemon=True)
+            self._thread.start()
+        return self
+
+    def _socket(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"): # Share the port with other listeners
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        s.bind(('', self.port))
+        s.settimeout(1)
+        return s
+
+    def _listen(self):
+        while True:
+            try:
+                with self._socket() as s:
+                    self.error = None
+                    while True:
+                        try:
+                            msg, addr = s.recvfrom(2048)
+                        except socket.timeout:
+                            continue
+                        try:
+                            self.observe(json.loads(msg.decode()))
+                        except (ValueError, AttributeError): pass # Not a beacon
+            except OSError as e:
+                self.error = str(e)
+                time.sleep(5)
+
+    def observe(self, beacon, now=None):
+        """Records one beacon."""
+        role, ip, port = beacon.get("role"), beacon.get("ip"), beacon.get("port")
+        if not role or not ip or not isinstance(port, int): return
+        with self._cond:
+            self._mules[(role, ip, port)] = (now or time.time(), beacon)
+            self._cond.notify_all()
+
+    def mules(self, role, now=None):
+        """Live Mules for `role`, best first."""
+        cutoff = (now or time.time()) - self.ttl
+        with self._cond:
+            for key in [k for k, (seen, _) in self._mules.items() if seen < cutoff]:
+                del self._mules[key]
+            live = [b for (r, _, _), (_, b) in self._mules.items() if r == role]
+        return sorted(live, key=rank)
+
+    def best(self, role, wait=0):
+        """(ip, port) of the best live Mule for `role`, or (None, None). Waits up
+        to `wait` seconds only if no Mule has been heard yet."""
+        deadline = time.time() + wait
+        while True:
+            live = self.mules(role)
+            if live: return live[0]["ip"], live[0]["port"]
+            remaining = deadline - time.time()
+            if remaining <= 0: return None, None
+            with self._cond: self._cond.wait(remaining)
@@ -0,0 +1,114 @@
+"""Grid aggregation of report locations for the HQ map.
+
+Reports are binned into square lat/lon cells whose size follows the map zoom
+(about CELLS_PER_TILE cells across one 256 px web-map tile), all in NumPy. Each
+occupied cell becomes one cluster summary: count, centroid, mean / max urgency,
+number of critical reports and the most urgent report in it. If a zoom level
+yields more cells than the feature cap, the next coarser level is used, so the
+browser never gets more than `max_features` map features whatever the volume.
+
+GridPyramid keeps the summaries per zoom level, computed on first use, so
+panning and zooming over the same data does not re-bin it.
+"""
+import math
+
+import folium
+import numpy as np
+from folium.plugins import HeatMap
+
+CELLS_PER_TILE = 8
+CRITICAL = 0.6
+
+
+def cell_deg(zoom):
+    """Cell edge in degrees at a web-map zoom level."""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def zoom_for_extent(lat, lon, lo=2, hi=16):
+    """Zoom level at which the points roughly fill one map view."""
+    if len(lat) == 0: return lo
+    span = max(float(np.ptp(lat)), float(np.ptp(lon)), 1e-4)
+    return int(max(lo, min(hi, math.floor(math.log2(360.0 / span)) - 1)))
+
+
+def bin_points(lat, lon, score, zoom):
+    """Aggregates points into the zoom's grid. Returns a dict of per-cell arrays
+    (sorted by max urgency, most urgent first)."""
+    size = cell_deg(zoom)
+    ix = np.floor((lon + 180.0) / size).astype(np.int64)
+    iy = np.floor((lat + 90.0) / size).astype(np.int64)
+    keys = iy * (int(360.0 / size) + 1) + ix
+    _, inverse, count = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    n = len(count)
+    score_sum = np.bincount(inverse, weights=score, minlength=n)
+    # Most urgent point per cell: first of each cell once sorted by (cell, -score)
+    order = np.lexsort((-score, inverse))
+    top = order[np.searchsorted(inverse[order], np.arange(n))]
+    score_max = score[top]
+    cells = {
+        "count": count,
+        "lat": np.bincount(inverse, weights=lat, minlength=n) / count,
+        "lon": np.bincount(inverse, weights=lon, minlength=n) / count,
+        "score_mean": score_sum / count,
+        "score_sum": score_sum,
+        "score_max": score_max,
+        "critical": np.bincount(inverse, weights=(score > CRITICAL).astype(np.float64), minlength=n).astype(np.int64),
+        "top": top,
+    }
+    rank = np.argsort(-cells["score_max"], kind="stable")
+    return {k: v[rank] for k, v in cells.items()}
+
+
+class GridPyramid:
+    def __init__(self, lat, lon, score, max_features=500):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.score = np.asarray(score, dtype=np.float64)
+        self.max_features = max_features
+        self._levels = {}
+
+    def __len__(self):
+        return len(self.lat)
+
+    def level(self, zoom):
+        if zoom not in self._levels:
+            self._levels[zoom] = bin_points(self.lat, self.lon, self.score, zoom)
+        return self._levels[zoom]
+
+    def clusters(self, zoom):
+        """(zoom actually used, cells) with at most max_features cells."""
+        zoom = int(zoom)
+        while zoom > 0 and len(self.level(zoom)["count"]) > self.max_features:
+            zoom -= 1
+        cells = self.level(zoom)
+        if len(cells["count"]) > self.max_features: # Even the whole world is too busy: keep the most urgent
+            cells = {k: v[:self.max_features] for k, v in cells.items()}
+        return zoom, cells
+
+
+def add_cluster_layers(m, cells, reports):
+    """Draws clusters on a folium map: a heatmap point per cell, a marker for
+    single reports and a sized circle with a summary popup for the rest.
+    `reports` are the dicts the cells were built from (for IDs / popups)."""
+    HeatMap(np.column_stack([cells["lat"], cells["lon"], cells["score_sum"] * 15]).tolist(),
+            radius=18, blur=12).add_to(m)
+    for j in range(len(cells["count"])):
+        count, worst = int(cells["count"][j]), float(cells["score_max"][j])
+        color = "red" if worst > 0.6 else "orange" if worst > 0.3 else "green"
+        top = reports[int(cells["top"][j])]
+        if count == 1:
+            folium.Marker(
+                [top['lat'], top['lon']],
+                popup=f"ID: {top['id']}<br>Score: {int(top['score']*100)}%",
+                icon=folium.Icon(color=color, icon="info-sign")
+            ).add_to(m)
+        else:
+            folium.CircleMarker(
+                [float(cells["lat"][j]), float(cells["lon"][j])], radius=6 + 3 * math.log2(count),
+                color=color, fill=True, fill_opacity=0.6,
+                popup=(f"<b>{count} reports</b><br>🚨 {int(cells['critical'][j])} critical"
+                       f"<br>Avg urgency {int(cells['score_mean'][j]*100)}% · max {int(worst*100)}%"
+                       f"<br>Most urgent: {top['id']}"),
+            ).add_to(m)
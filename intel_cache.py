@@ -0,0 +1,91 @@
+"""Cache of per-report model work for the HQ dashboard.
+
+Entries hold the decrypted text, the sentence embedding and the urgency score
+of one report, keyed by a hash of its encrypted content. A hot LRU tier lives in
+memory; an optional SQLite tier keeps entries across restarts. Disk entries are
+Fernet-encrypted with the HQ key, so survivor text never sits on disk in clear.
+"""
+import base64
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_key(secure_content, namespace=""):
+    """Cache key for a report: changes whenever its ciphertext (or the scoring
+    setup in `namespace`) changes."""
+    return hashlib.sha256(f"{namespace}|{secure_content}".encode()).hexdigest()
+
+
+class IntelCache:
+    def __init__(self, capacity=5000, disk_path=None, cipher=None):
+        self.capacity = capacity
+        self.cipher = cipher
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        self._db = None
+        if disk_path and cipher:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS intel (key TEXT PRIMARY KEY, blob BLOB)")
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._mem)
+
+    # --- encoding for the disk tier ---
+    def _pack(self, entry):
+        doc = dict(entry, embedding=base64.b64encode(entry["embedding"].astype(np.float32).tobytes()).decode())
+        return self.cipher.encrypt(json.dumps(doc).encode())
+
+    def _unpack(self, blob):
+        doc = json.loads(self.cipher.decrypt(blob).decode())
+        doc["embedding"] = np.frombuffer(base64.b64decode(doc["embedding"]), dtype=np.float32)
+        return doc
+
+    def _remember(self, key, entry):
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.capacity:
+            self._mem.popitem(last=False)
+
+    def get_many(self, keys):
+        """Returns {key: entry} for every key found in memory or on disk."""
+        found, missing = {}, []
+        with self._lock:
+            for k in keys:
+                if k in self._mem:
+                    self._mem.move_to_end(k)
+                    found[k] = self._mem[k]
+                else:
+                    missing.append(k)
+            self.hits += len(found)
+            if self._db is not None and missing:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, blob FROM intel WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                    for k, blob in rows:
+                        try: entry = self._unpack(blob)
+                        except Exception: continue # Written with another key: treat as a miss
+                        self._remember(k, entry)
+                        found[k] = entry
+                        self.disk_hits += 1
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries):
+        """Stores {key: {"text", "embedding", "score", "media", "inline_media"}}."""
+        with self._lock:
+            for k, entry in entries.items(): self._remember(k, entry)
+            if self._db is not None and entries:
+                self._db.executemany("INSERT OR REPLACE INTO intel (key, blob) VALUES (?, ?)",
+                                     [(k, self._pack(e)) for k, e in entries.items()])
+                self._db.commit()
+
+    def stats(self):
+        return {"entries": len(self._mem), "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
@@ -0,0 +1,82 @@
+"""Content-addressed, separately encrypted media blobs (photos, voice notes).
+
+A report no longer carries its media inline. Each attachment is encrypted on
+its own and travels as a "blob" packet; the report only references it:
+
+    blob packet: {"type": "blob", "blob_id": <sha256 of token>, "kind": "image", "secure_blob": <Fernet token>}
+    report text: {..., "media": {"image": <blob_id>, "audio": <blob_id>}}
+
+The blob ID is the hash of the ciphertext, so the mule and the cloud can check
+integrity without the key, and the same attachment is stored only once.
+"""
+import hashlib
+import os
+import threading
+import uuid
+
+MEDIA_COLLECTION = "media_blobs"
+
+
+def blob_id_of(token):
+    return hashlib.sha256(token).hexdigest()
+
+
+def seal_blob(cipher, data, kind):
+    """Encrypts raw media bytes and returns the blob packet."""
+    token = cipher.encrypt(data)
+    return {"type": "blob", "blob_id": blob_id_of(token), "kind": kind, "secure_blob": token.decode()}
+
+
+def verify_blob(packet):
+    """True if the packet's ciphertext matches its content address."""
+    token = packet.get("secure_blob")
+    return bool(token) and blob_id_of(token.encode()) == packet.get("blob_id")
+
+
+def blob_point_id(blob_id):
+    """Qdrant point ID of a blob: the first 128 bits of its hash."""
+    return str(uuid.UUID(hex=blob_id[:32]))
+
+
+class BlobCache:
+    """Bounded on-disk LRU of (still encrypted) blobs, one file per blob ID."""
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, blob_id):
+        return os.path.join(self.path, blob_id)
+
+    def get(self, blob_id):
+        path = self._file(blob_id)
+        try:
+            with open(path, "rb") as f: token = f.read()
+        except OSError:
+            return None
+        if blob_id_of(token) != blob_id: # Corrupted on disk
+            os.remove(path)
+            return None
+        os.utime(path) # Touch: most recently used
+        return token
+
+    def put(self, blob_id, token):
+        if blob_id_of(token) != blob_id: raise ValueError("blob does not match its id")
+        with self._lock:
+            tmp = self._file(blob_id) + ".tmp"
+            with open(tmp, "wb") as f: f.write(token)
+            os.replace(tmp, self._file(blob_id))
+            self._evict()
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"): continue
+            st = os.stat(self._file(name))
+            files.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes: break
+            os.remove(self._file(name))
+            total -= size
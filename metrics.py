@@ -0,0 +1,202 @@
+"""Runtime metrics for the mule: counters, gauges, histograms and timing spans.
+
+    reg = Registry("mule")
+    reg.counter("packets_total", "Packets received").inc(result="stored")
+    with reg.span("upsert", collection="disaster_reports"): ...   # -> mule_upsert_seconds
+    reg.serve(6011)   # GET /metrics (Prometheus text), /metrics.json
+
+Everything is in-process and thread-safe, with no dependencies: the mule's
+threads and event loops update it directly, and a small HTTP server thread
+renders it on request. Gauges can take a callback (backlog depth, inbox size)
+so they are read only when scraped. error() replaces silent `except: pass`:
+it counts the failure by where / exception type, keeps the last few for
+/metrics.json and logs it.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name, self.help = name, help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, n=1, **labels):
+        key = _key(labels)
+        with self._lock: self._values[key] = self._values.get(key, 0) + n
+
+    def value(self, **labels):
+        with self._lock: return self._values.get(_key(labels), 0)
+
+    def samples(self):
+        with self._lock: return [(self.name, key, v) for key, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, help="", fn=None):
+        super().__init__(name, help)
+        self.fn = fn # Read at scrape time
+
+    def set(self, value, **labels):
+        with self._lock: self._values[_key(labels)] = value
+
+    def samples(self):
+        if self.fn is not None:
+            try: self.set(self.fn())
+            except Exception: pass # Source not ready yet (e.g. log not opened): keep the last value
+        return super().samples()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self._series = {} # label key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None: s = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[i] += 1
+                    break
+            else:
+                s[len(self.buckets)] += 1
+            s[-1] += value
+
+    def summary(self, **labels):
+        """{"count", "sum", "mean"} for one label set."""
+        with self._lock: s = list(self._series.get(_key(labels)) or [0] * (len(self.buckets) + 1) + [0.0])
+        count = sum(s[:-1])
+        return {"count": count, "sum": s[-1], "mean": s[-1] / count if count else 0.0}
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, s in self._series.items():
+                running = 0
+                for bound, n in zip(self.buckets + ("+Inf",), s[:-1]):
+                    running += n
+                    out.append((self.name + "_bucket", key + (("le", str(bound)),), running))
+                out.append((self.name + "_sum", key, s[-1]))
+                out.append((self.name + "_count", key, running))
+        return out
+
+
+class Registry:
+    def __init__(self, namespace="", recent_errors=20):
+        self.prefix = namespace + "_" if namespace else ""
+        self.started = time.time()
+        self.recent_errors = deque(maxlen=recent_errors) # (time, where, error)
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kw):
+        name = self.prefix + name
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None: m = self._metrics[name] = cls(name, help, **kw)
+            return m
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help="", fn=None):
+        return self._get(Gauge, name, help, fn=fn)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Times the block into <name>_seconds; an exception also counts in
+        <name>_errors_total and is re-raised."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.counter(name + "_errors_total", f"Failed {name} spans").inc(error=type(e).__name__, **labels)
+            raise
+        finally:
+            self.histogram(name + "_seconds", f"Duration of {name}").observe(time.perf_counter() - t0, **labels)
+
+    def error(self, where, exc, log=True):
+        """Counts (and by default prints) an exception that is handled and survived."""
+        self.counter("errors_total", "Handled exceptions by place and type").inc(where=where, error=type(exc).__name__)
+        self.recent_errors.append((time.time(), where, repr(exc)))
+        if log: print(f"⚠️ [{where}] {type(exc).__name__}: {exc}")
+
+    # --- rendering ---
+    def prometheus(self):
+        lines = []
+        with self._lock: metrics = list(self._metrics.values())
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, key, value in m.samples():
+                lines.append(f"{name}{_fmt_labels(key)} {value}")
+        lines.append(f"# TYPE {self.prefix}uptime_seconds gauge")
+        lines.append(f"{self.prefix}uptime_seconds {time.time() - self.started:.1f}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """JSON-friendly view: {metric: [{"labels", "value"}]} plus recent errors."""
+        with self._lock: metrics = list(self._metrics.values())
+        out = {"uptime_s": round(time.time() - self.started, 1), "metrics": {},
+               "recent_errors": [{"time": t, "where": w, "error": e} for t, w, e in self.recent_errors]}
+        for m in metrics:
+            for name, key, value in m.samples():
+                out["metrics"].setdefault(name, []).append({"labels": dict(key), "value": value})
+        return out
+
+    # --- HTTP endpoint ---
+    def serve(self, port, host="127.0.0.1"):
+        """Serves /metrics and /metrics.json from a daemon thread. Returns the server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, ctype = json.dumps(registry.snapshot()).encode(), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, ctype = registry.prometheus().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args): pass # Scrapes are not news
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+        return server
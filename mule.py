@@ -1,11 +1,25 @@
 import socket
 import json
 import threading
+import asyncio
 import time
 import os
+import shutil
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from dotenv import load_dotenv
+import hashlib
+import uuid
+import protocol
+from packet_log import PacketLog, packet_digest, point_id
+from bloom import BloomFilter, pack_filters, unpack_filters
+from discovery import MuleDirectory
+from media_store import MEDIA_COLLECTION, blob_point_id, verify_blob
+from chunk_store import PartialStore
+from dedup import DigestIndex
+from priority import rank, summary
+from metrics import Registry
+from concurrent.futures import ThreadPoolExecutor
 
 print("\n✅ RUNNING FINAL MULE (CUSTOM PORTS: 6008/6009)\n")
 load_dotenv()
@@ -13,47 +27,511 @@ load_dotenv()
 # --- CONFIG --- 
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_KEY = os.getenv("QDRANT_KEY")
+QDRANT_LOCATION = os.getenv("QDRANT_LOCATION")  # ":memory:" or a directory: local stand-in instead of QDRANT_URL (tests, benchmarks)
 UPLINK_COLLECTION = "disaster_reports"
 DOWNLINK_COLLECTION = "courier_bag"
 
 UDP_BEACON_PORT = 5005
 UPLINK_PORT = 6008
 REPLY_PORT = 6009
+GOSSIP_PORT = 6010
 
-STORAGE_FILE = "mule_storage.json"
+STORAGE_FILE = "mule_storage.json" # Legacy flat file, migrated into LOG_DIR on start
+LOG_DIR = "mule_log"
 INBOX_FILE = "mule_inbox.json"
+RECEIPTS_FILE = "mule_receipts.json"
+PARTIAL_DIR = "mule_partials"
+DEDUP_DIR = "mule_dedup"
+STATE_FILE = "mule_state.json"
+
+# --- ⚡ CONCURRENCY LIMITS (override via .env) ---
+MAX_CONNECTIONS = int(os.getenv("MULE_MAX_CONNECTIONS", "64"))      # Sessions served at once, per port
+CONN_DEADLINE = float(os.getenv("MULE_CONN_DEADLINE", "10"))        # Seconds a survivor may stay silent
+SESSION_MAX = float(os.getenv("MULE_SESSION_MAX", "300"))           # Seconds a single session may take
+ACCEPT_WAIT = float(os.getenv("MULE_ACCEPT_WAIT", "5"))             # Seconds a session may queue for a slot
+MAX_PACKET_BYTES = int(os.getenv("MULE_MAX_PACKET_BYTES", str(4 * 1024 * 1024)))
+PARTIAL_TTL_S = float(os.getenv("MULE_PARTIAL_TTL_S", str(6 * 3600)))  # Keep half-sent chunked packets this long
+
+# --- 🗄️ PACKET LOG ---
+SEGMENT_BYTES = int(os.getenv("MULE_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+LOG_FSYNC = os.getenv("MULE_LOG_FSYNC", "1") == "1"  # fsync every packet before ACKing it
+SYNC_BATCH = int(os.getenv("MULE_SYNC_BATCH", "500"))  # Largest upsert batch
+SYNC_INTERVAL_S = float(os.getenv("MULE_SYNC_INTERVAL_S", "5"))  # Pause between sync cycles
+DEDUP_RECENT = int(os.getenv("MULE_DEDUP_RECENT", "100000"))        # Newest packet digests kept exactly
+DEDUP_CAPACITY = int(os.getenv("MULE_DEDUP_CAPACITY", "1000000"))   # Packets per rolling Bloom generation
+
+# --- 📥 DOWNLINK ---
+DOWNLINK_PAGE = int(os.getenv("MULE_DOWNLINK_PAGE", "100"))              # Orders per scroll request
+DOWNLINK_INTERVAL_S = float(os.getenv("MULE_DOWNLINK_INTERVAL_S", "30"))  # Mail poll period with nothing to upload
+DOWNLINK_OVERLAP_S = 60                                                   # Re-check window behind the high-water mark
+COVERAGE = os.getenv("MULE_COVERAGE")  # "lat,lon,radius_km": only carry orders for targets seen in this area
+RECEIPT_TTL_S = float(os.getenv("MULE_RECEIPT_TTL_S", str(48 * 3600)))  # Refuse delivered orders (re-download, gossip) this long
+
+# --- 🚚 UPLOAD PIPELINE ---
+UPLOAD_WORKERS = int(os.getenv("MULE_UPLOAD_WORKERS", "3"))      # Batches in flight
+BATCH_MIN = int(os.getenv("MULE_BATCH_MIN", "10"))               # Smallest upsert batch
+BATCH_TARGET_S = float(os.getenv("MULE_BATCH_TARGET_S", "3"))    # Shrink batches that take longer
+SCHED_WINDOW = int(os.getenv("MULE_SCHED_WINDOW", "20000"))      # Oldest unsynced packets ranked per pass
+PRIORITY_AGING_S = float(os.getenv("MULE_PRIORITY_AGING_S", "600"))  # Waiting this long = one level more urgent
+
+# --- 🔁 MULE-TO-MULE GOSSIP ---
+GOSSIP = os.getenv("MULE_GOSSIP", "1") == "1"
+GOSSIP_MAX_HOPS = int(os.getenv("MULE_GOSSIP_MAX_HOPS", "3"))            # Mule-to-mule handovers per item
+GOSSIP_TTL_S = float(os.getenv("MULE_GOSSIP_TTL_S", str(24 * 3600)))     # Stop spreading items older than this
+GOSSIP_COOLDOWN_S = float(os.getenv("MULE_GOSSIP_COOLDOWN_S", "60"))     # Seconds between syncs with the same peer
+GOSSIP_MAX_ITEMS = int(os.getenv("MULE_GOSSIP_MAX_ITEMS", "5000"))       # Items sent per direction per encounter
+
+# Observability
+METRICS_PORT = int(os.getenv("MULE_METRICS_PORT", "6011"))   # HTTP /metrics + /metrics.json (0: off)
+METRICS_HOST = os.getenv("MULE_METRICS_HOST", "127.0.0.1")   # Local only unless opened up on purpose
+
+LOG = None # PacketLog, opened in __main__
+PARTIALS = None # PartialStore for chunked uploads, opened in __main__
+DEDUP = None # DigestIndex of packets already stored, opened in __main__ (None: no dedup)
+STORE_LOCK = threading.Lock() # seen -> append -> add is one step: a resend racing the first copy is a duplicate
+
+# --- 📈 METRICS (metrics.py) ---
+METRICS = Registry("mule")
+CONNECTIONS = METRICS.counter("connections_total", "Sessions accepted, by server")
+REJECTED = METRICS.counter("connections_rejected_total", "Sessions dropped while waiting for a free slot, by server")
+BYTES_IN = METRICS.counter("bytes_received_total", "Bytes read from survivors / peers, by server")
+BYTES_OUT = METRICS.counter("bytes_sent_total", "Bytes written to survivors / peers, by server")
+PACKETS = METRICS.counter("packets_total", "Packets received, by result (stored / duplicate)")
+DROPPED = METRICS.counter("packets_dropped_total", "Packets refused or unreadable, by reason")
+UPLOADED = METRICS.counter("packets_uploaded_total", "Packets synced to the cloud")
+MAIL_REQUESTS = METRICS.counter("mail_requests_total", "Mail requests, by whether any orders were waiting")
+RECEIPTED = METRICS.counter("orders_receipted_total", "Orders survivors confirmed, dropped from the bag")
+RECEIPTS_SYNCED = METRICS.counter("receipts_synced_total", "Delivered orders deleted from the cloud courier bag")
+BEACONS = METRICS.counter("beacons_sent_total", "UDP beacons broadcast")
+SESSIONS = METRICS.histogram("session_seconds", "Survivor / peer session duration, by server")
+METRICS.gauge("active_sessions", "Sessions being served right now", fn=lambda: sum(ACTIVE_SESSIONS.values()))
+METRICS.gauge("backlog_packets", "Packets waiting for upload", fn=lambda: LOG.backlog())
+METRICS.gauge("inbox_orders", "Orders in the courier bag", fn=lambda: len(INBOX))
+METRICS.gauge("receipts_pending", "Delivery receipts not yet carried to the cloud", fn=lambda: len(RECEIPTS.unsynced()))
+METRICS.gauge("duplicates_suppressed", "Re-sent packets not stored again", fn=lambda: DEDUP.suppressed)
+METRICS.gauge("upload_batch_size", "Current adaptive upsert batch size", fn=lambda: SIZER.size())
+# Ends of sessions that are part of normal life on a lossy link: counted, not printed
+QUIET_SESSION_ERRORS = (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError)
+
+def log_summary(packet):
+    """What the log index keeps per unsynced packet: (priority, stored at, digest),
+    for upload ranking and gossip summaries without reading the packet again."""
+    return summary(packet) + (packet_digest(packet),)
+
+def open_log(path=LOG_DIR):
+    """Opens the packet log and imports any legacy mule_storage.json lines once."""
+    log = PacketLog(path, segment_bytes=SEGMENT_BYTES, fsync=LOG_FSYNC, summarize=log_summary)
+    if os.path.exists(STORAGE_FILE) and os.path.getsize(STORAGE_FILE) > 0:
+        moved = 0
+        with open(STORAGE_FILE) as f:
+            for line in f:
+                try:
+                    log.append(json.loads(line))
+                    moved += 1
+                except ValueError: pass
+        os.replace(STORAGE_FILE, STORAGE_FILE + ".migrated")
+        print(f"🗄️ Migrated {moved} legacy packets into {path}/")
+    return log
 
 def get_ip():
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.connect(("8.8.8.8", 80))
         return s.getsockname()[0]
-    except: return "127.0.0.1"
+    except OSError: return "127.0.0.1"
 
 def check_net():
     try:
         socket.create_connection(("8.8.8.8", 53), timeout=3)
         return True
-    except: return False
+    except OSError: return False
+
+def write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f: return json.load(f)
+    except (OSError, ValueError): return {}
+
+def save_state(**updates):
+    state = load_state()
+    state.update(updates)
+    write_json_atomic(STATE_FILE, state)
+
+# --- 📬 INBOX INDEX ---
+class InboxIndex:
+    """Courier bag held in memory as {target_id: (order, ...)}.
+
+    Lookups read the current dict reference once; updates build a new dict and
+    swap the reference, so a GET_MAIL never sees a half-applied update. The bag
+    is persisted to INBOX_FILE through a temp file and an atomic rename.
+
+    Every order is stamped with "_rx", when it entered this bag (strictly
+    increasing), which is the cursor for incremental mail fetches. Orders in
+    `delivered` (receipted order_ids) are never taken back in. Orders saved by
+    older mules have neither "_rx" nor "order_id": they are stamped on load,
+    and replaced by the downloaded copy (same secure_content) once it arrives.
+    """
+    def __init__(self, path, delivered=()):
+        self.path = path
+        self.delivered = delivered
+        self._by_target = {}
+        self._last_rx = 0.0
+        self._write_lock = threading.Lock()
+        try:
+            with open(path) as f: saved = json.load(f)
+            self.merge(saved, persist=any('_rx' not in o for o in saved), stamp=False)
+        except (OSError, ValueError): pass
+
+    def __len__(self):
+        return sum(len(v) for v in self._by_target.values())
+
+    def get(self, tid):
+        return list(self._by_target.get(tid, ()))
+
+    def since(self, tid, rx):
+        """Orders for tid that entered the bag after `rx`."""
+        return [o for o in self._by_target.get(tid, ()) if o.get('_rx', 0) > rx]
+
+    def merge(self, orders, persist=True, stamp=True):
+        """Adds orders not already in the bag (or delivered). Returns how many were new."""
+        with self._write_lock:
+            current = self._by_target
+            updated = {}
+            for o in orders:
+                tid = o.get('target_id')
+                key = o.get('order_id') or o.get('secure_content')
+                if key in self.delivered: continue
+                bucket = updated.get(tid) or list(current.get(tid, ()))
+                match = next((i for i, m in enumerate(bucket) if _same_order(m, o)), None)
+                if match is not None:
+                    old = bucket[match]
+                    if old.get('order_id') or not o.get('order_id'): continue
+                    # Legacy copy downloaded again with its id: keep the id (receipts need
+                    # it) and the old stamp (survivors past it already have the order)
+                    bucket[match] = dict(o, _rx=old['_rx'])
+                    updated[tid] = bucket
+                    continue
+                if stamp or '_rx' not in o: # Gossiped orders carry the peer's stamp: replace it with ours
+                    self._last_rx = max(time.time(), self._last_rx + 1e-6)
+                    o = dict(o, _rx=self._last_rx)
+                else:
+                    self._last_rx = max(self._last_rx, o['_rx'])
+                bucket.append(o)
+                updated[tid] = bucket
+            if not updated: return 0
+            new = dict(current)
+            new.update({tid: tuple(b) for tid, b in updated.items()})
+            added = sum(len(new[t]) - len(current.get(t, ())) for t in updated)
+            self._by_target = new # Atomic swap
+            if persist: self._persist(new)
+            return added
+
+    def remove(self, tid, order_ids):
+        """Drops tid's orders with these order_ids. Returns the ids that were in the bag."""
+        with self._write_lock:
+            current = self._by_target
+            wanted = set(order_ids)
+            bucket = current.get(tid, ())
+            keep = tuple(o for o in bucket if o.get('order_id') not in wanted)
+            if len(keep) == len(bucket): return []
+            new = dict(current)
+            if keep: new[tid] = keep
+            else: del new[tid]
+            self._by_target = new # Atomic swap
+            self._persist(new)
+            return [o['order_id'] for o in bucket if o.get('order_id') in wanted]
+
+    def orders(self):
+        return [o for bucket in self._by_target.values() for o in bucket]
+
+    def _persist(self, by_target):
+        write_json_atomic(self.path, [o for bucket in by_target.values() for o in bucket])
+
+def _same_order(a, b):
+    """Same order_id, or the same ciphertext when either side predates order_ids."""
+    if a.get('order_id') and b.get('order_id'): return a['order_id'] == b['order_id']
+    return a.get('secure_content') == b.get('secure_content')
+
+INBOX = None # InboxIndex, opened in __main__
+
+# --- 🧾 DELIVERY RECEIPTS ---
+class ReceiptBook:
+    """Orders survivors confirmed: {order_id: {"target_id", "at", "synced"}}.
+
+    A receipt is carried until cloud_sync has deleted the order from
+    DOWNLINK_COLLECTION ("synced"), then kept for RECEIPT_TTL_S so a
+    re-download or a peer's gossip cannot put the order back in the bag.
+    Persisted to RECEIPTS_FILE on every change.
+    """
+    def __init__(self, path, ttl=RECEIPT_TTL_S):
+        self.path, self.ttl = path, ttl
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f: self._receipts = json.load(f)
+        except (OSError, ValueError): self._receipts = {}
+
+    def __contains__(self, order_id):
+        return order_id in self._receipts
+
+    def __len__(self):
+        return len(self._receipts)
+
+    def add(self, tid, order_ids):
+        now = time.time()
+        with self._lock:
+            for oid in order_ids: self._receipts[oid] = {"target_id": tid, "at": now, "synced": False}
+            if order_ids: write_json_atomic(self.path, self._receipts)
+
+    def unsynced(self):
+        with self._lock: return [oid for oid, r in self._receipts.items() if not r["synced"]]
+
+    def mark_synced(self, order_ids):
+        """Records the cloud deletes and forgets synced receipts older than the TTL."""
+        now = time.time()
+        with self._lock:
+            receipts = {oid: dict(r) for oid, r in self._receipts.items()}
+            for oid in order_ids:
+                if oid in receipts: receipts[oid]["synced"] = True
+            self._receipts = {oid: r for oid, r in receipts.items() if not r["synced"] or now - r["at"] < self.ttl}
+            write_json_atomic(self.path, self._receipts)
+
+RECEIPTS = None # ReceiptBook, opened in __main__
+
+# --- 🚚 UPLOAD PIPELINE ---
+# One QdrantClient (and its HTTP connection pool) lives for the whole process.
+_client = None
+_client_lock = threading.Lock()
+
+class SerializedClient:
+    """Local-mode QdrantClient (in-process storage) is not thread-safe: this
+    lets one call through at a time, from upload workers and callers alike."""
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr): return attr
+        def call(*args, **kwargs):
+            with self._lock: return attr(*args, **kwargs)
+        return call
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            if QDRANT_LOCATION == ":memory:":
+                _client = SerializedClient(QdrantClient(location=":memory:"))
+            elif QDRANT_LOCATION:
+                _client = SerializedClient(QdrantClient(path=QDRANT_LOCATION))
+            else:
+                _client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_KEY, timeout=60, prefer_grpc=False)
+        return _client
+
+def reset_client():
+    """Drops the pooled client after a hard failure; the next call reconnects."""
+    global _client
+    if QDRANT_LOCATION: return # Local storage: nothing to reconnect, and ":memory:" would lose it all
+    with _client_lock:
+        if _client is not None:
+            try: _client.close()
+            except Exception as e: METRICS.error("cloud_sync.close", e, log=False)
+        _client = None
+
+class BatchSizer:
+    """AIMD batch sizing: grow while upserts finish under the target time,
+    halve on failure or when the link gets slow."""
+    def __init__(self, lo=BATCH_MIN, hi=SYNC_BATCH, target_s=BATCH_TARGET_S):
+        self.lo, self.hi, self.target_s = lo, hi, target_s
+        self.current = max(lo, min(hi, 50))
+        self._lock = threading.Lock()
+
+    def size(self):
+        with self._lock: return self.current
+
+    def record(self, n, seconds, ok):
+        with self._lock:
+            if not ok or seconds > self.target_s:
+                self.current = max(self.lo, self.current // 2)
+            elif n >= self.current:
+                self.current = min(self.hi, self.current + max(1, self.current // 2))
+
+UPLOAD_POOL = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+SIZER = BatchSizer()
+
+def _to_point(data):
+    """Routes a log record to (collection, point): media blobs go to MEDIA_COLLECTION.
+    _upsert_batch stamps "synced_at" (HQ's ingest cursor, not part of the hash)."""
+    data = {k: v for k, v in data.items() if not k.startswith("_")} # Gossip routing state stays on the mules
+    if data.get("type") == "blob":
+        return MEDIA_COLLECTION, models.PointStruct(id=blob_point_id(data["blob_id"]), vector={}, payload=dict(data))
+    payload = dict(data)
+    loc = data.get("location")
+    if isinstance(loc, (list, tuple)) and len(loc) == 2: # Survivors send [lat, lon]; Qdrant geo wants an object
+        payload["location"] = {"lat": loc[0], "lon": loc[1]}
+    return UPLINK_COLLECTION, models.PointStruct(
+        id=point_id(data),  # Content hash of the packet as received: a retried or duplicate packet overwrites itself
+        vector=[0.0]*384, 
+        payload=payload
+    )
+
+def _to_points(records):
+    """[(offset, (collection, point))] for the records, plus the offsets of records
+    that can never make a point (malformed, e.g. a blob without its blob_id)."""
+    points, bad = [], []
+    for offset, data in records:
+        try: points.append((offset, _to_point(data)))
+        except (KeyError, TypeError, ValueError, AttributeError): bad.append(offset)
+    return points, bad
+
+def _upsert_batch(client, batch):
+    synced_at = time.time()
+    by_collection = {}
+    for _, (collection, point) in batch:
+        point.payload["synced_at"] = synced_at
+        by_collection.setdefault(collection, []).append(point)
+    for attempt in range(3):
+        t0 = time.time()
+        try:
+            # Blobs first, so within a batch a report never lands before its media
+            for collection in sorted(by_collection, key=lambda c: c != MEDIA_COLLECTION):
+                with METRICS.span("upsert", collection=collection):
+                    client.upsert(collection_name=collection, points=by_collection[collection])
+            SIZER.record(len(batch), time.time() - t0, True)
+            return True
+        except Exception as e:
+            SIZER.record(len(batch), time.time() - t0, False)
+            print(f"❌ Upload Failed ({len(batch)} packets, attempt {attempt+1}/3): {e}")
+            time.sleep(2 ** attempt)
+    return False
+
+def upload_backlog(client):
+    """Uploads the unsynced log, most urgent first (priority.rank), with up
+    to UPLOAD_WORKERS batches in flight. Returns (uploaded, all_ok)."""
+    uploaded = 0
+    ranked, seen_until = [], None
+    while True:
+        if not ranked or LOG.next_offset != seen_until:
+            # (Re)rank on start, when the window is used up, or when new packets
+            # arrived: a fresh critical report jumps the queue mid-sync. Ranking
+            # uses the log's in-memory index; only the chosen records are read.
+            seen_until = LOG.next_offset
+            ranked = rank(LOG.pending(SCHED_WINDOW), PRIORITY_AGING_S)
+            if not ranked: return uploaded, True
+        size = SIZER.size()
+        chosen, ranked = ranked[:size * UPLOAD_WORKERS], ranked[size * UPLOAD_WORKERS:]
+        records = LOG.read(chosen)
+        if len(records) < len(chosen): # Corrupted on disk: can never be sent, do not retry forever
+            unreadable = set(chosen) - {offset for offset, _ in records}
+            DROPPED.inc(len(unreadable), reason="unreadable log record")
+            LOG.ack(unreadable)
+        records, malformed = _to_points(records)
+        if malformed: # Would fail every cycle and hold back everything behind it
+            DROPPED.inc(len(malformed), reason="malformed log record")
+            LOG.ack(malformed)
+        batches = [records[i:i+size] for i in range(0, len(records), size)]
+        futures = [(UPLOAD_POOL.submit(_upsert_batch, client, b), b) for b in batches]
+        ok = True
+        for fut, batch in futures:
+            if fut.result():
+                LOG.ack([offset for offset, _ in batch])
+                uploaded += len(batch)
+                UPLOADED.inc(len(batch))
+            else:
+                ok = False
+        LOG.compact()
+        if not ok: return uploaded, False
+
+# --- 📥 DOWNLINK (courier_bag -> inbox) ---
+def coverage_filter():
+    """Orders whose target was last seen inside MULE_COVERAGE, plus legacy
+    orders that carry no location at all."""
+    if not COVERAGE: return None
+    lat, lon, radius_km = (float(x) for x in COVERAGE.split(","))
+    return models.Filter(should=[
+        models.FieldCondition(key="target_location", geo_radius=models.GeoRadius(
+            center=models.GeoPoint(lat=lat, lon=lon), radius=radius_km * 1000)),
+        models.IsEmptyCondition(is_empty=models.PayloadField(key="target_location")),
+    ])
+
+def ensure_downlink_indexes(client):
+    for field, schema in (("timestamp", models.PayloadSchemaType.FLOAT),
+                          ("target_location", models.PayloadSchemaType.GEO)):
+        try: client.create_payload_index(DOWNLINK_COLLECTION, field_name=field, field_schema=schema)
+        except Exception as e: METRICS.error("cloud_sync.downlink_index", e, log=False) # Already there, or an old server
+
+def download_orders(client):
+    """Pages through every order newer than the persisted high-water mark.
+    Returns how many new orders went into the bag."""
+    hwm = load_state().get("downlink_hwm", 0)
+    must = []
+    if hwm:
+        # Small overlap covers HQ clock skew; the inbox drops repeats by order_id
+        must.append(models.FieldCondition(key="timestamp", range=models.Range(gte=hwm - DOWNLINK_OVERLAP_S)))
+    geo = coverage_filter()
+    if geo: must.append(geo)
+    scroll_filter = models.Filter(must=must) if must else None
+
+    newest, orders, offset = hwm, [], None
+    while True:
+        page, offset = client.scroll(collection_name=DOWNLINK_COLLECTION, scroll_filter=scroll_filter,
+                                     limit=DOWNLINK_PAGE, offset=offset, with_payload=True, with_vectors=False)
+        for p in page:
+            orders.append(dict(p.payload, order_id=str(p.id)))
+            newest = max(newest, p.payload.get("timestamp") or 0)
+        if offset is None: break
+
+    added = INBOX.merge(orders)
+    if newest != hwm: save_state(downlink_hwm=newest)
+    return added
+
+def _order_point(order_id):
+    """Qdrant point id behind an order_id (str of an int or UUID), or None."""
+    if order_id.isdigit(): return int(order_id)
+    try: return str(uuid.UUID(order_id))
+    except ValueError: return None
+
+def sync_receipts(client):
+    """Deletes receipted orders from DOWNLINK_COLLECTION, so no mule downloads
+    them again. Returns how many receipts went out."""
+    pending = RECEIPTS.unsynced()
+    if not pending: return 0
+    points = [p for p in map(_order_point, pending) if p is not None] # Anything else cannot be in Qdrant
+    if points:
+        client.delete(collection_name=DOWNLINK_COLLECTION, points_selector=models.PointIdsList(points=points))
+    RECEIPTS.mark_synced(pending)
+    RECEIPTS_SYNCED.inc(len(pending))
+    return len(pending)
 
 # --- 🛡️ ROBUST SYNC ENGINE ---
 def cloud_sync():
-    first_run = True
+    first_run = first_downlink = True
+    last_downlink = 0
     print("☁️ Cloud Sync Engine: STARTED")
     
     while True:
-        time.sleep(5) # Breathe
+        time.sleep(SYNC_INTERVAL_S) # Breathe
         
-        if not os.path.exists(STORAGE_FILE) or os.path.getsize(STORAGE_FILE) == 0:
+        # Nothing to upload or confirm: still poll for mail, just less often
+        if LOG.backlog() == 0 and not RECEIPTS.unsynced() and time.time() - last_downlink < DOWNLINK_INTERVAL_S:
             continue
 
-        if not check_net():
+        if not QDRANT_LOCATION and not check_net():
+            METRICS.counter("sync_offline_total", "Sync cycles skipped without internet").inc()
             print("⚠️ No Internet. Waiting...")
             continue
 
+        cycle_start = time.perf_counter()
         try:
-            # 1. Connect (Re-establish every cycle for stability)
-            client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_KEY, timeout=60, prefer_grpc=False)
+            # 1. Connect (pooled client, reused across cycles)
+            client = get_client()
             
             # 2. Safety Check: Collection Exists?
             if first_run:
@@ -63,139 +541,520 @@ def cloud_sync():
                             collection_name=UPLINK_COLLECTION,
                             vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE)
                         )
+                        # HQ queries the map viewport by location (older collections get it from the dashboard)
+                        client.create_payload_index(UPLINK_COLLECTION, field_name="location", field_schema=models.PayloadSchemaType.GEO)
                         print(f"✅ Created Collection: {UPLINK_COLLECTION}")
+                    if not client.collection_exists(MEDIA_COLLECTION):
+                        # Payload-only store: blobs are fetched by ID, never searched
+                        client.create_collection(collection_name=MEDIA_COLLECTION, vectors_config={})
+                        print(f"✅ Created Collection: {MEDIA_COLLECTION}")
                 except Exception as e:
+                    METRICS.error("cloud_sync.collections", e, log=False)
                     print(f"⚠️ Collection Check Warning: {e}")
                 first_run = False
 
-            # 3. Read Data
-            with open(STORAGE_FILE, "r") as f: lines = f.readlines()
-            points = []
-            valid_lines = []
-            
-            for i, line in enumerate(lines):
-                if not line.strip(): continue
-                try:
-                    data = json.loads(line)
-                    # DEBUG: Print what we are sending to check format
-                    if i == 0: print(f"🔍 DEBUG PAYLOAD PREVIEW: {str(data)[:100]}...") 
-                    
-                    points.append(models.PointStruct(
-                        id=int(time.time()*1000)+i, 
-                        vector=[0.0]*384, 
-                        payload=data
-                    ))
-                    valid_lines.append(line)
-                except: pass
-            
-            if not points:
-                # File was garbage, clear it
-                open(STORAGE_FILE, 'w').close()
-                continue
-
-            # 4. TANK MODE UPLOAD (Retry 5 times)
-            success = False
-            for attempt in range(5):
-                try:
-                    print(f"☁️ Uploading {len(points)} packets (Attempt {attempt+1}/5)...")
-                    client.upsert(collection_name=UPLINK_COLLECTION, points=points)
-                    success = True
-                    print("✅ Upload Success! Database Updated.")
-                    break # Exit retry loop
-                except Exception as e:
-                    print(f"❌ Upload Failed: {e}")
-                    time.sleep(2) # Wait a bit before retry
-
-            # 5. Clear Storage ONLY if success
-            if success:
-                open(STORAGE_FILE, 'w').close()
+            # 3. Drain only the unsynced tail of the log in adaptive, parallel batches
+            backlog = LOG.backlog()
+            if backlog:
+                print(f"☁️ Uploading {backlog} packets (batch {SIZER.size()} x {UPLOAD_WORKERS} in flight)...")
+                t0 = time.time()
+                uploaded, ok = upload_backlog(client)
+                if ok: print(f"✅ Upload Success! {uploaded} packets in {time.time() - t0:.1f}s.")
+                else: print(f"⚠️ Partial upload: {uploaded}/{backlog} packets, rest retried next cycle.")
                 
             # 6. Check for Mail (Downlink)
             try:
                 if client.collection_exists(DOWNLINK_COLLECTION):
-                    orders = client.scroll(collection_name=DOWNLINK_COLLECTION, limit=50, with_payload=True)[0]
-                    if orders:
-                        mail = [p.payload for p in orders]
-                        with open(INBOX_FILE, "w") as f: json.dump(mail, f)
-                        print(f"📬 Downloaded {len(mail)} orders.")
-            except: pass
+                    if first_downlink:
+                        ensure_downlink_indexes(client)
+                        first_downlink = False
+                    with METRICS.span("downlink"):
+                        added = download_orders(client)
+                    if added: print(f"📬 Downloaded {added} new orders ({len(INBOX)} in bag).")
+                    # 7. Carry delivery receipts back: delivered orders leave the cloud bag too
+                    with METRICS.span("receipts"):
+                        confirmed = sync_receipts(client)
+                    if confirmed: print(f"🧾 Confirmed {confirmed} delivered orders to the cloud.")
+                last_downlink = time.time()
+            except Exception as e:
+                METRICS.error("cloud_sync.downlink", e, log=False)
+                print(f"⚠️ Downlink Warning: {e}")
 
         except Exception as e:
+            METRICS.error("cloud_sync", e, log=False)
             print(f"❌ Critical Sync Error: {e}")
+            reset_client()
+        METRICS.histogram("sync_cycle_seconds", "Duration of sync cycles that had work").observe(time.perf_counter() - cycle_start)
+
+# --- UDP BEACON ---
+def beacon_state(port):
+    """What survivors use to pick between Mules (see discovery.py)."""
+    try: free_mb = shutil.disk_usage(LOG.path).free // (1024 * 1024)
+    except OSError: free_mb = 0
+    return {"id": LOG.log_id, "load": round(ACTIVE_SESSIONS.get(port, 0) / MAX_CONNECTIONS, 2),
+            "free_mb": free_mb, "queue": LOG.backlog(), "dups": DEDUP.suppressed if DEDUP else 0}
 
-# --- UDP & TCP HANDLERS (UNCHANGED) ---
 def beacon():
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
     while True:
         try:
             ip = get_ip()
-            msg_uplink = json.dumps({"role": "mule_uplink", "ip": ip, "port": UPLINK_PORT}).encode()
-            msg_reply = json.dumps({"role": "mule_reply", "ip": ip, "port": REPLY_PORT}).encode()
+            msg_uplink = json.dumps(dict(beacon_state(UPLINK_PORT), role="mule_uplink", ip=ip, port=UPLINK_PORT)).encode()
+            msg_reply = json.dumps(dict(beacon_state(REPLY_PORT), role="mule_reply", ip=ip, port=REPLY_PORT)).encode()
             
             sock.sendto(msg_uplink, ('<broadcast>', UDP_BEACON_PORT))
             sock.sendto(msg_reply, ('<broadcast>', UDP_BEACON_PORT))
+            if GOSSIP:
+                msg_gossip = json.dumps({"role": "mule_gossip", "id": LOG.log_id, "ip": ip, "port": GOSSIP_PORT}).encode()
+                sock.sendto(msg_gossip, ('<broadcast>', UDP_BEACON_PORT))
+            BEACONS.inc(3 if GOSSIP else 2)
             time.sleep(2)
-        except: time.sleep(5)
+        except Exception as e:
+            METRICS.error("beacon", e)
+            time.sleep(5)
 
-def uplink_server():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind(('0.0.0.0', UPLINK_PORT))
-        s.listen()
-        while True:
+# --- ⚡ CONCURRENT UPLINK / REPLY SERVERS (asyncio) ---
+# Each server runs its own event loop inside its thread, so one slow survivor
+# only ever holds its own slot instead of the whole accept() loop.
+# Sessions speak the framed protocol (protocol.py); anything else falls back to
+# the legacy single-JSON / "GET_MAIL:" handling.
+ACTIVE_SESSIONS = {} # port -> sessions being served, advertised in beacons
+
+async def _read_upload(reader, deadline):
+    """Reads one legacy JSON upload: stops at the newline, EOF or the deadline."""
+    loop = asyncio.get_running_loop()
+    data = bytearray()
+    while len(data) < MAX_PACKET_BYTES:
+        remaining = deadline - loop.time()
+        if remaining <= 0: break
+        try:
+            chunk = await asyncio.wait_for(reader.read(65536), remaining)
+        except asyncio.TimeoutError: break
+        if not chunk: break
+        data += chunk
+        if b"\n" in chunk: break # app.py sends exactly one JSON line per packet
+    return bytes(data)
+
+def store_packet(parsed):
+    """Appends a packet to the log unless it was stored before. Either way the
+    survivor gets its ACK. Returns False for a suppressed duplicate."""
+    with METRICS.span("store"):
+        stored = _store_packet(parsed)
+    PACKETS.inc(result="stored" if stored else "duplicate")
+    return stored
+
+def _store_packet(parsed):
+    if DEDUP is None:
+        LOG.append(dict(parsed, _rx=time.time()))
+        return True
+    digest = packet_digest(parsed)
+    with STORE_LOCK:
+        if DEDUP.seen(digest):
+            DEDUP.count_duplicate()
+            return False
+        LOG.append(dict(parsed, _rx=time.time())) # _rx: receive time, for sync-queue aging
+        DEDUP.add(digest) # Only once it is safely in the log
+    return True
+
+def _check_packet(parsed):
+    """Returns the NACK reason for an unacceptable packet, or None."""
+    if not isinstance(parsed, dict): return b"malformed packet"
+    if parsed.get("type") == "blob" and not verify_blob(parsed): return b"blob hash mismatch"
+    return None
+
+def begin_chunked(header):
+    """CHUNK_BEGIN: returns (transfer_id, chunk indexes already stored)."""
+    tid, size, chunks = str(header["transfer_id"]), int(header["size"]), int(header["chunks"])
+    if not 0 < size or not 0 < chunks <= size:
+        raise ValueError("bad chunked transfer")
+    PARTIALS.prune()
+    return tid, PARTIALS.begin(tid, size, chunks)
+
+def assemble_chunked(tid):
+    """Returns the packet once every chunk is stored, else None."""
+    body = PARTIALS.assemble(tid)
+    if body is None: return None
+    return protocol.loads(body)
+
+def load_mail(tid):
+    return INBOX.get(tid)
+
+def mail_since(tid, since):
+    """MAIL reply to a fetch with a cursor: the orders that entered the bag after
+    it, plus the cursor to send next time. A cursor from another mule (or none)
+    starts from the beginning."""
+    rx = since.get("rx", 0) if isinstance(since, dict) and since.get("mule") == LOG.log_id else 0
+    orders = INBOX.since(tid, rx)
+    return {"orders": orders, "cursor": {"mule": LOG.log_id, "rx": max([rx] + [o["_rx"] for o in orders])}}
+
+def record_receipt(tid, order_ids):
+    """Drops the orders tid confirmed from the bag and keeps the receipts for
+    the cloud. Ids not held for tid are ignored. Returns how many applied."""
+    held = {o.get('order_id') for o in INBOX.get(tid)}
+    ids = [oid for oid in map(str, order_ids) if oid in held]
+    RECEIPTS.add(tid, ids) # First, so a re-download racing with this cannot bring them back
+    removed = INBOX.remove(tid, ids)
+    RECEIPTED.inc(len(removed))
+    return len(removed)
+
+async def _sniff(reader):
+    """First bytes of a session tell framed clients apart from legacy ones."""
+    return await asyncio.wait_for(reader.readexactly(len(protocol.MAGIC)), CONN_DEADLINE)
+
+async def _frames(reader, prefix, server=None):
+    """Yields frames until BYE / EOF. Each frame must arrive within CONN_DEADLINE."""
+    while True:
+        frame = await asyncio.wait_for(protocol.read_frame(reader, prefix), CONN_DEADLINE)
+        prefix = b""
+        if frame is None or frame[0] == protocol.BYE: return
+        if server: BYTES_IN.inc(protocol.HEADER.size + len(frame[2]), server=server)
+        yield frame
+
+async def _send(writer, server, ftype, seq=0, body=b""):
+    BYTES_OUT.inc(protocol.HEADER.size + len(body), server=server)
+    await protocol.write_frame(writer, ftype, seq, body)
+
+async def _nack(writer, server, seq, reason):
+    DROPPED.inc(reason=reason.decode())
+    await _send(writer, server, protocol.NACK, seq, reason)
+
+async def _legacy_upload(reader, writer, addr, prefix):
+    loop = asyncio.get_running_loop()
+    data = prefix + await _read_upload(reader, loop.time() + CONN_DEADLINE)
+    BYTES_IN.inc(len(data), server="uplink")
+    decoded = data.decode('utf-8', errors='ignore')
+    start, end = decoded.find('{'), decoded.rfind('}')
+    try:
+        if start == -1 or end == -1: raise ValueError("no JSON object")
+        parsed = json.loads(decoded[start:end+1])
+    except ValueError:
+        DROPPED.inc(reason="malformed")
+        return
+    reason = _check_packet(parsed)
+    if reason:
+        DROPPED.inc(reason=reason.decode())
+        return # No ACK: legacy clients have no NACK, the packet stays on the phone
+    # Disk I/O stays off the event loop
+    stored = await loop.run_in_executor(None, store_packet, parsed)
+    print(f"📦 SOS Received from {addr} (legacy{'' if stored else ', duplicate'})")
+    writer.write(b"ACK")
+    BYTES_OUT.inc(3, server="uplink")
+    await writer.drain()
+
+async def handle_uplink(reader, writer):
+    addr = writer.get_extra_info("peername")
+    prefix = await _sniff(reader)
+    if not protocol.is_framed(prefix):
+        return await _legacy_upload(reader, writer, addr, prefix)
+
+    loop = asyncio.get_running_loop()
+    count = dups = 0
+    transfers = {} # seq -> transfer_id of chunked packets in this session
+    async for ftype, seq, body in _frames(reader, prefix, "uplink"):
+        if ftype in (protocol.CHUNK_BEGIN, protocol.CHUNK):
+            if ftype == protocol.CHUNK_BEGIN:
+                try:
+                    header = protocol.loads(body)
+                    if int(header["size"]) > MAX_PACKET_BYTES:
+                        await _nack(writer, "uplink", seq, b"packet too large")
+                        continue
+                    tid, have = await loop.run_in_executor(None, begin_chunked, header)
+                except (ValueError, KeyError, TypeError):
+                    await _nack(writer, "uplink", seq, b"bad chunked transfer")
+                    continue
+                transfers[seq] = tid
+                await _send(writer, "uplink", protocol.CHUNK_HAVE, seq, protocol.dumps({"have": have}))
+                if len(have) < int(header["chunks"]): continue
+                # Every chunk is here already (the last session ended before its ACK):
+                # the survivor sends nothing more, so finish the packet now
+            else:
+                if seq not in transfers:
+                    await _nack(writer, "uplink", seq, b"unexpected frame")
+                    continue
+                # A corrupted chunk raises ProtocolError and ends the session; the
+                # survivor reconnects and the resume handshake asks for it again.
+                index, data = protocol.unpack_chunk(body)
+                try:
+                    await loop.run_in_executor(None, PARTIALS.put, transfers[seq], index, data)
+                except ValueError:
+                    # Only this chunk is refused: the transfer and the chunks it has stay for a resend
+                    await _nack(writer, "uplink", seq, b"bad chunk")
+                    continue
+            tid = transfers[seq]
             try:
-                conn, addr = s.accept()
-                conn.settimeout(10)
-                data = b""
-                while True:
-                    try:
-                        chunk = conn.recv(4096)
-                        if not chunk: break
-                        data += chunk
-                    except socket.timeout: break
-                if data:
-                    decoded = data.decode('utf-8', errors='ignore')
-                    start, end = decoded.find('{'), decoded.rfind('}')
-                    if start != -1 and end != -1:
-                        clean = decoded[start:end+1]
-                        parsed = json.loads(clean)
-                        # Append to storage
-                        with open(STORAGE_FILE, "a") as f: f.write(json.dumps(parsed) + "\n")
-                        print(f"📦 SOS Received from {addr}")
-                        conn.sendall(b"ACK")
-                conn.close()
-            except: pass
+                parsed = await loop.run_in_executor(None, assemble_chunked, tid)
+            except ValueError:
+                parsed = False
+            if parsed is None: continue # More chunks to come
+            del transfers[seq]
+            # Complete (or unusable): the partial is no longer needed either way
+            await loop.run_in_executor(None, PARTIALS.discard, tid)
+        elif ftype == protocol.PACKET:
+            try:
+                parsed = protocol.loads(body)
+            except ValueError:
+                parsed = None
+        else:
+            await _nack(writer, "uplink", seq, b"unexpected frame")
+            continue
+        reason = _check_packet(parsed)
+        if reason:
+            await _nack(writer, "uplink", seq, reason)
+            continue
+        if await loop.run_in_executor(None, store_packet, parsed): count += 1
+        else: dups += 1
+        await _send(writer, "uplink", protocol.ACK, seq)
+    if count or dups: print(f"📦 {count} SOS packets received from {addr}" + (f" ({dups} duplicates suppressed)" if dups else ""))
 
-def reply_server():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind(('0.0.0.0', REPLY_PORT))
-        s.listen()
-        while True:
+async def handle_reply(reader, writer):
+    loop = asyncio.get_running_loop()
+    prefix = await _sniff(reader)
+    if not protocol.is_framed(prefix):
+        data = (prefix + await asyncio.wait_for(reader.read(1024), CONN_DEADLINE)).decode()
+        if "GET_MAIL:" not in data: return
+        tid = data.split(":")[1].strip()
+        mail = load_mail(tid) # O(1) in-memory lookup, safe on the event loop
+        MAIL_REQUESTS.inc(found="yes" if mail else "no")
+        body = json.dumps(mail).encode()
+        BYTES_IN.inc(len(data), server="reply")
+        BYTES_OUT.inc(len(body), server="reply")
+        writer.write(body)
+        await writer.drain() # Backpressure: never buffer more than the survivor can take
+        if mail: print(f"📤 Delivered mail to {tid}")
+        return
+
+    async for ftype, seq, body in _frames(reader, prefix, "reply"):
+        if ftype == protocol.RECEIPT:
             try:
-                conn, addr = s.accept()
-                data = conn.recv(1024).decode()
-                if "GET_MAIL:" in data:
-                    tid = data.split(":")[1].strip()
-                    mail = []
-                    if os.path.exists(INBOX_FILE):
-                        with open(INBOX_FILE, 'r') as f:
-                            mail = [m for m in json.load(f) if m.get('target_id') == tid]
-                    conn.sendall(json.dumps(mail).encode())
-                    if mail: print(f"📤 Delivered mail to {tid}")
-                conn.close()
-            except: pass
+                receipt = protocol.loads(body)
+                tid, order_ids = str(receipt["target_id"]).strip(), list(receipt["order_ids"])
+            except (ValueError, KeyError, TypeError):
+                await _nack(writer, "reply", seq, b"bad receipt")
+                continue
+            done = await loop.run_in_executor(None, record_receipt, tid, order_ids) # Persists: off the loop
+            await _send(writer, "reply", protocol.ACK, seq)
+            if done: print(f"🧾 {tid} confirmed {done} orders")
+            continue
+        if ftype != protocol.MAIL_REQ:
+            await _nack(writer, "reply", seq, b"unexpected frame")
+            continue
+        try:
+            req = protocol.loads(body)
+            if not isinstance(req, dict): raise ValueError("not an object")
+        except ValueError:
+            await _nack(writer, "reply", seq, b"bad mail request")
+            continue
+        tid = str(req.get("target_id", "")).strip()
+        if "since" in req:
+            reply = mail_since(tid, req["since"])
+            mail = reply["orders"]
+        else:
+            mail = reply = load_mail(tid) # Older apps: everything held for them, as a plain list
+        MAIL_REQUESTS.inc(found="yes" if mail else "no")
+        await _send(writer, "reply", protocol.MAIL, seq, protocol.dumps(reply))
+        if mail: print(f"📤 Delivered {len(mail)} orders to {tid}")
+
+async def serve(port, handler, host='0.0.0.0', ready=None):
+    """Serves `handler` with at most MAX_CONNECTIONS sessions in flight.
+
+    Extra sessions wait up to ACCEPT_WAIT seconds for a free slot (backpressure),
+    a silent survivor is dropped after CONN_DEADLINE seconds and no session may
+    run longer than SESSION_MAX seconds.
+    """
+    slots = asyncio.Semaphore(MAX_CONNECTIONS)
+    ACTIVE_SESSIONS[port] = 0
+    name = handler.__name__.replace("handle_", "") # Metrics label: uplink / reply / gossip
+
+    async def gated(reader, writer):
+        try:
+            await asyncio.wait_for(slots.acquire(), ACCEPT_WAIT)
+        except asyncio.TimeoutError:
+            REJECTED.inc(server=name)
+            writer.close() # Mule saturated: survivor retries
+            return
+        CONNECTIONS.inc(server=name)
+        ACTIVE_SESSIONS[port] += 1
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(handler(reader, writer), SESSION_MAX)
+        except Exception as e:
+            METRICS.error(f"session:{name}", e, log=not isinstance(e, QUIET_SESSION_ERRORS))
+        finally:
+            SESSIONS.observe(time.perf_counter() - t0, server=name)
+            ACTIVE_SESSIONS[port] -= 1
+            slots.release()
+            writer.close()
+
+    server = await asyncio.start_server(gated, host, port, reuse_address=True,
+                                        backlog=MAX_CONNECTIONS * 2, limit=MAX_PACKET_BYTES)
+    if ready: ready.set()
+    async with server:
+        await server.serve_forever()
+
+# --- 🔁 MULE-TO-MULE GOSSIP (epidemic forwarding) ---
+# Two mules that meet swap Bloom-filter summaries of the uplink packets they
+# still have to sync and the orders in their courier bag, then hand over only
+# what the other one lacks, in both directions. Every handover bumps the
+# item's "_hops"; items past GOSSIP_MAX_HOPS or older than GOSSIP_TTL_S stay
+# where they are. "_"-keys are routing state: they do not change the packet
+# digest (so the cloud still dedups) and are stripped before upload.
+def _order_digest(order):
+    return hashlib.sha256(str(order.get('order_id') or order.get('secure_content')).encode()).digest()
+
+def gossip_snapshot():
+    """Returns (summary frame body, [(kind, digest, item)]) for what this mule carries.
+    Packets come from the log index: their item is the log offset, read only if sent."""
+    items = [("packet", entry[2], offset) for offset, entry in LOG.pending()]
+    items += [("order", _order_digest(o), o) for o in INBOX.orders()]
+    filters = {}
+    for kind in ("packet", "order"):
+        digests = [d for k, d, _ in items if k == kind]
+        filters[kind] = BloomFilter.for_capacity(len(digests))
+        for d in digests: filters[kind].add(d)
+    return pack_filters(filters), items
+
+def _born(item, now):
+    return item.get("_born") or item.get("timestamp") or now
+
+def _expired(item, now):
+    return now - _born(item, now) >= GOSSIP_TTL_S
+
+def _spreadable(item, now):
+    return item.get("_hops", 0) < GOSSIP_MAX_HOPS and not _expired(item, now)
+
+def _resolve(batch):
+    """(kind, item) for gossip_snapshot entries, reading their packets from the log."""
+    packets = dict(LOG.read([item for kind, _, item in batch if kind == "packet"]))
+    for kind, _, item in batch:
+        item = packets.get(item) if kind == "packet" else item
+        if item is not None: yield kind, item # None: synced and compacted meanwhile
+
+def gossip_outgoing(items, peer_filters, read_batch=256):
+    """Items the peer lacks and that may still spread, as GOSSIP frame bodies.
+    Packets are read a batch at a time, only until GOSSIP_MAX_ITEMS are picked."""
+    now, out = time.time(), []
+    wanted = [entry for entry in items if entry[1] not in peer_filters.get(entry[0], ())]
+    i = 0
+    while i < len(wanted) and len(out) < GOSSIP_MAX_ITEMS:
+        batch = wanted[i:i + min(read_batch, GOSSIP_MAX_ITEMS - len(out))]
+        i += len(batch)
+        for kind, item in _resolve(batch):
+            if not _spreadable(item, now): continue
+            hop = dict(item, _hops=item.get("_hops", 0) + 1, _born=_born(item, now))
+            out.append(protocol.dumps({"kind": kind, "item": hop}))
+    return out
+
+def accept_gossip(bodies):
+    """Stores the packets / orders received from a peer. Returns how many were new."""
+    now, stored, orders = time.time(), 0, []
+    for body in bodies:
+        try:
+            msg = protocol.loads(body)
+            kind, item = msg["kind"], msg["item"]
+        except (ValueError, KeyError, TypeError): continue
+        if not isinstance(item, dict) or item.get("_hops", 0) > GOSSIP_MAX_HOPS or _expired(item, now): continue
+        if kind == "packet" and _check_packet(item) is None:
+            stored += store_packet(item)
+        elif kind == "order" and item.get("target_id"):
+            orders.append(item)
+    if orders: stored += INBOX.merge(orders)
+    return stored
+
+async def _send_items(writer, bodies):
+    for body in bodies:
+        writer.write(protocol.encode_frame(protocol.GOSSIP, 0, body))
+        await writer.drain()
+    await protocol.write_frame(writer, protocol.BYE)
+
+async def _receive_items(reader):
+    return [body async for ftype, _, body in _frames(reader, b"") if ftype == protocol.GOSSIP]
+
+async def handle_gossip(reader, writer):
+    """Responder side: summary in, summary out, their items in, our items out."""
+    loop = asyncio.get_running_loop()
+    prefix = await _sniff(reader)
+    if not protocol.is_framed(prefix): return
+    frame = await asyncio.wait_for(protocol.read_frame(reader, prefix), CONN_DEADLINE)
+    if not frame or frame[0] != protocol.SUMMARY: return
+    peer = unpack_filters(frame[2])
+    summary, items = await loop.run_in_executor(None, gossip_snapshot)
+    await protocol.write_frame(writer, protocol.SUMMARY, body=summary)
+    received = await loop.run_in_executor(None, accept_gossip, await _receive_items(reader))
+    outgoing = await loop.run_in_executor(None, gossip_outgoing, items, peer)
+    await _send_items(writer, outgoing)
+    print(f"🔁 Gossip with {writer.get_extra_info('peername')}: sent {len(outgoing)}, got {received} new")
+
+async def gossip_with(ip, port):
+    """Initiator side. Returns (sent, new items received)."""
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port, limit=MAX_PACKET_BYTES), CONN_DEADLINE)
+    try:
+        summary, items = await loop.run_in_executor(None, gossip_snapshot)
+        await protocol.write_frame(writer, protocol.SUMMARY, body=summary)
+        frame = await asyncio.wait_for(protocol.read_frame(reader), CONN_DEADLINE)
+        if not frame or frame[0] != protocol.SUMMARY: raise protocol.ProtocolError("no summary from peer")
+        outgoing = await loop.run_in_executor(None, gossip_outgoing, items, unpack_filters(frame[2]))
+        await _send_items(writer, outgoing)
+        received = await loop.run_in_executor(None, accept_gossip, await _receive_items(reader))
+        return len(outgoing), received
+    finally:
+        writer.close()
+
+def gossip():
+    """Finds other mules through their beacons and syncs with each one at most
+    once per GOSSIP_COOLDOWN_S. Of two mules, the one with the lower id dials."""
+    peers = MuleDirectory(UDP_BEACON_PORT).start()
+    last_sync = {}
+    while True:
+        time.sleep(5)
+        for peer in peers.mules("mule_gossip"):
+            pid = peer.get("id")
+            if not pid or pid <= LOG.log_id: continue
+            if time.time() - last_sync.get(pid, 0) < GOSSIP_COOLDOWN_S: continue
+            last_sync[pid] = time.time()
+            try:
+                sent, received = asyncio.run(asyncio.wait_for(gossip_with(peer["ip"], peer["port"]), SESSION_MAX))
+                print(f"🔁 Gossip with mule {pid[:8]}: sent {sent}, got {received} new")
+            except Exception as e:
+                METRICS.error("gossip", e, log=False)
+                print(f"⚠️ Gossip with mule {pid[:8]} failed: {e}")
+
+def gossip_server():
+    asyncio.run(serve(GOSSIP_PORT, handle_gossip))
+
+def uplink_server():
+    asyncio.run(serve(UPLINK_PORT, handle_uplink))
+
+def reply_server():
+    asyncio.run(serve(REPLY_PORT, handle_reply))
 
 if __name__ == "__main__":
     # Clean up old ports
     os.system(f"lsof -ti:{UPLINK_PORT} | xargs kill -9 2>/dev/null")
     os.system(f"lsof -ti:{REPLY_PORT} | xargs kill -9 2>/dev/null")
+    os.system(f"lsof -ti:{GOSSIP_PORT} | xargs kill -9 2>/dev/null")
     
+    LOG = open_log()
+    PARTIALS = PartialStore(PARTIAL_DIR, ttl=PARTIAL_TTL_S)
+    DEDUP = DigestIndex(DEDUP_DIR, recent=DEDUP_RECENT, bloom_capacity=DEDUP_CAPACITY)
+    RECEIPTS = ReceiptBook(RECEIPTS_FILE)
+    INBOX = InboxIndex(INBOX_FILE, delivered=RECEIPTS)
+    print(f"🗄️ Packet log ready: {LOG.backlog()} unsynced packets, {DEDUP.suppressed} duplicates suppressed so far")
+    if METRICS_PORT:
+        try:
+            METRICS.serve(METRICS_PORT, METRICS_HOST)
+            print(f"📈 Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            METRICS.error("metrics", e)
+
     # Start Threads
     threading.Thread(target=cloud_sync, daemon=True).start()
     threading.Thread(target=beacon, daemon=True).start()
     threading.Thread(target=uplink_server, daemon=True).start()
+    if GOSSIP:
+        threading.Thread(target=gossip_server, daemon=True).start()
+        threading.Thread(target=gossip, daemon=True).start()
     
-    print(f"✅ MULE ACTIVE | Uplink: {UPLINK_PORT} | Reply: {REPLY_PORT}")
+    print(f"✅ MULE ACTIVE | Uplink: {UPLINK_PORT} | Reply: {REPLY_PORT}" + (f" | Gossip: {GOSSIP_PORT}" if GOSSIP else ""))
     reply_server()
\ No newline at end of file
@@ -0,0 +1,265 @@
+"""Segmented, append-only packet log: the mule's store-and-forward buffer.
+
+    mule_log/
+        00000000000000000000.seg    records 0 .. n-1
+        00000000000000004213.seg    next segment (rotated past segment_bytes)
+        checkpoint.json             {"log_id": ..., "committed": <first unsynced offset>}
+
+Each record is `!II` (length, crc32) followed by the packet as JSON. Offsets are
+record numbers that keep growing across segments and restarts.
+
+Appends never touch existing bytes, and the sync engine only acknowledges
+offsets (persisted with an atomic rename) after a successful upload. Batches
+may be acknowledged out of order; the committed checkpoint advances over the
+contiguous acknowledged prefix. So:
+  * a packet received while a sync is running is never lost,
+  * a crash before the checkpoint just re-sends the same packets (point IDs are
+    content hashes, see packet_digest(), so the upsert is idempotent),
+  * a torn record at the tail of the last segment is cut off on open.
+Segments that are entirely committed are deleted by compact().
+
+Every unsynced record also has an entry in a small in-memory index, offset ->
+(segment, byte position, summarize(packet)), filled by append() and rebuilt on
+open. The sync engine ranks pending() from it and read()s only the records it
+is about to send.
+"""
+import hashlib
+import itertools
+import json
+import os
+import struct
+import threading
+import uuid
+import zlib
+
+RECORD = struct.Struct("!II")
+SEGMENT_SUFFIX = ".seg"
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def packet_digest(packet):
+    """SHA-256 of the packet's canonical JSON: identical packets, identical digest.
+    Keys starting with "_" (mule-to-mule routing state such as hop counts) are
+    not part of the content and are left out."""
+    content = {k: v for k, v in packet.items() if not k.startswith("_")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(",", ":")).encode()).digest()
+
+
+def point_id(packet):
+    """Qdrant point ID derived from the packet content, so retries are idempotent."""
+    return str(uuid.UUID(bytes=packet_digest(packet)[:16]))
+
+
+def _segment_name(base):
+    return f"{base:020d}{SEGMENT_SUFFIX}"
+
+
+def _write_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class PacketLog:
+    def __init__(self, path, segment_bytes=4 * 1024 * 1024, fsync=True, summarize=None):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.summarize = summarize # packet -> what the index keeps of it (e.g. priority, receive time)
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        state = self._load_checkpoint()
+        self.log_id = state.get("log_id") or uuid.uuid4().hex
+        self.committed = state.get("committed", 0)
+        self._acked = set(state.get("acked", [])) # Synced offsets above the checkpoint
+
+        # Segment bases in offset order; the last one is the active segment
+        self._segments = sorted(int(n[:-len(SEGMENT_SUFFIX)]) for n in os.listdir(path)
+                                if n.endswith(SEGMENT_SUFFIX))
+        if not self._segments:
+            self._segments = [self.committed]
+        self.committed = max(self.committed, self._segments[0])
+        self.next_offset = self._recover_tail()
+        self._active = open(self._segment_path(self._segments[-1]), "ab")
+        # Read hint: (offset, segment base, byte position) of the first unsynced record
+        self._hint = None
+        self._positions = {}
+        self._index = self._build_index() # offset -> (segment base, byte position, summary), unsynced only
+        self._save_checkpoint()
+
+    # --- persistence ---
+    def _segment_path(self, base):
+        return os.path.join(self.path, _segment_name(base))
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.path, CHECKPOINT_FILE)) as f: return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self):
+        _write_atomic(os.path.join(self.path, CHECKPOINT_FILE),
+                      {"log_id": self.log_id, "committed": self.committed, "acked": sorted(self._acked)})
+
+    def _scan(self, base, start_offset=None, start_pos=0, stop_offset=None):
+        """Yields (offset, end_pos, body) for every intact record of a segment."""
+        offset = base if start_offset is None else start_offset
+        with open(self._segment_path(base), "rb") as f:
+            f.seek(start_pos)
+            while stop_offset is None or offset < stop_offset:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size: return
+                length, crc = RECORD.unpack(header)
+                body = f.read(length)
+                if len(body) < length or zlib.crc32(body) != crc: return
+                yield offset, f.tell(), body
+                offset += 1
+
+    def _recover_tail(self):
+        """Counts the records of the active segment and cuts off a torn tail."""
+        base = self._segments[-1]
+        path = self._segment_path(base)
+        if not os.path.exists(path):
+            open(path, "ab").close()
+            return base
+        offset, good_end = base, 0
+        for offset_, end, _ in self._scan(base):
+            offset, good_end = offset_ + 1, end
+        if os.path.getsize(path) != good_end:
+            with open(path, "r+b") as f: f.truncate(good_end)
+            print(f"⚠️ Packet log: truncated torn record in {_segment_name(base)}")
+        return offset
+
+    def _build_index(self):
+        index = {}
+        for i, base in enumerate(self._segments):
+            if i + 1 < len(self._segments) and self._segments[i + 1] <= self.committed: continue
+            pos = 0
+            for offset, end, body in self._scan(base):
+                if offset >= self.committed and offset not in self._acked:
+                    index[offset] = (base, pos, self._summary(body))
+                pos = end
+        return index
+
+    def _summary(self, body):
+        return self.summarize(json.loads(body)) if self.summarize else None
+
+    # --- write path ---
+    def append(self, packet):
+        """Stores one packet and returns its offset. Safe to call from any thread."""
+        body = json.dumps(packet).encode()
+        summary = self.summarize(packet) if self.summarize else None
+        with self._lock:
+            if self._active.tell() >= self.segment_bytes:
+                self._rotate()
+            pos = self._active.tell()
+            self._active.write(RECORD.pack(len(body), zlib.crc32(body)) + body)
+            self._active.flush()
+            if self.fsync: os.fsync(self._active.fileno())
+            offset = self.next_offset
+            self._index[offset] = (self._segments[-1], pos, summary)
+            self.next_offset += 1
+            return offset
+
+    def _rotate(self):
+        self._active.close()
+        self._segments.append(self.next_offset)
+        self._active = open(self._segment_path(self.next_offset), "ab")
+
+    # --- sync path ---
+    def backlog(self):
+        return self.next_offset - self.committed - len(self._acked)
+
+    def pending(self, max_records=None):
+        """[(offset, summary)] of up to `max_records` unsynced records, oldest
+        first, from the in-memory index (no disk reads)."""
+        with self._lock:
+            return [(offset, entry[2]) for offset, entry in itertools.islice(self._index.items(), max_records)]
+
+    def read(self, offsets):
+        """[(offset, packet)] for these unsynced offsets, in the order given.
+        Records that are gone or fail their CRC are left out."""
+        with self._lock:
+            self._active.flush()
+            where = [(o, self._index.get(o)) for o in offsets]
+        handles, records = {}, []
+        try:
+            for offset, entry in where:
+                if entry is None: continue
+                base, pos, _ = entry
+                f = handles.get(base) or handles.setdefault(base, open(self._segment_path(base), "rb"))
+                f.seek(pos)
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size: continue
+                length, crc = RECORD.unpack(header)
+                body = f.read(length)
+                if len(body) == length and zlib.crc32(body) == crc:
+                    records.append((offset, json.loads(body)))
+        finally:
+            for f in handles.values(): f.close()
+        return records
+
+    def read_uncommitted(self, max_records=None):
+        """Returns up to `max_records` [(offset, packet)] that are not synced yet,
+        oldest first."""
+        with self._lock:
+            self._active.flush()
+            start, stop = self.committed, self.next_offset
+            segments = list(self._segments)
+            acked = set(self._acked)
+            hint = self._hint
+
+        records, positions = [], {}
+        for i, base in enumerate(segments):
+            seg_end = segments[i + 1] if i + 1 < len(segments) else stop
+            if seg_end <= start or base >= stop: continue
+            if hint and hint[0] == start and hint[1] == base:
+                scan = self._scan(base, start, hint[2], stop)
+            else:
+                scan = self._scan(base, stop_offset=stop)
+            for offset, end, body in scan:
+                positions[offset] = (base, end)
+                if offset < start or offset in acked: continue
+                records.append((offset, json.loads(body)))
+                if max_records is not None and len(records) >= max_records: break
+            if max_records is not None and len(records) >= max_records: break
+        self._positions = positions
+        return records
+
+    def ack(self, offsets):
+        """Marks `offsets` as synced, in any order, and advances the checkpoint
+        over the contiguous synced prefix."""
+        with self._lock:
+            offsets = [o for o in offsets if self.committed <= o < self.next_offset]
+            self._acked.update(offsets)
+            for o in offsets: self._index.pop(o, None)
+            before = self.committed
+            while self.committed in self._acked:
+                self._acked.remove(self.committed)
+                self.committed += 1
+            if self.committed != before:
+                pos = self._positions.get(self.committed - 1)
+                self._hint = (self.committed, pos[0], pos[1]) if pos else None
+            self._save_checkpoint()
+
+    def commit(self, offset):
+        """Marks every record up to and including `offset` as synced."""
+        self.ack(range(self.committed, offset + 1))
+
+    def compact(self):
+        """Deletes segments whose records are all committed. Returns how many."""
+        with self._lock:
+            removable = [base for base, nxt in zip(self._segments, self._segments[1:])
+                         if nxt <= self.committed]
+            for base in removable:
+                os.remove(self._segment_path(base))
+                self._segments.remove(base)
+            if self._hint and self._hint[1] not in self._segments: self._hint = None
+        return len(removable)
+
+    def close(self):
+        with self._lock: self._active.close()
@@ -0,0 +1,174 @@
+"""Payload encoding for the survivor app: compact media + binary envelopes.
+
+Everything that gets encrypted is first wrapped in a small binary envelope
+
+    magic b"MZ" | version | codec (0 = stored, 1 = zlib) | content type | data
+
+and zlib-compressed when that actually saves bytes. Media bytes go in as they
+are (no base64 inside the ciphertext), so Fernet's token encoding is the only
+base64 layer left on the wire.
+
+Link profiles pick the image codec / size / quality and the voice codec:
+
+    voice: PCM16 WAV -> mono, resampled -> G.711 mu-law (8 bit) or IMA ADPCM (4 bit)
+
+HQ turns voice back into a PCM16 WAV for playback with decode_voice().
+"""
+import io
+import struct
+import wave
+import zlib
+
+import numpy as np
+from PIL import Image
+
+ENVELOPE = struct.Struct("!2sBBB")
+MAGIC = b"MZ"
+VERSION = 1
+STORED, ZLIB = 0, 1
+REPORT, IMAGE, AUDIO = 0, 1, 2
+CONTENT_TYPES = {"report": REPORT, "image": IMAGE, "audio": AUDIO}
+
+VOICE = struct.Struct("!4sBII") # magic, codec, sample rate, samples
+VOICE_MAGIC = b"MADV"
+MULAW, ADPCM = 1, 2
+
+PROFILES = {
+    # name: image codec, longest side (px), quality, grayscale, voice codec, voice rate (Hz)
+    "wifi":      {"image_codec": "JPEG", "max_side": 800,  "quality": 75, "gray": False, "voice": MULAW, "voice_rate": 16000},
+    "bluetooth": {"image_codec": "WEBP", "max_side": 640,  "quality": 60, "gray": False, "voice": MULAW, "voice_rate": 8000},
+    "lora":      {"image_codec": "WEBP", "max_side": 320,  "quality": 35, "gray": True,  "voice": ADPCM, "voice_rate": 8000},
+}
+DEFAULT_PROFILE = "wifi"
+
+
+# --- ENVELOPE ---
+def pack_envelope(kind, data, level=6):
+    """Wraps `data` (bytes) for encryption, compressing it when that helps."""
+    codec, body = STORED, data
+    packed = zlib.compress(data, level)
+    if len(packed) < len(data):
+        codec, body = ZLIB, packed
+    return ENVELOPE.pack(MAGIC, VERSION, codec, CONTENT_TYPES[kind]) + body
+
+
+def open_envelope(blob):
+    """Returns the original bytes. Data without an envelope (legacy JSON or raw
+    media) is returned unchanged."""
+    if len(blob) < ENVELOPE.size or blob[:2] != MAGIC: return blob
+    magic, version, codec, _ = ENVELOPE.unpack(blob[:ENVELOPE.size])
+    if version != VERSION: raise ValueError(f"unsupported envelope version {version}")
+    body = blob[ENVELOPE.size:]
+    return zlib.decompress(body) if codec == ZLIB else body
+
+
+# --- IMAGES ---
+def encode_image(file, profile=DEFAULT_PROFILE):
+    p = PROFILES[profile]
+    img = Image.open(file)
+    img = img.convert("L" if p["gray"] else "RGB")
+    img.thumbnail((p["max_side"], p["max_side"]))
+    buf = io.BytesIO()
+    img.save(buf, format=p["image_codec"], quality=p["quality"], optimize=True)
+    return buf.getvalue()
+
+
+# --- VOICE ---
+def _read_pcm(wav_bytes):
+    """Mono float samples in [-1, 1] and the sample rate of a PCM16 WAV."""
+    with wave.open(io.BytesIO(wav_bytes)) as w:
+        if w.getsampwidth() != 2: raise ValueError("only 16-bit PCM is supported")
+        rate, channels = w.getframerate(), w.getnchannels()
+        pcm = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").astype(np.float32) / 32768
+    if channels > 1: pcm = pcm.reshape(-1, channels).mean(axis=1)
+    return pcm, rate
+
+
+def _resample(x, src, dst):
+    if src == dst or len(x) == 0: return x
+    n = int(round(len(x) * dst / src))
+    return np.interp(np.linspace(0, len(x) - 1, n), np.arange(len(x)), x).astype(np.float32)
+
+
+def _mulaw_encode(x, mu=255):
+    y = np.sign(x) * np.log1p(mu * np.abs(x)) / np.log1p(mu)
+    return np.clip(np.round((y + 1) / 2 * mu), 0, mu).astype(np.uint8).tobytes()
+
+
+def _mulaw_decode(data, mu=255):
+    y = np.frombuffer(data, dtype=np.uint8).astype(np.float32) / mu * 2 - 1
+    return np.sign(y) * np.expm1(np.abs(y) * np.log1p(mu)) / mu
+
+
+_IMA_STEPS = [7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73,
+              80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494,
+              544, 598, 658, 724, 796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499,
+              2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487,
+              12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767]
+_IMA_INDEX = [-1, -1, -1, -1, 2, 4, 6, 8]
+
+
+def _ima_step(code, predicted, index):
+    step = _IMA_STEPS[index]
+    diff = step >> 3
+    if code & 4: diff += step
+    if code & 2: diff += step >> 1
+    if code & 1: diff += step >> 2
+    predicted += -diff if code & 8 else diff
+    predicted = max(-32768, min(32767, predicted))
+    index = max(0, min(88, index + _IMA_INDEX[code & 7]))
+    return predicted, index
+
+
+def _adpcm_encode(x):
+    samples = (np.clip(x, -1, 1) * 32767).astype(np.int32).tolist()
+    out = bytearray((len(samples) + 1) // 2)
+    predicted, index = 0, 0
+    for i, s in enumerate(samples):
+        step = _IMA_STEPS[index]
+        diff = s - predicted
+        code = 8 if diff < 0 else 0
+        diff = abs(diff)
+        if diff >= step: code |= 4; diff -= step
+        if diff >= step >> 1: code |= 2; diff -= step >> 1
+        if diff >= step >> 2: code |= 1
+        predicted, index = _ima_step(code, predicted, index)
+        out[i >> 1] |= code << (4 * (i & 1))
+    return bytes(out)
+
+
+def _adpcm_decode(data, n):
+    out = np.empty(n, dtype=np.float32)
+    predicted, index = 0, 0
+    for i in range(n):
+        code = (data[i >> 1] >> (4 * (i & 1))) & 0x0F
+        predicted, index = _ima_step(code, predicted, index)
+        out[i] = predicted / 32768
+    return out
+
+
+def encode_voice(wav_bytes, profile=DEFAULT_PROFILE):
+    """Compresses a PCM16 WAV recording. Anything else is passed through."""
+    p = PROFILES[profile]
+    try:
+        pcm, rate = _read_pcm(wav_bytes)
+    except (wave.Error, ValueError, EOFError):
+        return wav_bytes
+    x = _resample(pcm, rate, p["voice_rate"])
+    data = _mulaw_encode(x) if p["voice"] == MULAW else _adpcm_encode(x)
+    return VOICE.pack(VOICE_MAGIC, p["voice"], p["voice_rate"], len(x)) + data
+
+
+def decode_voice(data):
+    """Playable PCM16 WAV bytes for anything encode_voice() produced."""
+    if data[:4] != VOICE_MAGIC: return data # Legacy / raw recording
+    _, codec, rate, n = VOICE.unpack(data[:VOICE.size])
+    body = data[VOICE.size:]
+    x = _mulaw_decode(body) if codec == MULAW else _adpcm_decode(body, n)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((np.clip(x, -1, 1) * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
@@ -0,0 +1,63 @@
+"""Urgency levels for the mule's sync queue.
+
+The mule cannot read reports (they are encrypted), so urgency travels in clear
+as a coarse "severity" field next to the ciphertext. The survivor picks it, or
+the app derives it on the device from the report text with classify_text().
+Packets without it (older apps, legacy storage) count as "normal".
+
+schedule() orders a backlog by level, then age. Waiting AGING_S seconds
+promotes a packet by one level, so low-priority reports still get through
+behind a steady stream of critical ones. rank() does the same from the packet
+log's index entries (summary()), without the packets themselves.
+"""
+import re
+import time
+
+LEVELS = {"critical": 0, "high": 1, "normal": 2, "low": 3}
+DEFAULT = "normal"
+
+KEYWORDS = {
+    "critical": ["bleeding", "blood", "unconscious", "not breathing", "can't breathe", "heart attack", "cardiac",
+                 "drowning", "fire", "burning", "crushed", "dying", "seizure", "stroke", "labor", "labour"],
+    "high": ["injured", "injury", "fracture", "broken", "trapped", "stuck", "pregnant", "baby", "infant",
+             "child", "elderly", "diabetic", "insulin", "medicine", "wound", "fever", "rising water"],
+    "low": ["structure damaged", "damaged", "safe", "all ok", "info", "update", "no injuries"],
+}
+_PATTERNS = {level: re.compile(r"\b(" + "|".join(re.escape(w) for w in words) + r")\b", re.I)
+             for level, words in KEYWORDS.items()}
+
+
+def classify_text(text):
+    """Severity level name for a plaintext report (first match, most urgent first)."""
+    for level in ("critical", "high", "low"):
+        if _PATTERNS[level].search(text or ""): return level
+    return DEFAULT
+
+
+def packet_priority(packet):
+    """0 (critical) .. 3 (low) from the packet's clear-text severity."""
+    return LEVELS.get(str(packet.get("severity", DEFAULT)).lower(), LEVELS[DEFAULT])
+
+
+def summary(packet):
+    """(priority, stored at): all rank() needs to know about a packet."""
+    return packet_priority(packet), packet.get("_rx") or packet.get("timestamp")
+
+
+def _key(offset, priority, stored_at, aging_s, now):
+    waited = max(0.0, now - (stored_at or now))
+    return priority - waited / aging_s, offset
+
+
+def schedule(records, aging_s=600, now=None):
+    """Sorts [(offset, packet)] for upload: most urgent first, then oldest.
+    Age counts from when the mule stored the packet ("_rx")."""
+    now = now or time.time()
+    return sorted(records, key=lambda rec: _key(rec[0], *summary(rec[1]), aging_s, now))
+
+
+def rank(entries, aging_s=600, now=None):
+    """Upload order of [(offset, summary(packet) + anything else)]: the offsets, as
+    schedule() would sort them."""
+    now = now or time.time()
+    return [offset for offset, s in sorted(entries, key=lambda e: _key(e[0], e[1][0], e[1][1], aging_s, now))]
@@ -0,0 +1,147 @@
+"""MadadAI wire protocol for the uplink (6008) and reply (6009) ports.
+
+Every message is a length-prefixed frame:
+
+    magic b"MA" | version (1 byte) | type (1 byte) | seq (uint32) | length (uint32) | body
+
+One TCP session can carry any number of frames, so the mule knows exactly where
+each packet ends and ACKs it by `seq` without waiting for a socket timeout.
+Sessions that do not start with the magic bytes are legacy (single JSON line /
+"GET_MAIL:<id>") and are handled by the compatibility path in mule.py.
+
+Large packets can be sent in chunks instead of one PACKET frame:
+
+    survivor: CHUNK_BEGIN seq {"transfer_id": sha256(body), "size": n, "chunks": k}
+    mule:     CHUNK_HAVE  seq {"have": [chunk indexes already stored]}
+    survivor: CHUNK       seq index (uint32) | crc32 (uint32) | data   (only the missing ones)
+    mule:     ACK / NACK  seq once the reassembled body matches transfer_id
+
+The mule keeps the chunks it got across sessions, so an upload cut off by a
+dropped link resumes where it stopped on the next contact.
+
+Mail on the reply port is fetched incrementally and then confirmed:
+
+    survivor: MAIL_REQ seq {"target_id": id, "since": cursor from the last MAIL or null}
+    mule:     MAIL     seq {"orders": [orders that arrived after the cursor], "cursor": {...}}
+    survivor: RECEIPT  seq {"target_id": id, "order_ids": [...]}
+    mule:     ACK      seq   (the orders leave its inbox; the receipt goes on to the cloud)
+
+A MAIL_REQ without "since" gets the plain list of every order held for the
+target, as older apps expect.
+
+Mules that meet gossip on port 6010: each side sends a SUMMARY, then the
+initiator streams the GOSSIP frames the responder lacks and a BYE, and the
+responder answers in kind.
+"""
+import asyncio
+import json
+import struct
+import zlib
+
+MAGIC = b"MA"
+VERSION = 1
+HEADER = struct.Struct("!2sBBII")
+MAX_BODY = 16 * 1024 * 1024
+
+# --- FRAME TYPES ---
+PACKET = 1    # survivor -> mule: one SOS packet (JSON)
+ACK = 2       # mule -> survivor: packet `seq` is stored
+NACK = 3      # mule -> survivor: packet `seq` was rejected (body: reason; b"bad chunk" only refuses one chunk, resend it)
+MAIL_REQ = 4  # survivor -> mule: {"target_id": ...}
+MAIL = 5      # mule -> survivor: JSON list of orders
+BYE = 6       # either side: session is over
+CHUNK_BEGIN = 7  # survivor -> mule: start / resume a chunked packet
+CHUNK_HAVE = 8   # mule -> survivor: chunks of packet `seq` already stored
+CHUNK = 9        # survivor -> mule: one chunk of packet `seq`
+SUMMARY = 10     # mule <-> mule: Bloom filters of what the sender carries (bloom.py)
+GOSSIP = 11      # mule <-> mule: one packet or order the peer lacks
+RECEIPT = 12     # survivor -> mule: {"target_id", "order_ids"} received and stored (answered with ACK)
+
+CHUNK_HEADER = struct.Struct("!II")
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def encode_frame(ftype, seq=0, body=b""):
+    return HEADER.pack(MAGIC, VERSION, ftype, seq, len(body)) + body
+
+
+def parse_header(header):
+    magic, version, ftype, seq, length = HEADER.unpack(header)
+    if magic != MAGIC: raise ProtocolError("bad magic")
+    if version != VERSION: raise ProtocolError(f"unsupported version {version}")
+    if length > MAX_BODY: raise ProtocolError(f"frame too large ({length} bytes)")
+    return ftype, seq, length
+
+
+def is_framed(prefix):
+    return prefix[:len(MAGIC)] == MAGIC
+
+
+def dumps(obj):
+    return json.dumps(obj).encode()
+
+
+def loads(body):
+    return json.loads(body.decode())
+
+
+def pack_chunk(index, data):
+    return CHUNK_HEADER.pack(index, zlib.crc32(data)) + data
+
+
+def unpack_chunk(body):
+    """Returns (index, data); raises ProtocolError if the checksum is wrong."""
+    if len(body) < CHUNK_HEADER.size: raise ProtocolError("truncated chunk")
+    index, crc = CHUNK_HEADER.unpack(body[:CHUNK_HEADER.size])
+    data = body[CHUNK_HEADER.size:]
+    if zlib.crc32(data) != crc: raise ProtocolError(f"chunk {index} checksum mismatch")
+    return index, data
+
+
+# --- BLOCKING SOCKETS (survivor app) ---
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk: return None
+        buf += chunk
+    return bytes(buf)
+
+
+def send_frame(sock, ftype, seq=0, body=b""):
+    sock.sendall(encode_frame(ftype, seq, body))
+
+
+def recv_frame(sock):
+    """Returns (type, seq, body), or None if the peer closed the session."""
+    header = _recv_exact(sock, HEADER.size)
+    if header is None: return None
+    ftype, seq, length = parse_header(header)
+    body = _recv_exact(sock, length) if length else b""
+    if body is None: raise ProtocolError("truncated frame")
+    return ftype, seq, body
+
+
+# --- ASYNCIO STREAMS (mule) ---
+async def read_frame(reader, prefix=b""):
+    """Returns (type, seq, body), or None on a clean EOF. `prefix` is any
+    header bytes already consumed while sniffing the session type."""
+    try:
+        header = prefix + await reader.readexactly(HEADER.size - len(prefix))
+    except asyncio.IncompleteReadError as e:
+        if not e.partial and not prefix: return None
+        raise ProtocolError("truncated frame")
+    ftype, seq, length = parse_header(header)
+    try:
+        body = await reader.readexactly(length) if length else b""
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("truncated frame")
+    return ftype, seq, body
+
+
+async def write_frame(writer, ftype, seq=0, body=b""):
+    writer.write(encode_frame(ftype, seq, body))
+    await writer.drain()
@@ -0,0 +1,162 @@
+"""HQ's columnar record of every report seen: the source for analytics and export.
+
+    hq_reports/
+        part-<unix ms>-<n>.parquet   one file per append, merged by compact()
+
+Rows hold what analytics needs in plain columns (time, location, urgency,
+severity) and the report text Fernet-encrypted with the HQ key, like the intel
+cache, so survivor text never sits on disk in clear. Appends skip point IDs
+already stored, so re-fetching a sector or a full resync adds nothing twice.
+
+Reads go through pyarrow.dataset and only touch the columns they need;
+export_csv() streams record batches to a file, so the full mission history
+is never held in memory at once.
+"""
+import csv
+import glob
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+SCHEMA = pa.schema([
+    ("point_id", pa.string()),
+    ("survivor_id", pa.string()),
+    ("time", pa.float64()),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("score", pa.float32()),
+    ("severity", pa.string()),
+    ("has_media", pa.bool_()),
+    ("text_enc", pa.string()),
+])
+CRITICAL = 0.6
+EXPORT_COLUMNS = ["point_id", "survivor_id", "time", "lat", "lon", "score", "severity", "has_media", "text"]
+
+
+class ReportStore:
+    def __init__(self, path, cipher, compact_after=32):
+        self.path = path
+        self.cipher = cipher
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        self._seq = 0
+        os.makedirs(path, exist_ok=True)
+        self._known = set()
+        if self._parts():
+            self._known.update(self._dataset().to_table(columns=["point_id"]).column("point_id").to_pylist())
+
+    def __len__(self):
+        return len(self._known)
+
+    def __contains__(self, point_id):
+        return str(point_id) in self._known
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, "part-*.parquet")))
+
+    def _dataset(self):
+        return ds.dataset(self._parts(), schema=SCHEMA, format="parquet")
+
+    def _new_part(self):
+        self._seq += 1
+        return os.path.join(self.path, f"part-{int(time.time() * 1000)}-{self._seq:04d}.parquet")
+
+    # --- write path ---
+    def append(self, reports):
+        """Stores reports (dashboard items) not stored yet. Returns how many."""
+        with self._lock:
+            rows = [r for r in reports if str(r["point_id"]) not in self._known]
+            if not rows: return 0
+            table = pa.Table.from_pydict({
+                "point_id": [str(r["point_id"]) for r in rows],
+                "survivor_id": [str(r.get("id")) for r in rows],
+                "time": [float(r.get("time") or 0) for r in rows],
+                "lat": [float(r["lat"]) for r in rows],
+                "lon": [float(r["lon"]) for r in rows],
+                "score": [float(r.get("score") or 0) for r in rows],
+                "severity": [(r.get("raw_payload") or {}).get("severity") for r in rows],
+                "has_media": [bool(r.get("media") or r.get("inline_media")) for r in rows],
+                "text_enc": [self.cipher.encrypt((r.get("text") or "").encode()).decode() for r in rows],
+            }, schema=SCHEMA)
+            self._write_atomic(table, self._new_part())
+            self._known.update(table.column("point_id").to_pylist())
+            if len(self._parts()) > self.compact_after: self._compact()
+            return len(rows)
+
+    def _write_atomic(self, table, path):
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+
+    def _compact(self):
+        """Merges all parts into one, a record batch at a time."""
+        parts = self._parts()
+        target = self._new_part()
+        tmp = target + ".tmp"
+        with pq.ParquetWriter(tmp, SCHEMA, compression="zstd") as writer:
+            for batch in ds.dataset(parts, schema=SCHEMA, format="parquet").to_batches():
+                writer.write_batch(batch)
+        os.replace(tmp, target)
+        for p in parts: os.remove(p)
+
+    # --- analytics ---
+    def timeline(self, window_s=3600, since=None):
+        """Reports per time window: DataFrame indexed by window start with
+        reports, critical and mean / max urgency."""
+        if not self._parts(): return None
+        flt = ds.field("time") >= since if since else None
+        t = self._dataset().to_table(columns=["time", "score"], filter=flt)
+        bucket = pc.multiply(pc.floor(pc.divide(t.column("time"), float(window_s))), float(window_s))
+        t = pa.table({"window": bucket, "score": t.column("score"),
+                      "critical": pc.cast(pc.greater(t.column("score"), CRITICAL), pa.int64())})
+        agg = t.group_by("window").aggregate([("score", "count"), ("critical", "sum"),
+                                              ("score", "mean"), ("score", "max")])
+        df = agg.to_pandas().rename(columns={"score_count": "reports", "critical_sum": "critical",
+                                             "score_mean": "mean_urgency", "score_max": "max_urgency"})
+        df["window"] = df["window"].astype("datetime64[s]")
+        return df.set_index("window").sort_index()
+
+    def level_counts(self, since=None):
+        """{"Low", "Medium", "Critical"} -> report count."""
+        if not self._parts(): return {}
+        flt = ds.field("time") >= since if since else None
+        score = self._dataset().to_table(columns=["score"], filter=flt).column("score")
+        return {"Low": pc.sum(pc.less_equal(score, 0.3)).as_py() or 0,
+                "Medium": pc.sum(pc.and_(pc.greater(score, 0.3), pc.less_equal(score, CRITICAL))).as_py() or 0,
+                "Critical": pc.sum(pc.greater(score, CRITICAL)).as_py() or 0}
+
+    def latest(self, n=500):
+        """The `n` most recent reports (no text) as a DataFrame."""
+        if not self._parts(): return None
+        t = self._dataset().to_table(columns=["survivor_id", "time", "score", "severity", "lat", "lon"])
+        t = t.take(pc.select_k_unstable(t, k=min(n, t.num_rows), sort_keys=[("time", "descending")]))
+        df = t.to_pandas()
+        df["time"] = df["time"].astype("datetime64[s]")
+        return df
+
+    # --- export ---
+    def export_csv(self, out_path, batch_size=10_000):
+        """Writes the full mission log (text decrypted) to `out_path` one record
+        batch at a time. Returns the number of rows."""
+        rows = 0
+        tmp = out_path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(EXPORT_COLUMNS)
+            if self._parts():
+                for batch in self._dataset().to_batches(batch_size=batch_size):
+                    cols = batch.to_pydict()
+                    texts = [self._decrypt(t) for t in cols["text_enc"]]
+                    w.writerows(zip(*(cols[c] for c in EXPORT_COLUMNS[:-1]), texts))
+                    rows += batch.num_rows
+        os.replace(tmp, out_path)
+        return rows
+
+    def _decrypt(self, token):
+        try: return self.cipher.decrypt(token.encode()).decode()
+        except Exception: return "" # Written with another key
@@ -0,0 +1,152 @@
+"""Urgency scoring for HQ: sentence embeddings + best match against critical concepts.
+
+A report's urgency is its highest cosine similarity to any CRITICAL_CONCEPTS
+phrase, all embedded with all-MiniLM-L6-v2 (384-d, the collection's vector
+size). Backends compute the same embedding:
+
+    fastembed-q8   int8-quantized ONNX export, onnxruntime on CPU (default)
+    fastembed      full-precision ONNX export of the same weights
+    torch          sentence-transformers + PyTorch (the original path)
+
+Quantization only nudges the scores, so vectors from every backend share the
+Qdrant collection and the intel cache; `python -m benchmarks.scoring` checks
+each backend's urgency against the torch path within DEFAULT_TOLERANCE.
+
+The model loads in a background thread (ScoringEngine.start()), so the
+dashboard renders while it warms up; callers check `ready` and leave reports
+pending until it is.
+"""
+import threading
+import time
+
+import numpy as np
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+DIM = 384
+CRITICAL_CONCEPTS = ["Medical Emergency", "Trapped Person", "Fire Hazard", "Severe Bleeding", "Building Collapse"]
+DEFAULT_BACKEND = "fastembed-q8"
+DEFAULT_TOLERANCE = 0.03 # Max urgency difference from the torch path
+
+Q8_MODEL = "Xenova/all-MiniLM-L6-v2" # Hub repo with onnx/model_quantized.onnx (dynamic int8)
+_registered = False
+
+
+class FastEmbedBackend:
+    def __init__(self, quantized=True, threads=None, cache_dir=None):
+        from fastembed import TextEmbedding
+        name = self._register_q8() if quantized else f"sentence-transformers/{EMBED_MODEL}"
+        self.model = TextEmbedding(name, cache_dir=cache_dir, threads=threads, providers=["CPUExecutionProvider"])
+
+    @staticmethod
+    def _register_q8():
+        global _registered
+        from fastembed import TextEmbedding
+        from fastembed.common.model_description import ModelSource, PoolingType
+        if not _registered:
+            try:
+                TextEmbedding.add_custom_model(model=Q8_MODEL, pooling=PoolingType.MEAN, normalization=True,
+                                               sources=ModelSource(hf=Q8_MODEL), dim=DIM,
+                                               model_file="onnx/model_quantized.onnx")
+            except ValueError:
+                pass # Already known to fastembed
+            _registered = True
+        return Q8_MODEL
+
+    def encode(self, texts, batch_size):
+        return np.stack(list(self.model.embed(texts, batch_size=batch_size)))
+
+
+class TorchBackend:
+    def __init__(self, threads=None, cache_dir=None):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads: torch.set_num_threads(threads)
+        self.model = SentenceTransformer(EMBED_MODEL, cache_folder=cache_dir, device="cpu")
+
+    def encode(self, texts, batch_size):
+        return self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+
+
+BACKENDS = {
+    "fastembed-q8": lambda **kw: FastEmbedBackend(quantized=True, **kw),
+    "fastembed": lambda **kw: FastEmbedBackend(quantized=False, **kw),
+    "torch": TorchBackend,
+}
+
+
+class ScoringEngine:
+    def __init__(self, backend=DEFAULT_BACKEND, concepts=CRITICAL_CONCEPTS, batch_size=64, threads=None, cache_dir=None):
+        if backend not in BACKENDS: raise ValueError(f"unknown scoring backend {backend!r} (one of {', '.join(BACKENDS)})")
+        self.backend_name = backend
+        self.concepts = list(concepts)
+        self.batch_size = batch_size
+        self.threads = threads
+        self.cache_dir = cache_dir
+        self.error = None
+        self.load_seconds = None
+        self._backend = None
+        self.concept_vectors = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --- loading ---
+    def start(self):
+        """Loads the model in a background thread (once). Returns self."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, daemon=True, name="scoring-load")
+                self._thread.start()
+        return self
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            self._backend = BACKENDS[self.backend_name](threads=self.threads, cache_dir=self.cache_dir)
+            self.concept_vectors = self._encode(self.concepts)
+            self.load_seconds = time.perf_counter() - t0
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        """Blocks until the model is loaded (starting it if needed). True if usable."""
+        self.start()
+        self._ready.wait(timeout)
+        return self.ready
+
+    def _require(self):
+        if not self.wait():
+            raise RuntimeError(f"scoring model failed to load: {self.error}")
+
+    # --- scoring ---
+    def _encode(self, texts):
+        vecs = np.asarray(self._backend.encode(list(texts), self.batch_size), dtype=np.float32)
+        return vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+    def embed(self, texts):
+        """(n, DIM) float32 unit vectors, encoded `batch_size` texts at a time."""
+        self._require()
+        if not len(texts): return np.zeros((0, DIM), dtype=np.float32)
+        return self._encode(texts)
+
+    def urgency(self, embeddings):
+        """Best cosine similarity of each embedding to any critical concept."""
+        self._require()
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, DIM)
+        return (embeddings @ self.concept_vectors.T).max(axis=1)
+
+    def score(self, texts):
+        """(embeddings, urgency scores) for a batch of report texts."""
+        emb = self.embed(texts)
+        return emb, self.urgency(emb)
+
+    def status(self):
+        if self.error is not None: return f"failed ({self.error})"
+        if not self._ready.is_set(): return "loading"
+        return f"ready in {self.load_seconds:.1f}s"